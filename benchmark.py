@@ -0,0 +1,438 @@
+#!/usr/bin/env python
+
+"""
+measure this project: import cost, and the throughput and peak memory of each stage on synthetic trees
+
+Import report: each module is imported in a fresh interpreter, so earlier imports do not hide the cost of later ones.
+The first row is an interpreter that imports nothing, the baseline every run pays.
+
+Suite: for each size in --sizes a synthetic tree is generated from a seed (the same options give the same tree),
+scanned, changed (edits, renames, folder moves, deletes, additions), scanned again, and then diffed,
+searched for duplicates and rolled. Every stage runs in a fresh interpreter so its peak RSS is its own.
+Trees above --max_tree_files are not written to disk; their snapshots are generated directly
+from the same model, so the diff, duplicate and retention stages can be measured up to 10^7 files
+without 10^7 files on disk. The results are written as JSON to --output, to be compared across commits.
+
+standard use:
+python3 benchmark.py
+
+python3 benchmark.py --repeat="10" --modules="change_tracker,diff_changes,pandas"
+
+python3 benchmark.py --suite --sizes="1000,10000,100000" --output="bench.json"
+
+python3 benchmark.py --suite --sizes="1000000,10000000" --max_tree_files="0" --output="bench_large.json"
+
+python3 benchmark.py --suite --sizes="10000" --depth="6" --file_size="65536" --size_distribution="lognormal" --duplicate_ratio="0.2" --edit="0.05" --rename="0.02" --delete="0.01" --add="0.01" --folder_moves="3" --seed="7"
+
+*********************
+# https://docs.python.org/3/using/cmdline.html#cmdoption-X
+a per-module breakdown of one import:
+python3 -X importtime -c "import diff_changes" 2> importtime.log
+
+*********************
+# https://docs.python.org/3/library/doctest.html
+python3 -m doctest benchmark.py
+
+"""
+
+import datetime
+import hashlib # synthetic file content
+import json
+import os
+import platform
+import random # the tree model; seeded, so runs are reproducible
+import shutil # remove the synthetic trees
+import subprocess # a fresh interpreter per measurement
+import sys
+import tempfile
+import time
+
+# the modules of this repo, then pandas for comparison
+DEFAULT_MODULES = ['snapshot_io', 'change_tracker', 'diff_changes', 'find_dupes', 'rolling_logs', 'track',
+                   'watcher', 'pandas']
+
+SIZE_DISTRIBUTIONS = ['fixed', 'uniform', 'lognormal']
+
+# stages measured by the suite, in the order they run
+SUITE_STAGES = ['scan', 'incremental scan', 'diff_records', 'streaming_diff', 'diff_dataframes',
+                'duplicate_groups', 'find_duplicate_files', 'identify_logs_to_delete']
+
+# run inside the fresh interpreter; prints a JSON dict
+MEASURE_IMPORT = """
+import json, resource, sys, time
+start = time.perf_counter()
+if {module_name!r}:
+    __import__({module_name!r})
+elapsed = time.perf_counter() - start
+# ru_maxrss is in KiB on Linux, and the peak is the resident size right after the import
+print(json.dumps({{'seconds': elapsed,
+                  'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                  'pandas': 'pandas' in sys.modules,
+                  'numpy': 'numpy' in sys.modules}}))
+"""
+
+# run inside the fresh interpreter; prints the JSON dict returned by run_stage
+MEASURE_STAGE = """
+import json, resource, sys
+import benchmark
+result = benchmark.run_stage({stage!r}, {work_dir!r}, {tree_dir!r}, {number_of_files!r})
+result['max_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024
+print(json.dumps(result))
+"""
+
+def parse_args(list_of_args):
+    """
+    >>> parse_args(['name of py script', '--repeat="3"', '--modules="snapshot_io,pandas"'])[1:3]
+    (3, ['snapshot_io', 'pandas'])
+    >>> parse_args(['name of py script', '--suite', '--sizes="1000,10000"', '--edit="0.1"'])[3]['sizes']
+    [1000, 10000]
+    """
+    prnt_debug = False
+    repeat = '5'
+    list_of_modules = DEFAULT_MODULES
+    suite_options = {'suite': False, 'sizes': '1000,10000', 'max_tree_files': '100000', 'output': 'benchmark.json',
+                     'depth': '4', 'files_per_dir': '100', 'file_size': '4096', 'size_distribution': 'lognormal',
+                     'duplicate_ratio': '0.1', 'edit': '0.02', 'rename': '0.01', 'delete': '0.01', 'add': '0.01',
+                     'folder_moves': '2', 'seed': '1'}
+    for arg in list_of_args:
+        if '--debug' in arg:
+            prnt_debug = True
+        elif '--repeat' in arg:
+            repeat = arg.replace('--repeat=', '').strip('"')
+        elif '--modules' in arg:
+            list_of_modules = arg.replace('--modules=', '').strip('"').split(',')
+        elif '--suite' in arg:
+            suite_options['suite'] = True
+        else:
+            for option_name in suite_options:
+                if arg.startswith('--'+option_name+'='):
+                    suite_options[option_name] = arg.replace('--'+option_name+'=', '').strip('"')
+    try:
+        repeat = int(repeat)
+    except ValueError:
+        raise Exception('ERROR: repeat must be an integer:', repeat)
+    if repeat < 1:
+        raise Exception('ERROR: repeat must be greater than 0')
+    try:
+        suite_options['sizes'] = [int(size) for size in suite_options['sizes'].split(',')]
+        for option_name in ['max_tree_files', 'depth', 'files_per_dir', 'file_size', 'folder_moves', 'seed']:
+            suite_options[option_name] = int(suite_options[option_name])
+        for option_name in ['duplicate_ratio', 'edit', 'rename', 'delete', 'add']:
+            suite_options[option_name] = float(suite_options[option_name])
+    except ValueError as err:
+        raise Exception('ERROR: benchmark options must be numbers:', str(err))
+    if suite_options['depth'] < 1 or suite_options['files_per_dir'] < 1:
+        raise Exception('ERROR: depth and files_per_dir must be greater than 0')
+    if suite_options['size_distribution'] not in SIZE_DISTRIBUTIONS:
+        raise Exception('ERROR: size_distribution must be one of', SIZE_DISTRIBUTIONS)
+    return prnt_debug, repeat, list_of_modules, suite_options
+
+def measure_import(prnt_debug, module_name, repeat):
+    """
+    the fastest of repeat imports of module_name ('' imports nothing) in a fresh interpreter;
+    returns the dict printed by MEASURE_IMPORT
+    """
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    list_of_results = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', MEASURE_IMPORT.format(module_name=module_name)],
+                                cwd=repo_dir, capture_output=True, text=True)
+        if output.returncode != 0:
+            if prnt_debug: print(output.stderr)
+            return None
+        list_of_results.append(json.loads(output.stdout))
+    # the fastest run is the one least disturbed by the rest of the machine
+    return min(list_of_results, key=lambda result: result['seconds'])
+
+def import_report(prnt_debug, list_of_modules, repeat):
+    """
+    one line per module: import time and resident memory, both also relative to the bare interpreter
+    """
+    baseline = measure_import(prnt_debug, '', repeat)
+    list_of_lines = ['%-16s %10s %10s %12s %12s  %s' % ('module', 'import ms', '+ms', 'max RSS MB', '+MB', 'loads')]
+    for module_name in [''] + list_of_modules:
+        result = measure_import(prnt_debug, module_name, repeat)
+        if result is None:
+            list_of_lines.append('%-16s %10s' % (module_name, 'not importable'))
+            continue
+        list_of_loaded = [name for name in ['pandas', 'numpy'] if result[name]]
+        list_of_lines.append('%-16s %10.1f %10.1f %12.1f %12.1f  %s' % (
+            module_name or '(interpreter)', result['seconds']*1000, (result['seconds'] - baseline['seconds'])*1000,
+            result['max_rss_kb']/1024, (result['max_rss_kb'] - baseline['max_rss_kb'])/1024,
+            ', '.join(list_of_loaded)))
+    return '\n'.join(list_of_lines)
+
+def file_size_of(rng, suite_options):
+    """
+    one file size drawn from suite_options['size_distribution'] around suite_options['file_size']
+    """
+    mean_size = suite_options['file_size']
+    if suite_options['size_distribution'] == 'fixed':
+        return mean_size
+    if suite_options['size_distribution'] == 'uniform':
+        return rng.randint(0, 2*mean_size)
+    # most files small, a few large; the median is mean_size/e^(sigma^2/2) with sigma = 1.5
+    return int(rng.lognormvariate(0, 1.5)*mean_size/3.08)
+
+def tree_manifest(number_of_files, suite_options):
+    """
+    the synthetic tree as a list of [relative path, size, content id]; files with the same content id are duplicates.
+    Files fill directories of files_per_dir, and the directories form a tree depth levels deep.
+
+    >>> tree_manifest(3, {'depth': 2, 'files_per_dir': 2, 'file_size': 10, 'size_distribution': 'fixed', 'duplicate_ratio': 0, 'seed': 1})
+    [['d0_0/d1_0/f0', 10, 0], ['d0_0/d1_0/f1', 10, 1], ['d0_0/d1_1/f2', 10, 2]]
+    """
+    rng = random.Random(suite_options['seed'])
+    depth = suite_options['depth']
+    files_per_dir = suite_options['files_per_dir']
+    number_of_dirs = max(1, -(-number_of_files//files_per_dir))
+    fanout = 2
+    while fanout**depth < number_of_dirs:
+        fanout += 1
+    list_of_entries = []
+    for file_indx in range(number_of_files):
+        dir_indx = file_indx//files_per_dir
+        list_of_parts = []
+        for level in range(depth):
+            list_of_parts.append('d'+str(level)+'_'+str((dir_indx//fanout**(depth - 1 - level)) % fanout))
+        if file_indx > 0 and rng.random() < suite_options['duplicate_ratio']:
+            _, size, content_id = list_of_entries[rng.randrange(file_indx)]
+        else:
+            size = file_size_of(rng, suite_options)
+            content_id = file_indx
+        list_of_entries.append(['/'.join(list_of_parts)+'/f'+str(file_indx), size, content_id])
+    return list_of_entries
+
+def churn_manifest(list_of_entries, suite_options):
+    """
+    apply edits, renames, deletes, additions and folder moves to a copy of the manifest;
+    returns (new manifest, list of operations) where an operation is
+    ('edit', path), ('rename', old path, new path), ('delete', path), ('add', path) or ('move', old dir, new dir)
+    """
+    rng = random.Random(suite_options['seed'] + 1)
+    next_content_id = max([entry[2] for entry in list_of_entries] + [0]) + 1
+    list_of_operations = []
+    list_of_new = []
+    for path, size, content_id in list_of_entries:
+        draw = rng.random()
+        if draw < suite_options['delete']:
+            list_of_operations.append(('delete', path))
+            continue
+        draw -= suite_options['delete']
+        if draw < suite_options['edit']:
+            list_of_operations.append(('edit', path))
+            list_of_new.append([path, size, next_content_id])
+            next_content_id += 1
+            continue
+        draw -= suite_options['edit']
+        if draw < suite_options['rename']:
+            list_of_operations.append(('rename', path, path+'.renamed'))
+            list_of_new.append([path+'.renamed', size, content_id])
+            continue
+        list_of_new.append([path, size, content_id])
+    for add_indx in range(int(len(list_of_entries)*suite_options['add'])):
+        path = os.path.dirname(rng.choice(list_of_entries)[0])+'/added'+str(add_indx)
+        list_of_operations.append(('add', path))
+        list_of_new.append([path, file_size_of(rng, suite_options), next_content_id])
+        next_content_id += 1
+    list_of_dirs = sorted(set(os.path.dirname(entry[0]) for entry in list_of_new))
+    for move_indx in range(min(suite_options['folder_moves'], len(list_of_dirs))):
+        old_dir = list_of_dirs[rng.randrange(len(list_of_dirs))]
+        new_dir = old_dir+'_moved'+str(move_indx)
+        list_of_operations.append(('move', old_dir, new_dir))
+        for entry in list_of_new:
+            if entry[0].startswith(old_dir+'/'):
+                entry[0] = new_dir+entry[0][len(old_dir):]
+        list_of_dirs = sorted(set(os.path.dirname(entry[0]) for entry in list_of_new))
+    return list_of_new, list_of_operations
+
+def file_content(content_id, size):
+    """
+    deterministic bytes for a content id; the same id and size always give the same bytes
+    """
+    block = hashlib.sha256(str(content_id).encode()).digest()*128 # 4 KiB
+    return (block*(size//len(block) + 1))[:size]
+
+def write_tree(prnt_debug, tree_dir, list_of_entries):
+    for path, size, content_id in list_of_entries:
+        full_path = tree_dir+'/'+path
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'wb') as fil:
+            fil.write(file_content(content_id, size))
+    if prnt_debug: print('wrote', len(list_of_entries), 'files under', tree_dir)
+
+def apply_operations(prnt_debug, tree_dir, list_of_new, list_of_operations):
+    """
+    make the tree on disk match the churned manifest
+    """
+    dict_of_new = {path: (size, content_id) for path, size, content_id in list_of_new}
+    for operation in list_of_operations:
+        if operation[0] == 'delete':
+            os.remove(tree_dir+'/'+operation[1])
+        elif operation[0] == 'rename':
+            os.rename(tree_dir+'/'+operation[1], tree_dir+'/'+operation[2])
+        elif operation[0] == 'move':
+            os.rename(tree_dir+'/'+operation[1], tree_dir+'/'+operation[2])
+    # edits and additions are written last, at their final path
+    for path, (size, content_id) in dict_of_new.items():
+        full_path = tree_dir+'/'+path
+        if not os.path.exists(full_path) or os.path.getsize(full_path) != size:
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, 'wb') as fil:
+                fil.write(file_content(content_id, size))
+    for operation in list_of_operations:
+        if operation[0] == 'edit' and operation[1] in dict_of_new:
+            size, content_id = dict_of_new[operation[1]]
+            with open(tree_dir+'/'+operation[1], 'wb') as fil:
+                fil.write(file_content(content_id, size))
+    if prnt_debug: print('applied', len(list_of_operations), 'operations under', tree_dir)
+
+def manifest_records(tree_dir, list_of_entries):
+    """
+    snapshot records for a manifest without writing the tree; the digest stands in for the content hash
+    """
+    for inode, (path, size, content_id) in enumerate(sorted(list_of_entries)):
+        yield {'full path': tree_dir+'/'+path,
+               'hash of file': hashlib.md5((str(content_id)+':'+str(size)).encode()).hexdigest(),
+               'size': size, 'mtime_ns': content_id, 'inode': inode, 'device': 0, 'runs since hash': 0}
+
+def run_stage(stage, work_dir, tree_dir, number_of_files):
+    """
+    one stage of the suite, timed; run inside a fresh interpreter by measure_stage.
+    reads work_dir/previous.json and work_dir/current.json, and writes them in the scan stages
+    returns a dict with 'seconds' and 'items' (files, or catalog entries for identify_logs_to_delete)
+    """
+    import change_tracker as ct
+    import diff_changes as dc
+    import find_dupes as fd
+    import rolling_logs as rl
+    import snapshot_io
+    previous_file = work_dir+'/previous.json'
+    current_file = work_dir+'/current.json'
+    scan_options = {'hash': 'md5', 'digest_size': 0, 'incremental': True}
+    result = {'items': number_of_files}
+    if stage in ['diff_dataframes', 'find_duplicate_files']:
+        import pandas # imported before the clock starts; benchmark.py's import report covers its cost
+    start = time.perf_counter()
+    if stage in ['scan', 'incremental scan']:
+        previous_snapshot = {}
+        if stage == 'incremental scan':
+            previous_snapshot = {file_dict['full path']: file_dict
+                                 for file_dict in snapshot_io.iter_snapshot_records(False, previous_file)}
+        list_of_dicts = ct.hash_list_of_files(False, tree_dir, scan_options, previous_snapshot)
+        snapshot_io.write_snapshot(False, list_of_dicts, current_file if stage == 'incremental scan' else previous_file,
+                                   'json', ct.snapshot_header(tree_dir, scan_options))
+        result['items'] = len(list_of_dicts)
+        result['bytes'] = sum(file_dict['size'] for file_dict in list_of_dicts)
+    elif stage == 'diff_records':
+        list_of_columns = dc.comparison_columns('hash')
+        list_of_events = dc.diff_records(False,
+                                         dc.comparison_records(snapshot_io.iter_snapshot_records(False, previous_file, list_of_columns), 'hash'),
+                                         dc.comparison_records(snapshot_io.iter_snapshot_records(False, current_file, list_of_columns), 'hash'))
+        result['events'] = len(list_of_events)
+    elif stage == 'streaming_diff':
+        result['events'] = sum(1 for _ in dc.streaming_diff(False, previous_file, current_file, 64))
+    elif stage == 'diff_dataframes':
+        # each DataFrame stage timed on its own
+        df_previous = dc.load_comparison_dataframe(False, previous_file)
+        df_current = dc.load_comparison_dataframe(False, current_file)
+        result['load seconds'] = time.perf_counter() - start
+        stage_start = time.perf_counter()
+        df_previous, df_current = dc.df_comparison_unchanged_files(False, df_previous, df_current)
+        result['unchanged seconds'] = time.perf_counter() - stage_start
+        stage_start = time.perf_counter()
+        df_previous, df_current, df_changed = dc.df_comparison_changed_files(False, df_previous, df_current)
+        result['changed seconds'] = time.perf_counter() - stage_start
+        stage_start = time.perf_counter()
+        df_previous, df_current, df_moved = dc.df_comparison_moved_files(False, df_previous, df_current)
+        result['moved seconds'] = time.perf_counter() - stage_start
+        stage_start = time.perf_counter()
+        df_added_deleted = dc.df_comparison_new_and_deleted_files(False, df_previous, df_current)
+        result['added and deleted seconds'] = time.perf_counter() - stage_start
+        result['events'] = len(df_changed) + len(df_moved) + len(df_added_deleted)
+    elif stage == 'duplicate_groups':
+        result['groups'] = len(fd.duplicate_groups(snapshot_io.iter_snapshot_records(False, current_file,
+                                                                                     ['full path', 'hash of file'])))
+    elif stage == 'find_duplicate_files':
+        df = dc.load_comparison_dataframe(False, current_file)
+        fd.find_duplicate_files(False, df)
+    elif stage == 'identify_logs_to_delete':
+        # an hourly catalog with one entry per file count, rolled with every tier
+        first = datetime.datetime(2000, 1, 1)
+        list_of_entries = [{'file': 'logs_'+str(indx), 'created': (first + datetime.timedelta(hours=indx)).isoformat()}
+                           for indx in range(number_of_files)]
+        start = time.perf_counter()
+        rl.identify_logs_to_delete(False, list_of_entries, 3, {'keep_daily': 7, 'keep_weekly': 13, 'keep_monthly': 12})
+    else:
+        raise Exception('ERROR: unknown stage:', stage)
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+def measure_stage(prnt_debug, stage, work_dir, tree_dir, number_of_files):
+    """
+    run_stage in a fresh interpreter; None when the stage could not run (e.g. pandas is missing)
+    """
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    output = subprocess.run([sys.executable, '-c', MEASURE_STAGE.format(stage=stage, work_dir=work_dir, tree_dir=tree_dir,
+                                                                      number_of_files=number_of_files)],
+                            cwd=repo_dir, capture_output=True, text=True)
+    if output.returncode != 0:
+        print('WARNING: stage', stage, 'failed:', output.stderr.strip().splitlines()[-1:])
+        return None
+    result = json.loads(output.stdout)
+    result['files per second'] = result['items']/max(result['seconds'], 1e-9)
+    if 'bytes' in result:
+        result['MB per second'] = result['bytes']/1e6/max(result['seconds'], 1e-9)
+    if prnt_debug: print(stage, result)
+    return result
+
+def run_suite(prnt_debug, suite_options):
+    """
+    every stage at every size; returns the JSON-ready results
+    """
+    import snapshot_io
+    dict_of_results = {'created': datetime.datetime.now().isoformat(timespec='seconds'),
+                       'python': platform.python_version(), 'platform': platform.platform(),
+                       'options': {key: value for key, value in suite_options.items() if key != 'output'},
+                       'results': []}
+    for number_of_files in suite_options['sizes']:
+        work_dir = tempfile.mkdtemp(prefix='benchmark_')
+        try:
+            tree_dir = work_dir+'/tree'
+            list_of_entries = tree_manifest(number_of_files, suite_options)
+            list_of_new, list_of_operations = churn_manifest(list_of_entries, suite_options)
+            list_of_stages = list(SUITE_STAGES)
+            if number_of_files <= suite_options['max_tree_files']:
+                write_tree(prnt_debug, tree_dir, list_of_entries)
+            else:
+                # too large to write out: the snapshots come straight from the model
+                list_of_stages = [stage for stage in list_of_stages if stage not in ['scan', 'incremental scan']]
+                snapshot_io.write_snapshot(prnt_debug, manifest_records(tree_dir, list_of_entries), work_dir+'/previous.json')
+                snapshot_io.write_snapshot(prnt_debug, manifest_records(tree_dir, list_of_new), work_dir+'/current.json')
+            list_of_entries = None
+            for stage in list_of_stages:
+                if stage == 'incremental scan':
+                    apply_operations(prnt_debug, tree_dir, list_of_new, list_of_operations)
+                result = measure_stage(prnt_debug, stage, work_dir, tree_dir, number_of_files)
+                if result is None:
+                    continue
+                result['stage'] = stage
+                result['files'] = number_of_files
+                dict_of_results['results'].append(result)
+                print('%10d files  %-24s %9.3f s %14.0f files/s %10.1f MB RSS' % (
+                    number_of_files, stage, result['seconds'], result['files per second'], result['max_rss_mb']))
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return dict_of_results
+
+
+if __name__ == '__main__':
+
+    prnt_debug, repeat, list_of_modules, suite_options = parse_args(sys.argv)
+    if not suite_options['suite']:
+        print(import_report(prnt_debug, list_of_modules, repeat))
+        sys.exit(0)
+    dict_of_results = run_suite(prnt_debug, suite_options)
+    with open(suite_options['output'], 'w') as fil:
+        json.dump(dict_of_results, fil, indent=1)
+    print('wrote', suite_options['output'])
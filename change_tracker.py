@@ -9,6 +9,67 @@ python3 change_tracker.py --search_path="/home/jovyan/tmp" --write_path="."
 
 python3 change_tracker.py --search_path="/home/jovyan/tmp" --write_path="." --debug
 
+incremental use (reuse the hash from the previous snapshot when size, mtime, inode and device are unchanged):
+python3 change_tracker.py --search_path="/home/jovyan/tmp" --write_path="." --incremental
+
+python3 change_tracker.py --search_path="/home/jovyan/tmp" --write_path="." --incremental --paranoid_every="4"
+
+files are hashed in fixed-size chunks; the chunk size and the size above which files are memory mapped are tunable:
+python3 change_tracker.py --search_path="/home/jovyan/tmp" --write_path="." --block_size="4194304" --mmap_threshold="1073741824"
+
+hash with several workers; threads suit I/O bound storage, processes suit CPU bound hashing:
+python3 change_tracker.py --search_path="/home/jovyan/tmp" --write_path="." --workers="8"
+
+python3 change_tracker.py --search_path="/home/jovyan/tmp" --write_path="." --workers="8" --pool="process"
+
+skip whole subtrees; patterns are globs on the name or relative path, or regexes prefixed with "re:":
+python3 change_tracker.py --search_path="/home/jovyan/tmp" --write_path="." --exclude=".git" --exclude="node_modules" --exclude="re:(^|/)\.cache$"
+
+write a metrics summary (phase times, walk/stat/open/read/hash split, slowest directories, largest files),
+print progress every 30 seconds, or profile the run (see metrics.py):
+python3 change_tracker.py --search_path="/home/jovyan/tmp" --write_path="." --metrics="scan_metrics.json" --progress="30" --profile="scan.prof"
+
+split one tree over several scanners: each scans shard i of n into shards/ (a partial snapshot named by shard,
+so a failed shard can simply be rerun), then merge_shards.py joins the shards into one snapshot.
+--shard_by="top" splits by top-level entry of the search path (whole subtrees are skipped);
+--shard_by="hash" splits file by file (every scanner still walks the tree, but reads only its share):
+python3 change_tracker.py --search_path="/home/jovyan/tmp" --write_path="." --shard="0/4" --shard_by="top"
+
+python3 merge_shards.py --write_path="." --shard_count="4"
+
+on a live volume, read in inode or physical extent order, cap the read bandwidth and IOPS,
+and keep the scan from evicting the page cache (see io_scheduler.py):
+python3 change_tracker.py --search_path="/home/jovyan/tmp" --write_path="." --read_order="extent" --max_bytes_per_second="52428800" --max_iops="200" --drop_cache
+
+tiered verification for cold data (needs --incremental): every run checks the stat metadata and a hash of
+64 KB at the head, middle and tail of each file, and a rolling 1/7 of the tree is fully rehashed,
+so every byte is verified once every 7 runs; each record keeps when it was last fully verified:
+python3 change_tracker.py --search_path="/home/jovyan/tmp" --write_path="." --incremental --verify_every="7" --sample_size="65536"
+
+add the new snapshot to the history index, for fast per-path and per-digest queries (see history_index.py):
+python3 change_tracker.py --search_path="/home/jovyan/tmp" --write_path="." --index
+
+write the snapshot as an indexed SQLite database instead of JSON (see snapshot_io.py):
+python3 change_tracker.py --search_path="/home/jovyan/tmp" --write_path="." --format="sqlite"
+
+for trees with millions of files, hold the records as columns with a directory table instead of one dict per file,
+and write them as a compressed pathtable snapshot (see path_table.py):
+python3 change_tracker.py --search_path="/home/jovyan/tmp" --write_path="." --incremental --compact --format="pathtable"
+
+choose the hash algorithm; it is recorded in the snapshot header.
+crc32 is very cheap but only suitable for change detection, not for move or duplicate detection:
+python3 change_tracker.py --search_path="/home/jovyan/tmp" --write_path="." --hash="blake2b" --digest_size="16"
+
+for very large trees, checkpoint the scan to a journal every 60 seconds, so an interrupted scan
+(crash, SIGTERM, end of a maintenance window) can be resumed without rehashing what was done (see scan_journal.py):
+python3 change_tracker.py --search_path="/home/jovyan/tmp" --write_path="." --checkpoint_every="60"
+
+python3 change_tracker.py --search_path="/home/jovyan/tmp" --write_path="." --checkpoint_every="60" --resume
+
+keep a digest per 16 MB block for files of 1 GB or more; with --incremental an appended file
+only has its tail rehashed, and diff_changes reports which byte ranges changed:
+python3 change_tracker.py --search_path="/home/jovyan/tmp" --write_path="." --incremental --block_map_threshold="1073741824" --block_map_size="16777216"
+
 
 python3 -m json.tool < log_2019-11-10T16-19.json 
 
@@ -32,12 +93,43 @@ python3 -m doctest change_tracker.py
 
 """
 
+import array # rows to hash with --compact
 import datetime # for JSON file name
-import glob
 import sys
 import os
 import hashlib # hash of file
-import pandas
+import mmap # hash large files without a read buffer
+import concurrent.futures # parallel hashing
+import threading # per-thread read buffers
+import fnmatch # exclude rules
+import re # exclude rules
+import signal # flush the scan journal on SIGTERM
+import time # hashing throughput
+import zlib # crc32
+import snapshot_io
+import metrics
+import io_scheduler
+import history_index
+import path_table
+import scan_journal
+
+DEFAULT_BLOCK_SIZE = 1024*1024 # bytes read per chunk while hashing
+
+DEFAULT_BLOCK_MAP_SIZE = 16*1024*1024 # bytes per block digest in a block map
+
+COMPACT_HASH_BATCH = 100000 # files hashed per batch with --compact
+
+DEFAULT_SAMPLE_SIZE = 64*1024 # bytes hashed at each sample point by the quick check of --verify_every
+
+SAMPLE_FRACTIONS = (0.0, 0.5, 1.0) # head, middle and tail
+
+STAT_KEYS = ['size', 'mtime_ns', 'inode', 'device'] # the stat metadata of a record, see stat_to_dict
+
+# how a sharded scan divides the tree: by top-level entry or by file path
+SHARD_METHODS = ['top', 'hash']
+
+# crc32 is for change detection only; it is too weak to match content across paths
+HASH_ALGORITHMS = ['md5', 'sha1', 'sha256', 'blake2b', 'blake2s', 'crc32']
 
 def parse_args(list_of_args):
     """
@@ -45,15 +137,75 @@ def parse_args(list_of_args):
 
     >>> parse_args(['name of py script', '--search_path="/root"', '--write_path="/dir"', '--output_prefix="myfile"'])
 
+    >>> parse_args(['name of py script', '--search_path=.', '--write_path=.', '--incremental', '--paranoid_every=4'])[4]['paranoid_every']
+    4
+
     >>> parse_args(['name of py script', 'invalid arg'])
     """
     prnt_debug = False
     path_to_search = '.'
     write_path = '.'
     output_prefix = 'log'
+    scan_options = {'incremental': False, 'paranoid_every': '0',
+                    'block_size': str(DEFAULT_BLOCK_SIZE), 'mmap_threshold': '0',
+                    'workers': '1', 'pool': 'thread', 'excludes': [], 'format': 'json',
+                    'hash': 'md5', 'digest_size': '0',
+                    'block_map_threshold': '0', 'block_map_size': str(DEFAULT_BLOCK_MAP_SIZE),
+                    'shard': '', 'shard_by': 'top',
+                    'read_order': 'walk', 'max_bytes_per_second': '0', 'max_iops': '0', 'drop_cache': False,
+                    'index': False, 'compact': False, 'verify_every': '0', 'sample_size': str(DEFAULT_SAMPLE_SIZE),
+                    'checkpoint_every': '0', 'resume': False}
     for arg in list_of_args:
         if '--debug' in arg:
             prnt_debug = True
+        elif '--index' in arg:
+            scan_options['index'] = True
+        elif '--compact' in arg:
+            scan_options['compact'] = True
+        elif '--checkpoint_every' in arg:
+            scan_options['checkpoint_every'] = arg.replace('--checkpoint_every=', '')
+        elif '--resume' in arg:
+            scan_options['resume'] = True
+        elif '--verify_every' in arg:
+            scan_options['verify_every'] = arg.replace('--verify_every=', '')
+        elif '--sample_size' in arg:
+            scan_options['sample_size'] = arg.replace('--sample_size=', '')
+        elif '--read_order' in arg:
+            scan_options['read_order'] = arg.replace('--read_order=', '')
+        elif '--max_bytes_per_second' in arg:
+            scan_options['max_bytes_per_second'] = arg.replace('--max_bytes_per_second=', '')
+        elif '--max_iops' in arg:
+            scan_options['max_iops'] = arg.replace('--max_iops=', '')
+        elif '--drop_cache' in arg:
+            scan_options['drop_cache'] = True
+        elif '--shard_by' in arg:
+            scan_options['shard_by'] = arg.replace('--shard_by=', '')
+        elif '--shard' in arg:
+            scan_options['shard'] = arg.replace('--shard=', '')
+        elif '--incremental' in arg:
+            scan_options['incremental'] = True
+        elif '--paranoid_every' in arg:
+            scan_options['paranoid_every'] = arg.replace('--paranoid_every=', '')
+        elif '--block_map_threshold' in arg:
+            scan_options['block_map_threshold'] = arg.replace('--block_map_threshold=', '')
+        elif '--block_map_size' in arg:
+            scan_options['block_map_size'] = arg.replace('--block_map_size=', '')
+        elif '--block_size' in arg:
+            scan_options['block_size'] = arg.replace('--block_size=', '')
+        elif '--mmap_threshold' in arg:
+            scan_options['mmap_threshold'] = arg.replace('--mmap_threshold=', '')
+        elif '--workers' in arg:
+            scan_options['workers'] = arg.replace('--workers=', '')
+        elif '--hash' in arg:
+            scan_options['hash'] = arg.replace('--hash=', '')
+        elif '--digest_size' in arg:
+            scan_options['digest_size'] = arg.replace('--digest_size=', '')
+        elif '--format' in arg:
+            scan_options['format'] = arg.replace('--format=', '')
+        elif '--exclude' in arg:
+            scan_options['excludes'].append(arg.replace('--exclude=', ''))
+        elif '--pool' in arg:
+            scan_options['pool'] = arg.replace('--pool=', '')
         elif '--search_path' in arg:
             path_to_search = arg.replace('--search_path=', '')
         elif '--write_path' in arg:
@@ -61,11 +213,66 @@ def parse_args(list_of_args):
         elif '--output_prefix' in arg:
             output_prefix = arg.replace('--output_prefix=', '')
             
+    for option_name in ['paranoid_every', 'block_size', 'mmap_threshold', 'workers', 'digest_size',
+                        'block_map_threshold', 'block_map_size', 'max_bytes_per_second', 'max_iops',
+                        'verify_every', 'sample_size', 'checkpoint_every']:
+        try:
+            scan_options[option_name] = int(scan_options[option_name])
+        except ValueError:
+            raise Exception('ERROR: '+option_name+' must be an integer:', scan_options[option_name])
+        if scan_options[option_name] < 0:
+            raise Exception('ERROR: '+option_name+' must be 0 or greater')
+    if scan_options['block_size'] == 0:
+        raise Exception('ERROR: block_size must be greater than 0')
+    if scan_options['block_map_size'] == 0:
+        raise Exception('ERROR: block_map_size must be greater than 0')
+    if scan_options['workers'] == 0:
+        raise Exception('ERROR: workers must be greater than 0')
+    if scan_options['sample_size'] == 0:
+        raise Exception('ERROR: sample_size must be greater than 0')
+    if scan_options['verify_every'] > 0 and not scan_options['incremental']:
+        raise Exception('ERROR: verify_every needs --incremental (without it every file is fully hashed every run)')
+    if scan_options['hash'] not in HASH_ALGORITHMS:
+        raise Exception('ERROR: hash must be one of', HASH_ALGORITHMS)
+    if scan_options['digest_size'] > 0:
+        if scan_options['hash'] not in ['blake2b', 'blake2s']:
+            raise Exception('ERROR: digest_size only applies to blake2b and blake2s')
+        try:
+            new_hash_object(scan_options['hash'], scan_options['digest_size'])
+        except ValueError:
+            raise Exception('ERROR: digest_size out of range for', scan_options['hash'])
+    if scan_options['format'] not in snapshot_io.SNAPSHOT_FORMATS:
+        raise Exception('ERROR: format must be one of', list(snapshot_io.SNAPSHOT_FORMATS.keys()))
+    if scan_options['pool'] not in ['thread', 'process']:
+        raise Exception('ERROR: pool must be "thread" or "process":', scan_options['pool'])
+    if scan_options['read_order'] not in io_scheduler.READ_ORDERS:
+        raise Exception('ERROR: read_order must be one of', io_scheduler.READ_ORDERS)
+    if scan_options['shard_by'] not in SHARD_METHODS:
+        raise Exception('ERROR: shard_by must be one of', SHARD_METHODS)
+    scan_options['shard'] = parse_shard(scan_options['shard'])
     if not os.path.exists(path_to_search):
         raise Exception('ERROR: provided search path does not exist:', path_to_search)
     if not os.path.exists(write_path):
         raise Exception('ERROR: provided write path does not exist:', write_path)
-    return prnt_debug, path_to_search, write_path, output_prefix
+    return prnt_debug, path_to_search, write_path, output_prefix, scan_options
+
+def parse_shard(shard_str):
+    """
+    "i/n" (shard i of n, counting from 0) as [i, n]; '' is no sharding (None)
+
+    >>> parse_shard('2/8')
+    [2, 8]
+    >>> parse_shard('')
+    """
+    if shard_str == '':
+        return None
+    try:
+        shard_index, shard_count = [int(part) for part in shard_str.split('/')]
+    except ValueError:
+        raise Exception('ERROR: shard must look like "2/8" (shard 2 of 8, counting from 0):', shard_str)
+    if shard_count < 1 or not 0 <= shard_index < shard_count:
+        raise Exception('ERROR: shard index must be from 0 to the shard count minus 1:', shard_str)
+    return [shard_index, shard_count]
 
 def args_use(list_of_args):
     """
@@ -77,6 +284,7 @@ def args_use(list_of_args):
     path_to_search = '.'
     write_path = '.'
     output_prefix = 'log'
+    scan_options = {}
     if len(list_of_args) == 1:
         print('ERROR: invalid number of arguments')
         print('required arguments:')
@@ -84,61 +292,1182 @@ def args_use(list_of_args):
         print('  --write_path="/path/to/write"')
         print('optional arguments:')
         print('  --output_prefix="logs"')
+        print('  --incremental')
+        print('  --paranoid_every="4"')
+        print('  --block_size="1048576"')
+        print('  --mmap_threshold="1073741824"')
+        print('  --workers="8"')
+        print('  --pool="thread" or --pool="process"')
+        print('  --exclude=".git" (repeatable; glob, or "re:" regex)')
+        print('  --format="json" (or sqlite, pathtable)')
+        print('  --compact (hold the records as a path_table.PathTable)')
+        print('  --verify_every="7" (quick check every run, full rehash of 1/7 of the files per run)')
+        print('  --sample_size="65536"')
+        print('  --checkpoint_every="60" (seconds between journal checkpoints, see scan_journal.py)')
+        print('  --resume (continue the interrupted scan from its journal)')
+        print('  --hash="md5" (or sha1, sha256, blake2b, blake2s, crc32)')
+        print('  --digest_size="16" (bytes; blake2b and blake2s only)')
+        print('  --block_map_threshold="1073741824"')
+        print('  --block_map_size="16777216"')
+        print('  --index (update the history index, see history_index.py)')
+        print('  --read_order="walk" (or inode, extent)')
+        print('  --max_bytes_per_second="52428800"')
+        print('  --max_iops="200"')
+        print('  --drop_cache')
+        print('  --shard="0/4" (shard 0 of 4, written to shards/; see merge_shards.py)')
+        print('  --shard_by="top" or --shard_by="hash"')
+        print('  --metrics="scan_metrics.json"')
+        print('  --progress="30" (seconds between progress lines)')
+        print('  --profile="scan.prof"')
         print('  --debug')
         sys.exit(1) # https://stackoverflow.com/questions/6501121/difference-between-exit-and-sys-exit-in-python
     elif len(list_of_args) > 1:
-        prnt_debug, path_to_search, write_path, output_prefix = parse_args(list_of_args)
+        prnt_debug, path_to_search, write_path, output_prefix, scan_options = parse_args(list_of_args)
     else:
         raise Exception('invalid option')
-    return prnt_debug, path_to_search, write_path, output_prefix
+    return prnt_debug, path_to_search, write_path, output_prefix, scan_options
+
+class Crc32Hash:
+    """
+    the hashlib interface over zlib.crc32; very cheap, but only good for noticing that a file changed,
+    not for matching content across paths (moves, duplicates)
+    """
+    name = 'crc32'
+    digest_size = 4
+
+    def __init__(self):
+        self.crc = 0
 
-def md5_file(fname):
+    def update(self, data):
+        self.crc = zlib.crc32(data, self.crc)
+
+    def hexdigest(self):
+        return format(self.crc, '08x')
+
+def new_hash_object(hash_name='md5', digest_size=0):
+    """
+    a fresh hash object for one of HASH_ALGORITHMS; digest_size (in bytes) applies to blake2b/blake2s, 0 keeps the default
+
+    >>> new_hash_object('blake2b', 16).digest_size
+    16
+    >>> new_hash_object('crc32').hexdigest()
+    '00000000'
+    """
+    # https://docs.python.org/3/library/hashlib.html#blake2
+    if hash_name in ['blake2b', 'blake2s'] and digest_size > 0:
+        return hashlib.new(hash_name, digest_size=digest_size)
+    if hash_name == 'crc32':
+        return Crc32Hash()
+    return hashlib.new(hash_name)
+
+def hash_settings(scan_options):
     """
+    the hash algorithm, digest size (in bytes), block map size and block map threshold
+    that describe the digests in a snapshot; works on scan_options and on snapshot headers, which share the keys.
+    Snapshots written before the algorithm was recorded are md5 without block maps.
+
+    >>> hash_settings({})
+    ('md5', 16, 0, 0)
+    >>> hash_settings({'hash': 'blake2b', 'digest_size': 16})
+    ('blake2b', 16, 0, 0)
+    """
+    hash_name = scan_options.get('hash', 'md5')
+    block_map_threshold = scan_options.get('block_map_threshold', 0)
+    block_map_size = scan_options.get('block_map_size', DEFAULT_BLOCK_MAP_SIZE) if block_map_threshold > 0 else 0
+    return (hash_name, new_hash_object(hash_name, scan_options.get('digest_size', 0)).digest_size,
+            block_map_size, block_map_threshold)
+
+def md5_file(fname, block_size=DEFAULT_BLOCK_SIZE, mmap_threshold=0, buf=None):
+    """
+    hash_file with md5
+
     >>> md5_file('')
 
     >>> md5_file()
     """
+    return hash_file(fname, block_size, mmap_threshold, buf, 'md5')
+
+def hash_file(fname, block_size=DEFAULT_BLOCK_SIZE, mmap_threshold=0, buf=None, hash_name='md5', digest_size=0,
+              dict_of_timings=None, throttle=None, drop_cache=False):
+    """
+    hash the file in block_size chunks so memory use does not depend on the file size
+
+    files of at least mmap_threshold bytes are memory mapped instead of read (0 disables mmap)
+    buf is an optional bytearray to reuse between calls
+    dict_of_timings, when given, gets the seconds spent opening, reading, hashing and waiting on the throttle
+    added to its 'open', 'read', 'hash' and 'throttle' keys; reads through mmap count as hashing
+    throttle is an io_scheduler.Throttle charged after every chunk;
+    drop_cache advises sequential reads and drops the file's cached pages afterwards
+
+    returns (got_hash, hex digest, number of bytes hashed)
+    """
+    hash_obj = new_hash_object(hash_name, digest_size)
+    bytes_hashed = 0
+    timed = dict_of_timings is not None
+    if timed: tick = time.perf_counter()
+    try:
+        with open(fname, "rb") as fil:
+            file_size = os.fstat(fil.fileno()).st_size
+            if drop_cache: io_scheduler.advise_sequential(fil.fileno())
+            if timed:
+                tock = time.perf_counter()
+                dict_of_timings['open'] += tock - tick
+                tick = tock
+            if mmap_threshold > 0 and file_size >= mmap_threshold:
+                throttled = 0.0
+                # https://docs.python.org/3/library/mmap.html
+                with mmap.mmap(fil.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    if hasattr(mapped, 'madvise'):
+                        mapped.madvise(mmap.MADV_SEQUENTIAL)
+                    view = memoryview(mapped)
+                    try:
+                        for offset in range(0, len(mapped), block_size):
+                            hash_obj.update(view[offset:offset+block_size])
+                            if throttle is not None:
+                                throttled += throttle.wait(min(block_size, len(mapped) - offset))
+                    finally:
+                        view.release()
+                    bytes_hashed = len(mapped)
+                if timed:
+                    dict_of_timings['hash'] += time.perf_counter() - tick - throttled
+                    dict_of_timings['throttle'] += throttled
+            else:
+                if buf is None or len(buf) != block_size:
+                    buf = bytearray(block_size)
+                view = memoryview(buf)
+                # https://docs.python.org/3/library/io.html#io.RawIOBase.readinto
+                number_read = fil.readinto(buf)
+                while number_read:
+                    if timed:
+                        tock = time.perf_counter()
+                        dict_of_timings['read'] += tock - tick
+                    hash_obj.update(view[:number_read])
+                    if timed:
+                        tick = time.perf_counter()
+                        dict_of_timings['hash'] += tick - tock
+                    bytes_hashed += number_read
+                    if throttle is not None:
+                        throttled = throttle.wait(number_read)
+                        if timed:
+                            dict_of_timings['throttle'] += throttled
+                            tick = time.perf_counter()
+                    number_read = fil.readinto(buf)
+                if timed: dict_of_timings['read'] += time.perf_counter() - tick
+                view.release()
+            if drop_cache: io_scheduler.drop_cached_pages(fil.fileno())
+        return True, hash_obj.hexdigest(), bytes_hashed
+    except OSError: # PermissionError, or the file was deleted or renamed since the crawl
+        return False, '', bytes_hashed
+
+def hash_block(fil, block_index, block_map_size, view, hash_name='md5', digest_size=0):
+    """
+    (hex digest, number of bytes read) of block block_index of an open file, read through view
+    """
+    block_obj = new_hash_object(hash_name, digest_size)
+    fil.seek(block_index*block_map_size)
+    bytes_read = 0
+    while bytes_read < block_map_size:
+        number_read = fil.readinto(view[:min(len(view), block_map_size - bytes_read)])
+        if not number_read:
+            break
+        block_obj.update(view[:number_read])
+        bytes_read += number_read
+    return block_obj.hexdigest(), bytes_read
+
+def hash_file_blocks(fname, block_map_size, block_size=DEFAULT_BLOCK_SIZE, buf=None, hash_name='md5', digest_size=0,
+                     start_block=0, list_of_known_blocks=None, dict_of_timings=None, throttle=None, drop_cache=False):
+    """
+    hash the file as a sequence of block_map_size blocks, each with its own digest;
+    the hash of the file is the hash of the concatenated block digests
+
+    Blocks before start_block are taken from list_of_known_blocks instead of being read,
+    so a file that was only appended to needs just its tail rehashed.
+    The head block and the last known block are read again first; if either differs,
+    the file was edited in place as well as grown, and every block is read.
+    dict_of_timings, throttle and drop_cache are as for hash_file.
+
+    returns (got_hash, hex digest, number of bytes hashed, list of block hex digests)
+    """
+    list_of_blocks = list(list_of_known_blocks[:start_block]) if start_block > 0 else []
+    bytes_hashed = 0
+    if buf is None or len(buf) != block_size:
+        buf = bytearray(block_size)
+    view = memoryview(buf)
+    timed = dict_of_timings is not None
+    if timed: tick = time.perf_counter()
+    try:
+        with open(fname, "rb") as fil:
+            if drop_cache: io_scheduler.advise_sequential(fil.fileno())
+            if timed:
+                tock = time.perf_counter()
+                dict_of_timings['open'] += tock - tick
+                tick = tock
+            # an edit in place that also grew the file would leave stale blocks behind
+            for block_index in sorted({0, start_block - 1}) if start_block > 0 else []:
+                block_digest, number_read = hash_block(fil, block_index, block_map_size, view, hash_name, digest_size)
+                bytes_hashed += number_read
+                if timed:
+                    tock = time.perf_counter()
+                    dict_of_timings['read'] += tock - tick
+                if throttle is not None:
+                    throttled = throttle.wait(number_read)
+                    if timed: dict_of_timings['throttle'] += throttled
+                if timed: tick = time.perf_counter()
+                if block_digest != list_of_known_blocks[block_index]:
+                    start_block = 0
+                    list_of_blocks = []
+                    break
+            fil.seek(start_block*block_map_size)
+            block_obj = new_hash_object(hash_name, digest_size)
+            bytes_in_block = 0
+            number_read = fil.readinto(view[:min(block_size, block_map_size)])
+            while number_read:
+                if timed:
+                    tock = time.perf_counter()
+                    dict_of_timings['read'] += tock - tick
+                block_obj.update(view[:number_read])
+                bytes_hashed += number_read
+                bytes_in_block += number_read
+                if bytes_in_block == block_map_size:
+                    list_of_blocks.append(block_obj.hexdigest())
+                    block_obj = new_hash_object(hash_name, digest_size)
+                    bytes_in_block = 0
+                if timed:
+                    tick = time.perf_counter()
+                    dict_of_timings['hash'] += tick - tock
+                if throttle is not None:
+                    throttled = throttle.wait(number_read)
+                    if timed:
+                        dict_of_timings['throttle'] += throttled
+                        tick = time.perf_counter()
+                number_read = fil.readinto(view[:min(block_size, block_map_size - bytes_in_block)])
+            if timed: dict_of_timings['read'] += time.perf_counter() - tick
+            if bytes_in_block > 0:
+                list_of_blocks.append(block_obj.hexdigest())
+            if drop_cache: io_scheduler.drop_cached_pages(fil.fileno())
+    except OSError: # PermissionError, or the file was deleted or renamed since the crawl
+        return False, '', bytes_hashed, []
+    finally:
+        view.release()
+    top_obj = new_hash_object(hash_name, digest_size)
+    top_obj.update(bytes.fromhex(''.join(list_of_blocks)))
+    return True, top_obj.hexdigest(), bytes_hashed, list_of_blocks
+
+def hash_file_sample(fname, sample_size, list_of_fractions=(0.0, 1.0), hash_name='md5', digest_size=0):
+    """
+    hash sample_size bytes at each fraction of the way through the file (0.0 is the head, 1.0 the tail)
+    together with the file size; a cheap fingerprint that reads a bounded number of bytes
+
+    When the samples would cover the whole file, the result is the plain hash of the content
+    (the same digest hash_file gives) and the third returned value is True.
+
+    returns (got_hash, hex digest, covers whole file, bytes read)
+    """
+    hash_obj = new_hash_object(hash_name, digest_size)
     try:
         with open(fname, "rb") as fil:
-            file_content = fil.read()
-        return True, hashlib.md5(file_content).hexdigest()
-    except PermissionError:
-        return False, ''
+            file_size = os.fstat(fil.fileno()).st_size
+            if file_size <= sample_size*len(list_of_fractions):
+                hash_obj.update(fil.read())
+                return True, hash_obj.hexdigest(), True, file_size
+            hash_obj.update(str(file_size).encode())
+            for fraction in list_of_fractions:
+                fil.seek(int(fraction*(file_size - sample_size)))
+                hash_obj.update(fil.read(sample_size))
+        return True, hash_obj.hexdigest(), False, sample_size*len(list_of_fractions)
+    except OSError: # PermissionError, or the file was deleted or renamed since the crawl
+        return False, '', False, 0
+
+def load_previous_snapshot(prnt_debug, write_path, output_prefix, scan_options=None):
+    """
+    the most recent snapshot written with this output_prefix, as a dict keyed by full path,
+    or as a path_table.PathTable (which has the same get) when scan_options['compact'] is set
+
+    A snapshot hashed with different settings than scan_options cannot supply hashes, so {} is returned.
+
+    >>> load_previous_snapshot(False, '/path/to/write', 'logs')
+    {}
+    """
+    list_of_snapshot_files = snapshot_io.latest_snapshots(prnt_debug, write_path, 1, output_prefix)
+    if len(list_of_snapshot_files) == 0:
+        if prnt_debug: print('no previous snapshot found; hashing every file')
+        return {}
+    latest_snapshot_file = list_of_snapshot_files[0]
+    if prnt_debug: print('previous snapshot:', latest_snapshot_file)
+    if scan_options is not None:
+        previous_settings = hash_settings(snapshot_io.read_snapshot_header(latest_snapshot_file))
+        if previous_settings != hash_settings(scan_options):
+            if prnt_debug: print('previous snapshot used', previous_settings, '; hashing every file')
+            return {}
+    if scan_options is not None and scan_options.get('compact', False):
+        return snapshot_io.read_path_table(prnt_debug, latest_snapshot_file)
+    return {file_dict['full path']: file_dict
+            for file_dict in snapshot_io.iter_snapshot_records(prnt_debug, latest_snapshot_file)}
+
+def stat_of_file(filename):
+    """
+    the metadata compared by an incremental scan to decide whether a file needs rehashing
+    """
+    return stat_to_dict(os.stat(filename))
+
+def stat_to_dict(stat_result):
+    """
+    the fields of an os.stat_result that are stored in the snapshot
+    """
+    return {'size': stat_result.st_size,
+            'mtime_ns': stat_result.st_mtime_ns,
+            'inode': stat_result.st_ino,
+            'device': stat_result.st_dev}
+
+def reuse_previous_hash(previous_dict, file_stat, paranoid_every):
+    """
+    True when the previous record has the same stat metadata and is not due for a paranoid rehash
+
+    >>> reuse_previous_hash({'size': 1, 'mtime_ns': 2, 'inode': 3, 'device': 4, 'runs since hash': 0}, {'size': 1, 'mtime_ns': 2, 'inode': 3, 'device': 4}, 0)
+    True
+    >>> reuse_previous_hash({'size': 1, 'mtime_ns': 2, 'inode': 3, 'device': 4, 'runs since hash': 3}, {'size': 1, 'mtime_ns': 2, 'inode': 3, 'device': 4}, 4)
+    False
+    """
+    if previous_dict is None:
+        return False
+    for key in file_stat:
+        if previous_dict.get(key) != file_stat[key]:
+            return False
+    if paranoid_every > 0 and previous_dict.get('runs since hash', 0) + 1 >= paranoid_every:
+        return False
+    return True
+
+def is_excluded(name, relative_path, list_of_excludes):
+    """
+    exclude rules are glob patterns matched against the entry name or the path relative to the search path,
+    or regular expressions (prefixed with "re:") searched for in the relative path
+
+    >>> is_excluded('.git', '.git', ['.git'])
+    True
+    >>> is_excluded('x.pyc', 'src/x.pyc', ['*.pyc'])
+    True
+    >>> is_excluded('.cache', 'home/a/.cache', ['re:(^|/)\\.cache$'])
+    True
+    """
+    for pattern in list_of_excludes:
+        if pattern.startswith('re:'):
+            if re.search(pattern[3:], relative_path):
+                return True
+        elif fnmatch.fnmatchcase(name, pattern) or fnmatch.fnmatchcase(relative_path, pattern):
+            return True
+    return False
+
+def shard_of_path(relative_path, shard_count):
+    """
+    the shard a path belongs to; the same on every machine and every run
+
+    >>> shard_of_path('projects', 4)
+    0
+    """
+    return zlib.crc32(relative_path.encode('utf-8', 'surrogateescape')) % shard_count
+
+def walk_files(prnt_debug, path_to_search, list_of_excludes=None, run_metrics=None, shard=None, shard_by='top',
+               dict_of_dir_mtimes=None, dict_of_done_dirs=None):
+    """
+    yield (full path, os.stat_result) for every regular file under path_to_search, including dotfiles
+
+    Built on os.scandir so the stat cached on each DirEntry is reused.
+    Excluded directories are pruned before descending into them.
+    Symlinks to directories are followed, but each directory is visited once, so symlink loops terminate.
+    Entries are visited in sorted order so repeated crawls of the same tree give the same output.
+    The files of a directory are yielded once the whole directory has been listed and stat'ed,
+    so run_metrics (a metrics.Metrics) times the walk and the stat calls without the caller's work.
+    shard ([index, count], see parse_shard) keeps one shard of the tree: with shard_by 'top' the top-level
+    entries of path_to_search are divided and the other subtrees are never entered; with 'hash' the files are.
+    dict_of_dir_mtimes, when given, gets the mtime_ns of every directory listed (as os.path.dirname of its files);
+    a directory in dict_of_done_dirs with the same mtime (one a resumed scan finished before it was interrupted,
+    see scan_journal.py) is listed without stat'ing its files, which are yielded as (full path, None).
+    """
+    if list_of_excludes is None:
+        list_of_excludes = []
+    # https://docs.python.org/3/library/os.html#os.scandir
+    visited_dirs = set()
+    try:
+        root_stat = os.stat(path_to_search)
+    except OSError:
+        return
+    visited_dirs.add((root_stat.st_dev, root_stat.st_ino))
+    stack_of_dirs = [(path_to_search, '', root_stat.st_mtime_ns)]
+    while len(stack_of_dirs) > 0:
+        dir_path, relative_dir, mtime_ns = stack_of_dirs.pop()
+        if run_metrics is not None: tick = time.perf_counter()
+        try:
+            with os.scandir(dir_path) as dir_iterator:
+                list_of_entries = sorted(dir_iterator, key=lambda entry: entry.name)
+        except OSError as err: # PermissionError, or the directory vanished mid-crawl
+            if prnt_debug: print('skipping directory', dir_path, err)
+            if run_metrics is not None:
+                run_metrics.count('permission errors (directories)' if isinstance(err, PermissionError)
+                                  else 'unreadable directories')
+            continue
+        if run_metrics is not None: tock = time.perf_counter()
+        dir_done = False
+        if dict_of_dir_mtimes is not None:
+            dir_name = dir_path.rstrip('/') or '/'
+            dict_of_dir_mtimes[dir_name] = mtime_ns
+            dir_done = dict_of_done_dirs is not None and dict_of_done_dirs.get(dir_name) == mtime_ns
+        list_of_subdirs = []
+        list_of_files = []
+        for entry in list_of_entries:
+            relative_path = relative_dir + entry.name
+            if len(list_of_excludes) > 0 and is_excluded(entry.name, relative_path, list_of_excludes):
+                if prnt_debug: print('excluded', entry.path)
+                if run_metrics is not None: run_metrics.count('excluded entries')
+                continue
+            if shard is not None and shard_by == 'top' and relative_dir == '' \
+                    and shard_of_path(entry.name, shard[1]) != shard[0]:
+                continue
+            try:
+                if entry.is_dir():
+                    stat_result = entry.stat()
+                    dir_key = (stat_result.st_dev, stat_result.st_ino)
+                    if dir_key in visited_dirs:
+                        if prnt_debug: print('already visited', entry.path)
+                        if run_metrics is not None: run_metrics.count('directories already visited')
+                        continue
+                    visited_dirs.add(dir_key)
+                    list_of_subdirs.append((entry.path, relative_path+'/', stat_result.st_mtime_ns))
+                elif entry.is_file():
+                    if shard is not None and shard_by == 'hash' and shard_of_path(relative_path, shard[1]) != shard[0]:
+                        continue
+                    list_of_files.append((entry.path, None if dir_done else entry.stat()))
+                elif run_metrics is not None:
+                    run_metrics.count('not regular files')
+            except OSError: # broken symlink, or the entry vanished mid-crawl
+                if run_metrics is not None: run_metrics.count('broken or vanished entries')
+                continue
+        if run_metrics is not None:
+            done = time.perf_counter()
+            run_metrics.add_io({'walk': tock - tick, 'stat': done - tock})
+            run_metrics.add_directory_time(dir_path, done - tick)
+        # reversed so the stack pops subdirectories in sorted order
+        stack_of_dirs.extend(reversed(list_of_subdirs))
+        yield from list_of_files
+
+def block_start_of_file(previous_dict, file_stat, block_map_size, paranoid_every):
+    """
+    where hash_file_blocks has to start reading a file that will get a block map
+
+    A file that is the same inode and has grown is treated as appended to:
+    the blocks that were complete in the previous snapshot are kept and only the tail is read
+    (hash_file_blocks checks the head block and the last kept block before trusting them).
+    Anything else (in-place edits, replaced files, paranoid rehash due) reads every block.
+
+    >>> block_start_of_file({'size': 250, 'inode': 1, 'device': 2, 'block hashes': ['a', 'b', 'c']}, {'size': 400, 'inode': 1, 'device': 2}, 100, 0)
+    (2, ['a', 'b', 'c'])
+    >>> block_start_of_file(None, {'size': 400, 'inode': 1, 'device': 2}, 100, 0)
+    (0, [])
+    """
+    if previous_dict is None or 'block hashes' not in previous_dict:
+        return (0, [])
+    if paranoid_every > 0 and previous_dict.get('runs since hash', 0) + 1 >= paranoid_every:
+        return (0, [])
+    if (previous_dict.get('inode') != file_stat['inode'] or previous_dict.get('device') != file_stat['device']
+            or previous_dict.get('size', 0) >= file_stat['size']):
+        return (0, [])
+    return (previous_dict['size']//block_map_size, previous_dict['block hashes'])
+
+def count_unhashed(run_metrics, filename):
+    """
+    count a file hash_files could not hash: one that is gone since the crawl, or one that cannot be read
+    """
+    if run_metrics is None:
+        return
+    if not os.path.lexists(filename):
+        run_metrics.count('vanished files')
+    elif not os.access(filename, os.R_OK):
+        run_metrics.count('permission errors (files)')
+    else:
+        run_metrics.count('unreadable files')
+
+_thread_buffers = threading.local()
+
+def hash_worker(task):
+    """
+    hash one (filename, hash_options, block_start) task, as run inside a thread or process pool;
+    each thread keeps its own read buffer
+
+    block_start is None for a plain hash_file, or (start_block, list_of_known_blocks) for hash_file_blocks
+    returns (got_hash, hex digest, number of bytes hashed, list of block hex digests or None),
+    followed by a dict of open/read/hash seconds when hash_options['timed'] is set
+    """
+    filename, hash_options, block_start = task
+    block_size = hash_options['block_size']
+    buf = getattr(_thread_buffers, 'buf', None)
+    if buf is None or len(buf) != block_size:
+        buf = bytearray(block_size)
+        _thread_buffers.buf = buf
+    dict_of_timings = {'open': 0.0, 'read': 0.0, 'hash': 0.0, 'throttle': 0.0} if hash_options.get('timed') else None
+    # one throttle per process, shared by its threads
+    throttle = io_scheduler.shared_throttle(hash_options.get('max_bytes_per_second', 0), hash_options.get('max_iops', 0))
+    drop_cache = hash_options.get('drop_cache', False)
+    if block_start is None:
+        result = hash_file(filename, block_size, hash_options['mmap_threshold'], buf,
+                           hash_options['hash'], hash_options['digest_size'], dict_of_timings,
+                           throttle, drop_cache) + (None,)
+    else:
+        start_block, list_of_known_blocks = block_start
+        result = hash_file_blocks(filename, hash_options['block_map_size'], block_size, buf,
+                                  hash_options['hash'], hash_options['digest_size'], start_block, list_of_known_blocks,
+                                  dict_of_timings, throttle, drop_cache)
+    if dict_of_timings is None:
+        return result
+    return result + (dict_of_timings,)
+
+def sample_worker(task):
+    """
+    the quick check of one (filename, hash_options, None) task, as run inside a thread or process pool:
+    hash_file_sample over SAMPLE_FRACTIONS of the file, returned in the shape of a hash_worker result
+    """
+    filename, hash_options, _ = task
+    wall_start = time.perf_counter()
+    got_hash, sample_hash, covers_whole_file, bytes_read = hash_file_sample(
+        filename, hash_options['sample_size'], SAMPLE_FRACTIONS, hash_options['hash'], hash_options['digest_size'])
+    throttle = io_scheduler.shared_throttle(hash_options.get('max_bytes_per_second', 0), hash_options.get('max_iops', 0))
+    throttle_seconds = 0.0
+    if throttle is not None and got_hash:
+        throttle_seconds = throttle.wait(bytes_read, 1 if covers_whole_file else len(SAMPLE_FRACTIONS))
+    result = (got_hash, sample_hash, bytes_read, None)
+    if not hash_options.get('timed'):
+        return result
+    return result + ({'open': 0.0, 'read': time.perf_counter() - wall_start - throttle_seconds, 'hash': 0.0,
+                      'throttle': throttle_seconds},)
+
+def collect_hash_results(iterable_of_results, list_of_filenames, run_metrics=None, on_result=None):
+    """
+    the hash_worker results as a list; with run_metrics, each timed result is credited to the metrics
+    (and to the directory of its file) as it arrives, so progress is reported while the pool works
+    on_result(position, result) is called for each result as it arrives, e.g. to journal it
+    """
+    if run_metrics is None and on_result is None:
+        return list(iterable_of_results)
+    list_of_results = []
+    for position, (filename, result) in enumerate(zip(list_of_filenames, iterable_of_results)):
+        if run_metrics is not None:
+            dict_of_timings = result[4]
+            run_metrics.add_io(dict_of_timings)
+            run_metrics.add_directory_time(os.path.dirname(filename), sum(dict_of_timings.values()))
+            run_metrics.add_progress(1, result[2])
+            result = result[:4]
+        if on_result is not None:
+            on_result(position, result)
+        list_of_results.append(result)
+    return list_of_results
+
+def hash_files(list_of_filenames, scan_options, list_of_block_starts=None, run_metrics=None, worker=hash_worker,
+               on_result=None):
+    """
+    hash_worker results for list_of_filenames, in the same order as list_of_filenames
+    (worker=sample_worker gives the quick check of --verify_every instead)
 
-def hash_list_of_files(prnt_debug, path_to_search):
+    list_of_block_starts gives, per file, None for a plain hash or (start_block, list_of_known_blocks) for a block map
+    scan_options['workers'] > 1 spreads the hashing over a pool;
+    scan_options['pool'] is 'thread' (I/O bound storage) or 'process' (CPU bound hashing)
+    run_metrics (a metrics.Metrics) gets the open/read/hash split and the bytes hashed
+    scan_options['max_bytes_per_second'] and scan_options['max_iops'] cap the reads of all workers together
+    on_result, see collect_hash_results
+    """
+    workers = scan_options.get('workers', 1)
+    # a process pool cannot share one throttle, so each process gets an equal share of the budget
+    budget_share = workers if scan_options.get('pool', 'thread') == 'process' and len(list_of_filenames) > 1 else 1
+    hash_options = {'block_size': scan_options.get('block_size', DEFAULT_BLOCK_SIZE),
+                    'mmap_threshold': scan_options.get('mmap_threshold', 0),
+                    'hash': scan_options.get('hash', 'md5'),
+                    'digest_size': scan_options.get('digest_size', 0),
+                    'block_map_size': scan_options.get('block_map_size', DEFAULT_BLOCK_MAP_SIZE),
+                    'max_bytes_per_second': scan_options.get('max_bytes_per_second', 0)/budget_share,
+                    'max_iops': scan_options.get('max_iops', 0)/budget_share,
+                    'drop_cache': scan_options.get('drop_cache', False),
+                    'sample_size': scan_options.get('sample_size', DEFAULT_SAMPLE_SIZE),
+                    'timed': run_metrics is not None}
+    if list_of_block_starts is None:
+        list_of_block_starts = [None]*len(list_of_filenames)
+    list_of_tasks = [(filename, hash_options, block_start)
+                     for filename, block_start in zip(list_of_filenames, list_of_block_starts)]
+    if workers <= 1 or len(list_of_tasks) < 2:
+        return collect_hash_results(map(worker, list_of_tasks), list_of_filenames, run_metrics, on_result)
+    # https://docs.python.org/3/library/concurrent.futures.html
+    # Executor.map returns results in the order of the inputs, so the output stays deterministic
+    if scan_options.get('pool', 'thread') == 'process':
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            chunksize = max(1, len(list_of_tasks)//(workers*4))
+            return collect_hash_results(executor.map(worker, list_of_tasks, chunksize=chunksize),
+                                        list_of_filenames, run_metrics, on_result)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        return collect_hash_results(executor.map(worker, list_of_tasks), list_of_filenames, run_metrics, on_result)
+
+def file_record(filename, file_stat, hash_of_file, runs_since_hash, list_of_blocks=None):
+    """
+    >>> file_record('/r/a', {'size': 1, 'mtime_ns': 2, 'inode': 3, 'device': 4}, 'ab', 0)['runs since hash']
+    0
+    """
+    file_dict = {}
+    file_dict['full path'] = filename
+    file_dict['hash of file'] = hash_of_file
+    file_dict.update(file_stat)
+    file_dict['runs since hash'] = runs_since_hash
+    if list_of_blocks is not None:
+        file_dict['block hashes'] = list_of_blocks
+    return file_dict
+
+def resumed_file_stat(filename, journal_dict, previous_dict):
+    """
+    the stat metadata of a file in a directory the interrupted run finished, as that run saw it:
+    from its journal record, or the previous snapshot record it reused, without a stat call
+    """
+    for file_dict in [journal_dict, previous_dict]:
+        if file_dict is not None and 'size' in file_dict:
+            return {key: file_dict[key] for key in STAT_KEYS}
+    try:
+        return stat_of_file(filename)
+    except OSError: # vanished since
+        return None
+
+def crawl_files(prnt_debug, path_to_search, scan_options, previous_snapshot, run_metrics=None, journal=None):
+    """
+    the first pass of hash_list_of_files: walk and stat, reusing hashes where allowed.
+    yields (filename, file_stat, hash of file or None when it needs hashing, runs since hash, block hashes or None,
+    previous record or None)
+    With journal (a scan_journal.ScanJournal) the hashes of the interrupted run are reused first,
+    and the files to hash are announced to it
+    """
+    paranoid_every = scan_options.get('paranoid_every', 0)
+    dict_of_journaled = {} if journal is None else journal.dict_of_records
+    for filename, stat_result in walk_files(prnt_debug, path_to_search, scan_options.get('excludes', []), run_metrics,
+                                            scan_options.get('shard'), scan_options.get('shard_by', 'top'),
+                                            None if journal is None else journal.dict_of_dir_mtimes,
+                                            None if journal is None else journal.dict_of_done_dirs):
+        journal_dict = dict_of_journaled.get(filename)
+        previous_dict = previous_snapshot.get(filename)
+        if stat_result is None:
+            file_stat = resumed_file_stat(filename, journal_dict, previous_dict)
+            if file_stat is None:
+                continue
+        else:
+            file_stat = stat_to_dict(stat_result)
+        if run_metrics is not None:
+            run_metrics.add_progress(1, file_stat['size'])
+            run_metrics.add_file(filename, file_stat['size'])
+        if reuse_previous_hash(journal_dict, file_stat, 0):
+            if run_metrics is not None: run_metrics.count('hashes resumed')
+            yield (filename, file_stat, journal_dict['hash of file'], journal_dict.get('runs since hash', 0),
+                   journal_dict.get('block hashes'), previous_dict)
+        elif reuse_previous_hash(previous_dict, file_stat, paranoid_every):
+            yield (filename, file_stat, previous_dict['hash of file'], previous_dict.get('runs since hash', 0) + 1,
+                   previous_dict.get('block hashes'), previous_dict)
+        else:
+            if journal is not None:
+                journal.expect(filename)
+            yield (filename, file_stat, None, 0, None, previous_dict)
+    if journal is not None:
+        journal.end_of_crawl()
+
+def hash_list_of_files(prnt_debug, path_to_search, scan_options=None, previous_snapshot=None, run_metrics=None,
+                       journal=None):
+    """
+    previous_snapshot is the dict returned by load_previous_snapshot; 
+    it is only consulted when scan_options['incremental'] is set
+    run_metrics (a metrics.Metrics) times the crawl and the hash phases
+    scan_options['read_order'] (see io_scheduler.read_order) decides the order the files are read in;
+    the records keep the walk order either way
+    with scan_options['compact'] the records come back as a path_table.PathTable, see hash_table_of_files
+    with scan_options['verify_every'] the records also go through verify_files
+    journal (a scan_journal.ScanJournal) gets every record as it is hashed, and resumes the run it was read from
+    """
+    if scan_options is None:
+        scan_options = {}
+    if scan_options.get('compact', False):
+        table = hash_table_of_files(prnt_debug, path_to_search, scan_options, previous_snapshot, run_metrics, journal)
+        if scan_options.get('verify_every', 0) > 0:
+            verify_files(prnt_debug, table, previous_snapshot, scan_options, run_metrics)
+        return table
+    if previous_snapshot is None or not scan_options.get('incremental', False):
+        previous_snapshot = {}
+    paranoid_every = scan_options.get('paranoid_every', 0)
+    block_map_threshold = scan_options.get('block_map_threshold', 0)
+    block_map_size = scan_options.get('block_map_size', DEFAULT_BLOCK_MAP_SIZE)
+    start_time = time.time()
+
+    # first pass: crawl and stat, reusing previous hashes where allowed
+    list_of_entries = [] # [filename, file_stat, hash of file or None, runs since hash, block hashes or None]
+    list_of_filenames_to_hash = []
+    list_of_stats_to_hash = []
+    list_of_block_starts = []
+    with metrics.phase(run_metrics, 'crawl'):
+        for filename, file_stat, hash_of_file, runs_since_hash, list_of_blocks, previous_dict in crawl_files(
+                prnt_debug, path_to_search, scan_options, previous_snapshot, run_metrics, journal):
+            list_of_entries.append([filename, file_stat, hash_of_file, runs_since_hash, list_of_blocks])
+            if hash_of_file is not None:
+                continue
+            list_of_filenames_to_hash.append(filename)
+            list_of_stats_to_hash.append(file_stat)
+            if block_map_threshold > 0 and file_stat['size'] >= block_map_threshold:
+                list_of_block_starts.append(block_start_of_file(previous_dict, file_stat, block_map_size, paranoid_every))
+            else:
+                list_of_block_starts.append(None)
+    if run_metrics is not None:
+        run_metrics.count('hashes reused', len(list_of_entries) - len(list_of_filenames_to_hash))
+
+    # second pass: hash whatever could not be reused, in the order that suits the storage
+    list_of_order = list(range(len(list_of_filenames_to_hash)))
+    if scan_options.get('read_order', 'walk') != 'walk':
+        with metrics.phase(run_metrics, 'read order'):
+            list_of_order = io_scheduler.read_order(prnt_debug, list_of_filenames_to_hash, list_of_stats_to_hash,
+                                                    scan_options['read_order'])
+    on_result = None
+    if journal is not None:
+        def on_result(position, result):
+            indx = list_of_order[position]
+            got_hash, hash_of_file, _, list_of_blocks = result
+            journal.finish(list_of_filenames_to_hash[indx],
+                           file_record(list_of_filenames_to_hash[indx], list_of_stats_to_hash[indx], hash_of_file, 0,
+                                       list_of_blocks) if got_hash else None)
+    with metrics.phase(run_metrics, 'hash'):
+        list_of_ordered_results = hash_files([list_of_filenames_to_hash[indx] for indx in list_of_order], scan_options,
+                                             [list_of_block_starts[indx] for indx in list_of_order], run_metrics,
+                                             on_result=on_result)
+    list_of_results = [None]*len(list_of_order)
+    for result, indx in zip(list_of_ordered_results, list_of_order):
+        list_of_results[indx] = result
+    total_bytes_hashed = 0
+    result_indx = 0
     list_of_dicts = []
-    # https://stackoverflow.com/questions/2186525/use-a-glob-to-find-files-recursively-in-python
-    # glob doesn't support hidden directories :(
-
-    for filename in glob.iglob(path_to_search+'/**/*', recursive=True):
-        if os.path.isfile(filename): 
-            got_hash, hash_of_file = md5_file(filename)
-            if got_hash:
-                file_dict = {}
-                file_dict['full path'] = filename
-                file_dict['hash of file'] = hash_of_file
-                if prnt_debug: print(filename, hash_of_file)
-                list_of_dicts.append(file_dict)
+    for filename, file_stat, hash_of_file, runs_since_hash, list_of_blocks in list_of_entries:
+        if hash_of_file is None:
+            got_hash, hash_of_file, bytes_hashed, list_of_blocks = list_of_results[result_indx]
+            result_indx += 1
+            total_bytes_hashed += bytes_hashed
+            if not got_hash:
+                count_unhashed(run_metrics, filename)
+                continue
+        file_dict = file_record(filename, file_stat, hash_of_file, runs_since_hash, list_of_blocks)
+        if prnt_debug: print(filename, hash_of_file, 'reused' if runs_since_hash else 'hashed')
+        list_of_dicts.append(file_dict)
+    if prnt_debug:
+        elapsed = time.time() - start_time
+        print('hashed', total_bytes_hashed, 'bytes in', round(elapsed, 3), 'seconds',
+              '('+str(round(total_bytes_hashed/max(elapsed, 1e-9)/1e6, 1))+' MB/s)')
+    if scan_options.get('verify_every', 0) > 0:
+        verify_files(prnt_debug, list_of_dicts, previous_snapshot, scan_options, run_metrics)
     return list_of_dicts
 
+def hash_table_of_files(prnt_debug, path_to_search, scan_options, previous_snapshot=None, run_metrics=None,
+                        journal=None):
+    """
+    hash_list_of_files, with the records held as a path_table.PathTable instead of a list of dicts.
+    A row is added as soon as the walk finds a file; the files that need hashing are then hashed
+    COMPACT_HASH_BATCH at a time, so only one batch has its full paths built (and the read order applies within a batch).
+    previous_snapshot is a dict of full path: record or a PathTable, see load_previous_snapshot
+    """
+    if previous_snapshot is None or not scan_options.get('incremental', False):
+        previous_snapshot = {}
+    paranoid_every = scan_options.get('paranoid_every', 0)
+    block_map_threshold = scan_options.get('block_map_threshold', 0)
+    block_map_size = scan_options.get('block_map_size', DEFAULT_BLOCK_MAP_SIZE)
+    start_time = time.time()
+
+    table = path_table.PathTable()
+    rows_to_hash = array.array('q')
+    dict_of_block_starts = {} # row: (start_block, list_of_known_blocks), for files that get a block map
+    with metrics.phase(run_metrics, 'crawl'):
+        for filename, file_stat, hash_of_file, runs_since_hash, list_of_blocks, previous_dict in crawl_files(
+                prnt_debug, path_to_search, scan_options, previous_snapshot, run_metrics, journal):
+            if hash_of_file is not None:
+                table.add(filename, hash_of_file, file_stat, runs_since_hash, list_of_blocks)
+                if prnt_debug: print(filename, hash_of_file, 'reused')
+                continue
+            row = table.add(filename, None, file_stat, 0)
+            rows_to_hash.append(row)
+            if block_map_threshold > 0 and file_stat['size'] >= block_map_threshold:
+                dict_of_block_starts[row] = block_start_of_file(previous_dict, file_stat, block_map_size, paranoid_every)
+    if run_metrics is not None:
+        run_metrics.count('hashes reused', len(table) - len(rows_to_hash))
+
+    total_bytes_hashed = 0
+    set_of_failed = set()
+    for batch_start in range(0, len(rows_to_hash), COMPACT_HASH_BATCH):
+        list_of_rows = rows_to_hash[batch_start:batch_start+COMPACT_HASH_BATCH].tolist()
+        list_of_filenames = [table.full_path(row) for row in list_of_rows]
+        list_of_order = list(range(len(list_of_rows)))
+        if scan_options.get('read_order', 'walk') != 'walk':
+            with metrics.phase(run_metrics, 'read order'):
+                list_of_stats = [{'device': table.devices[row], 'inode': table.inodes[row]} for row in list_of_rows]
+                list_of_order = io_scheduler.read_order(prnt_debug, list_of_filenames, list_of_stats,
+                                                        scan_options['read_order'])
+        on_result = None
+        if journal is not None:
+            def on_result(position, result):
+                indx = list_of_order[position]
+                got_hash, hash_of_file, _, list_of_blocks = result
+                file_stat = table.record(list_of_rows[indx], STAT_KEYS)
+                journal.finish(list_of_filenames[indx],
+                               file_record(list_of_filenames[indx], file_stat, hash_of_file, 0, list_of_blocks)
+                               if got_hash else None)
+        with metrics.phase(run_metrics, 'hash'):
+            list_of_results = hash_files([list_of_filenames[indx] for indx in list_of_order], scan_options,
+                                         [dict_of_block_starts.get(list_of_rows[indx]) for indx in list_of_order],
+                                         run_metrics, on_result=on_result)
+        for (got_hash, hash_of_file, bytes_hashed, list_of_blocks), indx in zip(list_of_results, list_of_order):
+            total_bytes_hashed += bytes_hashed
+            if not got_hash:
+                count_unhashed(run_metrics, list_of_filenames[indx])
+                set_of_failed.add(list_of_rows[indx])
+                continue
+            table.set_digest(list_of_rows[indx], hash_of_file)
+            table.set_blocks(list_of_rows[indx], list_of_blocks)
+            if prnt_debug: print(list_of_filenames[indx], hash_of_file, 'hashed')
+    table.remove_rows(set_of_failed)
+    if prnt_debug:
+        elapsed = time.time() - start_time
+        print('hashed', total_bytes_hashed, 'bytes in', round(elapsed, 3), 'seconds',
+              '('+str(round(total_bytes_hashed/max(elapsed, 1e-9)/1e6, 1))+' MB/s)')
+    return table
+
+def verify_due(filename, verify_run, verify_every):
+    """
+    is filename due for a full rehash in run verify_run? Each file has a fixed slot in the cycle of verify_every runs
+    (from a hash of its path), so every run fully verifies about 1/verify_every of the tree, a different part each run
+
+    >>> sum(verify_due('/r/f'+str(indx), 3, 7) for indx in range(7000)) in range(800, 1200)
+    True
+    >>> [verify_due('/r/f', run, 7) for run in range(14)].count(True)
+    2
+    """
+    return (verify_run - shard_of_path(filename, verify_every)) % verify_every == 0
+
+def start_verify_run(scan_options, previous_header):
+    """
+    number this run in the verification cycle, one after the previous snapshot's;
+    previous sample hashes can only be compared when they were taken with the same sample size
+
+    >>> scan_options = {'verify_every': 7, 'sample_size': 65536}
+    >>> start_verify_run(scan_options, {'verify_run': 4, 'sample_size': 65536})
+    >>> scan_options['verify_run'], scan_options['compare_samples']
+    (5, True)
+    """
+    scan_options['verify_run'] = previous_header.get('verify_run', -1) + 1
+    scan_options['compare_samples'] = previous_header.get('sample_size') == scan_options['sample_size']
+
+def verify_files(prnt_debug, records, previous_snapshot, scan_options, run_metrics=None):
+    """
+    the tiered verification of scan_options['verify_every'], over the records of hash_list_of_files
+    (a list of dicts or a path_table.PathTable), which are updated in place:
+    * every file gets a quick check, a hash of sample_size bytes at its head, middle and tail ('sample hash')
+    * a file whose hash was reused from the previous snapshot is fully rehashed when verify_due says so,
+      or when its samples changed although its stat metadata did not
+    * 'last verified' (seconds since the epoch) is set for every fully hashed file; the others keep the previous one
+    A full rehash that disagrees with the previous digest while the stat metadata agrees is content that changed
+    behind the file system's back (bit rot, a tool that restores mtimes); it is reported and counted.
+    Files are checked COMPACT_HASH_BATCH at a time.
+    """
+    is_table = isinstance(records, path_table.PathTable)
+    now = int(time.time())
+    verify_every = scan_options['verify_every']
+    verify_run = scan_options.get('verify_run', 0)
+    compare_samples = scan_options.get('compare_samples', True)
+    if previous_snapshot is None:
+        previous_snapshot = {}
+
+    def get_record(indx):
+        return records.record(indx) if is_table else records[indx]
+
+    def set_values(indx, dict_of_values):
+        if is_table:
+            records.update_row(indx, dict_of_values)
+        else:
+            records[indx].update(dict_of_values)
+
+    number_verified = 0
+    for batch_start in range(0, len(records), COMPACT_HASH_BATCH):
+        list_of_indices = list(range(batch_start, min(batch_start + COMPACT_HASH_BATCH, len(records))))
+        list_of_filenames = [get_record(indx)['full path'] for indx in list_of_indices]
+        with metrics.phase(run_metrics, 'quick check'):
+            list_of_samples = hash_files(list_of_filenames, scan_options, None, run_metrics, sample_worker)
+        list_of_due = [] # (index, filename) of the files to rehash in full
+        for indx, filename, (got_hash, sample_hash, bytes_read, _) in zip(list_of_indices, list_of_filenames,
+                                                                          list_of_samples):
+            if not got_hash:
+                if run_metrics is not None: run_metrics.count('quick check errors')
+                continue
+            dict_of_values = {'sample hash': sample_hash}
+            if get_record(indx).get('runs since hash', 0) == 0:
+                # hashed in full by this run already
+                dict_of_values['last verified'] = now
+            else:
+                previous_dict = previous_snapshot.get(filename) or {}
+                if compare_samples and previous_dict.get('sample hash', sample_hash) != sample_hash:
+                    if run_metrics is not None: run_metrics.count('quick check mismatches')
+                    list_of_due.append((indx, filename))
+                elif verify_due(filename, verify_run, verify_every):
+                    list_of_due.append((indx, filename))
+                if 'last verified' in previous_dict:
+                    dict_of_values['last verified'] = previous_dict['last verified']
+            set_values(indx, dict_of_values)
+        list_of_block_starts = [(0, []) if 'block hashes' in get_record(indx) else None for indx, _ in list_of_due]
+        with metrics.phase(run_metrics, 'verify'):
+            list_of_results = hash_files([filename for _, filename in list_of_due], scan_options, list_of_block_starts,
+                                         run_metrics)
+        for (indx, filename), (got_hash, hash_of_file, bytes_hashed, list_of_blocks) in zip(list_of_due, list_of_results):
+            if not got_hash:
+                count_unhashed(run_metrics, filename)
+                continue
+            if hash_of_file != get_record(indx)['hash of file']:
+                print('WARNING: content changed without a change to size, mtime or inode:', filename)
+                if run_metrics is not None: run_metrics.count('verification failures')
+            dict_of_values = {'hash of file': hash_of_file, 'runs since hash': 0, 'last verified': now}
+            if list_of_blocks is not None:
+                dict_of_values['block hashes'] = list_of_blocks
+            set_values(indx, dict_of_values)
+            number_verified += 1
+    if run_metrics is not None: run_metrics.count('files verified', number_verified)
+    if prnt_debug: print('fully verified', number_verified, 'of', len(records), 'files')
+
 def write_list_of_dicts_to_json_file(prnt_debug, list_of_dicts, write_path, output_prefix):
     """
 
     >>> write_list_of_dicts_to_json_file(False,[{'hash of file'}:'asmaing'], '/path/to/write', 'logs')
     """
-    df = pandas.DataFrame(list_of_dicts)
+    return write_list_of_dicts_to_snapshot(prnt_debug, list_of_dicts, write_path, output_prefix, 'json')
+
+def write_shard_snapshot(prnt_debug, list_of_dicts, write_path, output_prefix, scan_options, header):
+    """
+    a partial snapshot of one shard, written to the shards directory under a name without a timestamp;
+    it is not listed in the catalog, and has no directory digests (merge_shards.py computes them over the whole tree)
+    returns the file name
+    """
+    shard_index, shard_count = scan_options['shard']
+    file_name = snapshot_io.shard_file_name(write_path, output_prefix, shard_index, shard_count, scan_options['format'])
+    os.makedirs(os.path.dirname(file_name), exist_ok=True)
+    snapshot_io.write_snapshot(prnt_debug, list_of_dicts, file_name, scan_options['format'], header)
+    return file_name
+
+def write_list_of_dicts_to_snapshot(prnt_debug, list_of_dicts, write_path, output_prefix, snapshot_format='json', header=None,
+                                    dict_of_directories=None):
+    """
+    snapshot_format is one of snapshot_io.SNAPSHOT_FORMATS; returns the file name
+    the snapshot is listed in the catalog of write_path once it is complete
+    """
+    if header is None:
+        header = {}
     # http://strftime.org/
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%dT%H-%M")
-    # https://pandas.pydata.org/pandas-docs/stable/reference/api/pandas.DataFrame.to_json.html
-    file_name = output_prefix+'_'+timestamp+'.json'
-    df.to_json(write_path+'/'+file_name, orient='records')
+    timestamp = datetime.datetime.now().strftime(snapshot_io.FILE_TIMESTAMP_FORMAT)
+    file_name = output_prefix+'_'+timestamp+snapshot_io.SNAPSHOT_FORMATS[snapshot_format]
+    number_written = snapshot_io.write_snapshot(prnt_debug, list_of_dicts, write_path+'/'+file_name, snapshot_format,
+                                                header, dict_of_directories)
+    snapshot_io.catalog_add(prnt_debug, write_path, write_path+'/'+file_name, output_prefix, header, number_written)
     return file_name
 
+def directory_hashes(iterable_of_dicts, path_to_search, hash_name='md5', digest_size=0):
+    """
+    a Merkle tree over the snapshot: the digest of a directory is the hash of the sorted
+    (type, name, digest) entries of its files and subdirectories.
+    Two directories with the same digest hold the same names and contents, wherever they are,
+    so a diff can skip an identical subtree or report a renamed folder as one event.
+
+    returns a dict that maps each directory path (path_to_search included) to its hex digest
+
+    >>> dict_of_directories = directory_hashes([{'full path': 'r/a/x', 'hash of file': '01'}, {'full path': 'r/b/x', 'hash of file': '01'}], 'r')
+    >>> dict_of_directories['r/a'] == dict_of_directories['r/b']
+    True
+    """
+    if isinstance(iterable_of_dicts, path_table.PathTable):
+        return directory_hashes_of_table(iterable_of_dicts, path_to_search, hash_name, digest_size)
+    root = path_to_search.rstrip('/') or '/'
+    dict_of_children = {} # directory path: list of (type, name, digest)
+    for file_dict in iterable_of_dicts:
+        dir_path, name = os.path.split(file_dict['full path'])
+        dict_of_children.setdefault(dir_path, []).append(('f', name, file_dict['hash of file']))
+    # directories that only hold subdirectories still need a node
+    for dir_path in list(dict_of_children.keys()):
+        while dir_path != root:
+            parent_path = os.path.dirname(dir_path)
+            if parent_path == dir_path:
+                break
+            if parent_path in dict_of_children:
+                break
+            dict_of_children[parent_path] = []
+            dir_path = parent_path
+
+    dict_of_directories = {}
+    # deepest first, so every subdirectory digest is known before its parent is hashed
+    for dir_path in sorted(dict_of_children.keys(), key=lambda dir_path: dir_path.count('/'), reverse=True):
+        hash_obj = new_hash_object(hash_name, digest_size)
+        for entry_type, name, digest in sorted(dict_of_children[dir_path]):
+            hash_obj.update((entry_type+'\0'+name+'\0'+digest+'\n').encode('utf-8', 'surrogateescape'))
+        dict_of_directories[dir_path] = hash_obj.hexdigest()
+        parent_path, name = os.path.split(dir_path)
+        if dir_path != root and parent_path != dir_path and parent_path in dict_of_children:
+            dict_of_children[parent_path].append(('d', name, dict_of_directories[dir_path]))
+    return dict_of_directories
+
+def directory_hashes_of_sorted(iterable_of_dicts, path_to_search, hash_name='md5', digest_size=0):
+    """
+    directory_hashes for records that arrive in 'full path' order (snapshot_io.iter_sorted_records),
+    without holding them: the subtree of a directory is one contiguous run of that order,
+    so only the directories from the root down to the current record are open at a time
+
+    >>> list_of_dicts = [{'full path': path, 'hash of file': '01'} for path in ['r/a-b', 'r/a/b/x', 'r/a/x', 'r/c/d/x']]
+    >>> directory_hashes_of_sorted(list_of_dicts, 'r') == directory_hashes(list_of_dicts, 'r')
+    True
+    """
+    root = path_to_search.rstrip('/') or '/'
+    list_of_open = [] # [directory path, list of (type, name, digest)], each a subdirectory of the one before
+    dict_of_directories = {}
+
+    def close_directory():
+        dir_path, list_of_entries = list_of_open.pop()
+        hash_obj = new_hash_object(hash_name, digest_size)
+        for entry_type, name, digest in sorted(list_of_entries):
+            hash_obj.update((entry_type+'\0'+name+'\0'+digest+'\n').encode('utf-8', 'surrogateescape'))
+        dict_of_directories[dir_path] = hash_obj.hexdigest()
+        parent_path, name = os.path.split(dir_path)
+        if dir_path != root and len(list_of_open) > 0 and list_of_open[-1][0] == parent_path:
+            list_of_open[-1][1].append(('d', name, dict_of_directories[dir_path]))
+
+    for file_dict in iterable_of_dicts:
+        dir_path, name = os.path.split(file_dict['full path'])
+        while len(list_of_open) > 0 and not (dir_path == list_of_open[-1][0]
+                                             or dir_path.startswith(list_of_open[-1][0].rstrip('/')+'/')):
+            close_directory()
+        # open the directories between the innermost open one (or the root) and this one
+        list_of_new = []
+        while len(list_of_open) == 0 or dir_path != list_of_open[-1][0]:
+            list_of_new.append(dir_path)
+            parent_path = os.path.dirname(dir_path)
+            if dir_path == root or parent_path == dir_path:
+                break
+            dir_path = parent_path
+        list_of_open.extend([new_path, []] for new_path in reversed(list_of_new))
+        list_of_open[-1][1].append(('f', name, file_dict['hash of file']))
+    while len(list_of_open) > 0:
+        close_directory()
+    return dict_of_directories
+
+def directory_hashes_of_table(table, path_to_search, hash_name='md5', digest_size=0):
+    """
+    directory_hashes for a path_table.PathTable, the same digests worked out one directory at a time
+    from the rows of each directory, instead of gathering an entry for every file first
+
+    >>> table = path_table.from_records([{'full path': 'r/a/x', 'hash of file': '01'}, {'full path': 'r/b/x', 'hash of file': '01'}])
+    >>> directory_hashes_of_table(table, 'r') == directory_hashes(list(table), 'r')
+    True
+    """
+    root = path_to_search.rstrip('/') or '/'
+    dict_of_dir_rows = table.rows_by_directory()
+    set_of_dirs = set(table.list_of_dirs[dir_id] for dir_id in dict_of_dir_rows)
+    # directories that only hold subdirectories still need a node
+    for dir_path in list(set_of_dirs):
+        while dir_path != root:
+            parent_path = os.path.dirname(dir_path)
+            if parent_path == dir_path or parent_path in set_of_dirs:
+                break
+            set_of_dirs.add(parent_path)
+            dir_path = parent_path
+
+    dict_of_subdirs = {} # directory path: list of ('d', name, digest)
+    dict_of_directories = {}
+    for dir_path in sorted(set_of_dirs, key=lambda dir_path: dir_path.count('/'), reverse=True):
+        list_of_entries = dict_of_subdirs.pop(dir_path, [])
+        for row in dict_of_dir_rows.get(table.dict_of_dir_ids.get(dir_path), []):
+            list_of_entries.append(('f', table.names[row], table.hash_of_file(row)))
+        hash_obj = new_hash_object(hash_name, digest_size)
+        for entry_type, name, digest in sorted(list_of_entries):
+            hash_obj.update((entry_type+'\0'+name+'\0'+digest+'\n').encode('utf-8', 'surrogateescape'))
+        dict_of_directories[dir_path] = hash_obj.hexdigest()
+        parent_path, name = os.path.split(dir_path)
+        if dir_path != root and parent_path != dir_path and parent_path in set_of_dirs:
+            dict_of_subdirs.setdefault(parent_path, []).append(('d', name, dict_of_directories[dir_path]))
+    return dict_of_directories
+
+def snapshot_header(path_to_search, scan_options):
+    """
+    how the snapshot was made; readers use 'hash' and 'digest_size' to decide whether two snapshots are comparable
+    """
+    hash_name, digest_size, block_map_size, block_map_threshold = hash_settings(scan_options)
+    header = {'search path': path_to_search,
+              'created': datetime.datetime.now().isoformat(timespec='seconds'),
+              'hash': hash_name,
+              'digest_size': digest_size,
+              'block_map_size': block_map_size,
+              'block_map_threshold': block_map_threshold}
+    if scan_options.get('verify_every', 0) > 0:
+        header['verify_every'] = scan_options['verify_every']
+        header['sample_size'] = scan_options['sample_size']
+        header['verify_run'] = scan_options.get('verify_run', 0)
+    if scan_options.get('shard') is not None:
+        header['shard'] = scan_options['shard']
+        header['shard_by'] = scan_options['shard_by']
+    return header
+
+def journal_header(path_to_search, scan_options):
+    """
+    what the journal of an interrupted scan has to match to be resumed: the same tree, walked and hashed the same way
+    """
+    return {'search path': path_to_search,
+            'hash settings': list(hash_settings(scan_options)),
+            'excludes': scan_options.get('excludes', []),
+            'shard': scan_options.get('shard'),
+            'shard_by': scan_options.get('shard_by', 'top')}
+
+def stop_on_sigterm(signum, frame):
+    """
+    exit as on Ctrl-C, so the journal is checkpointed on the way out
+    """
+    sys.exit(128 + signum)
+
+def start_journal(prnt_debug, path_to_search, write_path, output_prefix, scan_options):
+    """
+    the scan_journal.ScanJournal of this run with --checkpoint_every or --resume, otherwise None
+    """
+    if scan_options.get('checkpoint_every', 0) == 0 and not scan_options.get('resume', False):
+        return None
+    signal.signal(signal.SIGTERM, stop_on_sigterm)
+    file_name = scan_journal.journal_file_name(write_path, output_prefix, scan_options.get('shard'))
+    if prnt_debug: print('journal:', file_name)
+    return scan_journal.open_journal(prnt_debug, file_name, journal_header(path_to_search, scan_options),
+                                     scan_options.get('resume', False),
+                                     scan_options.get('checkpoint_every', 0) or scan_journal.DEFAULT_CHECKPOINT_SECONDS)
+
 
 if __name__ == '__main__':
 
-    prnt_debug, path_to_search, write_path, output_prefix = args_use(sys.argv)
-    list_of_dicts = hash_list_of_files(prnt_debug, path_to_search)
-    current_json_file = write_list_of_dicts_to_json_file(prnt_debug, list_of_dicts, write_path, output_prefix)
+    prnt_debug, path_to_search, write_path, output_prefix, scan_options = args_use(sys.argv)
+    run_metrics = metrics.start_metrics(prnt_debug, metrics.parse_args(sys.argv), 'change_tracker')
+    previous_snapshot = {}
+    if scan_options['incremental']:
+        with metrics.phase(run_metrics, 'load previous'):
+            previous_snapshot = load_previous_snapshot(prnt_debug, write_path, output_prefix, scan_options)
+    if scan_options['verify_every'] > 0:
+        list_of_previous = snapshot_io.latest_snapshots(prnt_debug, write_path, 1, output_prefix)
+        start_verify_run(scan_options, snapshot_io.read_snapshot_header(list_of_previous[0])
+                                       if len(list_of_previous) > 0 else {})
+    journal = start_journal(prnt_debug, path_to_search, write_path, output_prefix, scan_options)
+    try:
+        list_of_dicts = hash_list_of_files(prnt_debug, path_to_search, scan_options, previous_snapshot, run_metrics,
+                                           journal)
+    finally:
+        if journal is not None: journal.close()
+    if scan_options['shard'] is not None:
+        with metrics.phase(run_metrics, 'write'):
+            shard_file = write_shard_snapshot(prnt_debug, list_of_dicts, write_path, output_prefix, scan_options,
+                                              snapshot_header(path_to_search, scan_options))
+        if journal is not None: journal.remove()
+        print('wrote', shard_file)
+        sys.exit(0)
+    with metrics.phase(run_metrics, 'directory hashes'):
+        dict_of_directories = directory_hashes(list_of_dicts, path_to_search, scan_options['hash'], scan_options['digest_size'])
+    with metrics.phase(run_metrics, 'write'):
+        current_json_file = write_list_of_dicts_to_snapshot(prnt_debug, list_of_dicts, write_path, output_prefix,
+                                                            scan_options['format'], snapshot_header(path_to_search, scan_options),
+                                                            dict_of_directories)
+    if journal is not None: journal.remove()
+    if scan_options['index']:
+        with metrics.phase(run_metrics, 'index'):
+            history_index.update_index(prnt_debug, write_path)
  
 
@@ -9,6 +9,25 @@ python3 diff_changes.py --path_to_json="/home/jovyan/tmp"
 
 python3 diff_changes.py --path_to_json="/home/jovyan/tmp" --debug
 
+for snapshots larger than RAM, merge-join the two snapshots in path order within a memory budget (in MB):
+python3 diff_changes.py --path_to_json="/home/jovyan/tmp" --streaming --memory_budget="256"
+
+timeline of a range of snapshots, each read once: the changes of every interval, then a net summary
+(net adds, deletes and changes, files changed k times, files that flapped back to an earlier state):
+python3 diff_changes.py --path_to_json="/home/jovyan/tmp" --timeline="7"
+
+python3 diff_changes.py --path_to_json="/home/jovyan/tmp" --since="2019-11-01" --until="2019-11-30" --summary_only
+
+for snapshots of millions of files, hold both as path tables (see path_table.py) rather than dicts of full paths:
+python3 diff_changes.py --path_to_json="/home/jovyan/tmp" --compact
+
+time each phase of the diff, or profile it (see metrics.py):
+python3 diff_changes.py --path_to_json="/home/jovyan/tmp" --metrics="diff_metrics.json" --profile="diff.prof"
+
+Snapshots hashed with different algorithms (see the snapshot header) are not compared by hash;
+the comparison falls back to stat metadata (size, mtime_ns, inode, device) when both snapshots have it,
+and refuses otherwise.
+
 ********************
 # https://docs.python.org/3/library/profile.html
 python -m cProfile -s time change_tracker.py --path="/home/jovyan/tmp" | head -n 100
@@ -59,9 +78,13 @@ import glob
 import sys
 import os
 import hashlib # hash of file
-import pandas
-#import change_tracker as ct
-import numpy as np
+import change_tracker as ct
+import shutil # remove the spill directory
+import sqlite3 # spill-to-disk table for the streaming diff
+import tempfile
+import snapshot_io
+import metrics
+import path_table
 
 def parse_args(list_of_args):
     """
@@ -75,9 +98,27 @@ def parse_args(list_of_args):
     path_to_json = '.'
     path_to_output = '.'
     email_addr = 'none'
+    diff_options = {'streaming': False, 'memory_budget': '256', 'compact': False,
+                    'timeline': '0', 'since': '', 'until': '', 'summary_only': False, 'output_prefix': 'log'}
     for arg in list_of_args:
         if '--debug' in arg:
             prnt_debug = True
+        elif '--streaming' in arg:
+            diff_options['streaming'] = True
+        elif '--compact' in arg:
+            diff_options['compact'] = True
+        elif '--memory_budget' in arg:
+            diff_options['memory_budget'] = arg.replace('--memory_budget=', '')
+        elif '--timeline' in arg:
+            diff_options['timeline'] = arg.replace('--timeline=', '')
+        elif '--since' in arg:
+            diff_options['since'] = arg.replace('--since=', '')
+        elif '--until' in arg:
+            diff_options['until'] = arg.replace('--until=', '')
+        elif '--summary_only' in arg:
+            diff_options['summary_only'] = True
+        elif '--output_prefix' in arg:
+            diff_options['output_prefix'] = arg.replace('--output_prefix=', '')
         elif '--path_to_json' in arg:
             path_to_json = arg.replace('--path_to_json=', '')
         elif '--path_to_ouput' in arg:
@@ -88,7 +129,19 @@ def parse_args(list_of_args):
         raise Exception('ERROR: provided json path does not exist:', path_to_json)
     if not os.path.exists(path_to_output):
         raise Exception('ERROR: provided output path does not exist:', path_to_output)
-    return prnt_debug, path_to_json, path_to_output, email_addr
+    try:
+        diff_options['memory_budget'] = int(diff_options['memory_budget'])
+    except ValueError:
+        raise Exception('ERROR: memory_budget must be an integer number of MB:', diff_options['memory_budget'])
+    if diff_options['memory_budget'] < 1:
+        raise Exception('ERROR: memory_budget must be at least 1 MB')
+    try:
+        diff_options['timeline'] = int(diff_options['timeline'])
+    except ValueError:
+        raise Exception('ERROR: timeline must be an integer number of snapshots:', diff_options['timeline'])
+    if diff_options['timeline'] == 1 or diff_options['timeline'] < 0:
+        raise Exception('ERROR: a timeline needs at least 2 snapshots')
+    return prnt_debug, path_to_json, path_to_output, email_addr, diff_options
 
 def args_use(list_of_args):
     """
@@ -98,6 +151,7 @@ def args_use(list_of_args):
     """
     prnt_debug = False
     path_to_search = ''
+    diff_options = {}
     if len(list_of_args) == 1:
         print('invalid number of arguments')
         print('required argument:')
@@ -105,87 +159,109 @@ def args_use(list_of_args):
         print('--path_to_output="/path/to/write"')
         print('--email="my_name@domain.com"')
         print('optional argument:')
+        print('--output_prefix="log" (the snapshots written with this prefix)')
+        print('--streaming')
+        print('--memory_budget="256"')
+        print('--compact')
+        print('--timeline="7" (the newest 7 snapshots)')
+        print('--since="2019-11-01" --until="2019-11-30" (a timeline of the snapshots in that range)')
+        print('--summary_only')
+        print('--metrics="diff_metrics.json"')
+        print('--profile="diff.prof"')
         print('--debug')
         sys.exit(1) # https://stackoverflow.com/questions/6501121/difference-between-exit-and-sys-exit-in-python
     elif len(list_of_args) > 1:
-        prnt_debug, path_to_json, path_to_output, email_addr = parse_args(list_of_args)
+        prnt_debug, path_to_json, path_to_output, email_addr, diff_options = parse_args(list_of_args)
     else:
         raise Exception('invalid option')
-    return prnt_debug, path_to_json, path_to_output, email_addr
+    return prnt_debug, path_to_json, path_to_output, email_addr, diff_options
 
-def get_latest_json(prnt_debug, list_of_json):
+def events_dataframe(status, old_path, new_path, old_hash, new_hash):
     """
-    which json file is the latest and which json file is the second latest?
-    >>> get_latest_json(False, ['file1.json', 'file2.json'])
+    a DataFrame of change events with EVENT_COLUMNS; each argument is a Series (or None)
     """
-    import string
-    dict_of_times = {}
-    for json_file in list_of_json:
-        # https://stackoverflow.com/questions/1450897/remove-characters-except-digits-from-string-using-python
-        date_to_parse = json_file.replace('.json', '').replace('_', '').replace('/','').replace('.','').translate(str.maketrans('', '', string.ascii_letters))
-        dict_of_times[json_file] = datetime.datetime.strptime(date_to_parse, "%Y-%m-%d%H-%M")
-    # https://www.w3resource.com/python-exercises/dictionary/python-data-type-dictionary-exercise-15.php
-    latest_json_file = max(dict_of_times.keys(), key=(lambda k: dict_of_times[k]))
-    del dict_of_times[latest_json_file]
-    second_latest_json_file = max(dict_of_times.keys(), key=(lambda k: dict_of_times[k]))
-    if prnt_debug: print('latest:', latest_json_file)
-    if prnt_debug: print('second latest:', second_latest_json_file)
-    return latest_json_file, second_latest_json_file
+    import pandas # only the DataFrame functions need it
+    df_events = pandas.DataFrame({'old path': old_path, 'new path': new_path,
+                                  'old hash': old_hash, 'new hash': new_hash})
+    df_events.insert(0, 'status', status)
+    return df_events[EVENT_COLUMNS].reset_index(drop=True)
 
+def df_comparison_unchanged_files(prnt_debug, df_previous, df_current):
+    """
+    drop rows whose path and hash are the same in both snapshots
+
+    >>> import pandas
+    >>> df_previous = pandas.DataFrame([['/a', '1'], ['/b', '2']], columns=('full path', 'hash of file'))
+    >>> df_current  = pandas.DataFrame([['/a', '1'], ['/b', '3']], columns=('full path', 'hash of file'))
+    >>> df_comparison_unchanged_files(False, df_previous, df_current)[1]
+      full path hash of file
+    0        /b            3
+    """
+    import pandas # only the DataFrame functions need it
+    # https://pandas.pydata.org/pandas-docs/stable/user_guide/merging.html
+    df_merged = pandas.merge(df_current, df_previous, on=['full path', 'hash of file'],
+                             how='outer', indicator=True)
+    df_current = df_merged[df_merged['_merge'] == 'left_only'][['full path', 'hash of file']].reset_index(drop=True)
+    df_previous = df_merged[df_merged['_merge'] == 'right_only'][['full path', 'hash of file']].reset_index(drop=True)
+    if prnt_debug: print('unchanged files:', int((df_merged['_merge'] == 'both').sum()))
+    return df_previous, df_current
 
 def df_comparison_changed_files(prnt_debug, df_previous, df_current):
     """
-    >>> df_previous = pandas.DataFrame(['/adfm/gasg', 'gmig9jiga'],
+    file changed:  same path, different hash
+
+    returns the remaining df_previous and df_current, and a DataFrame of 'changed' events
+
+    >>> import pandas
+    >>> df_previous = pandas.DataFrame([['/adfm/gasg', 'gmig9jiga']],
     ...                                columns=('full path', 'hash of file'))
-    >>> df_current  = pandas.DataFrame(['/mg/gadfgsg', 'imginag'],
+    >>> df_current  = pandas.DataFrame([['/adfm/gasg', 'imginag']],
     ...                                columns=('full path', 'hash of file'))
-    >>> df_comparison_changed_files(False, df_previous, df_current)
-
+    >>> df_comparison_changed_files(False, df_previous, df_current)[2]
+        status    old path    new path   old hash new hash
+    0  changed  /adfm/gasg  /adfm/gasg  gmig9jiga  imginag
     """
-    list_of_changed_hashes = []
-    df_changed_hash = pandas.merge(df_current, df_previous,
-                                   on='full path', how='outer', indicator=True,
-                                   suffixes=['_current', '_previous'])
-    df_both = df_changed_hash[df_changed_hash['_merge'] == 'both']
-    df_altered = df_both[df_both['hash of file_current'] != df_both['hash of file_previous']]
-
-    if df_altered.shape[0] > 0:
-        print('changed files:')
-        for index, row in df_altered.iterrows():
-            print(row['full path'])
-
-            df_current = df_current[df_current['full path'] != row['full path']]
-            df_previous = df_previous[df_previous['full path'] != row['full path']]
-
-#            list_of_changed_hashes.append(row['hash of file_current'])
-#            list_of_changed_hashes.append(row['hash of file_previous'])
-    return df_previous, df_current
+    import pandas # only the DataFrame functions need it
+    df_both = pandas.merge(df_current, df_previous, on='full path', how='inner',
+                           suffixes=['_current', '_previous'])
+    df_altered = df_both[df_both['hash of file_current'] != df_both['hash of file_previous']].sort_values('full path')
+    df_events = events_dataframe('changed', df_altered['full path'], df_altered['full path'],
+                                 df_altered['hash of file_previous'], df_altered['hash of file_current'])
+
+    # one anti-join per side removes every changed path at once
+    df_current = df_current[~df_current['full path'].isin(df_altered['full path'])]
+    df_previous = df_previous[~df_previous['full path'].isin(df_altered['full path'])]
+    return df_previous, df_current, df_events
 
 def df_comparison_moved_files(prnt_debug, df_previous, df_current):
     """
     file moved, aka renamed:    same hash,    changed path
+
+    When several files share a hash, the k-th previous path (in sorted order) pairs with the k-th current path.
+    returns the remaining df_previous and df_current, and a DataFrame of 'moved' events
      
-    >>> df_comparison_moved_files(False, ) 
+    >>> import pandas
+    >>> df_previous = pandas.DataFrame([['/a/b/c', '1234']], columns=('full path', 'hash of file'))
+    >>> df_current  = pandas.DataFrame([['/p/t/f', '1234']], columns=('full path', 'hash of file'))
+    >>> df_comparison_moved_files(False, df_previous, df_current)[2]
+      status old path new path old hash new hash
+    0  moved   /a/b/c   /p/t/f     1234     1234
     """
-    df_merged_hash = pandas.merge(df_current, df_previous, 
-                                  on='hash of file', how='outer', indicator=True, 
-                                  suffixes=['_current', '_previous'])
-    df_both = df_merged_hash[df_merged_hash['_merge'] == 'both']
-
-    df_moved = df_both[df_both['full path_current'] != df_both['full path_previous']]
-
-    list_of_moved_hashes = []
-    if df_moved.shape[0] > 0:
-        print("== moved files ==")
-        # https://stackoverflow.com/questions/16476924/how-to-iterate-over-rows-in-a-dataframe-in-pandas
-        for index, row in df_moved.iterrows():
-            print(row['full path_previous'], '-->', row['full path_current'])
-
-            df_current = df_current[df_current['full path'] != row['full path_current']]
-            df_previous = df_previous[df_previous['full path'] != row['full path_previous']]
-
-#            list_of_moved_hashes.append(row['hash of file'])
-    return df_previous, df_current
+    import pandas # only the DataFrame functions need it
+    df_previous_ranked = df_previous.sort_values(['hash of file', 'full path'])
+    df_previous_ranked = df_previous_ranked.assign(rank=df_previous_ranked.groupby('hash of file').cumcount())
+    df_current_ranked = df_current.sort_values(['hash of file', 'full path'])
+    df_current_ranked = df_current_ranked.assign(rank=df_current_ranked.groupby('hash of file').cumcount())
+
+    df_moved = pandas.merge(df_current_ranked, df_previous_ranked, on=['hash of file', 'rank'], how='inner',
+                            suffixes=['_current', '_previous'])
+    df_moved = df_moved[df_moved['full path_current'] != df_moved['full path_previous']]
+    df_events = events_dataframe('moved', df_moved['full path_previous'], df_moved['full path_current'],
+                                 df_moved['hash of file'], df_moved['hash of file'])
+
+    df_current = df_current[~df_current['full path'].isin(df_moved['full path_current'])]
+    df_previous = df_previous[~df_previous['full path'].isin(df_moved['full path_previous'])]
+    return df_previous, df_current, df_events
 
 def df_comparison_new_and_deleted_files(prnt_debug, df_previous, df_current):
     """
@@ -193,86 +269,752 @@ def df_comparison_new_and_deleted_files(prnt_debug, df_previous, df_current):
     # file added:    new hash,       new path
     # file removed:  missing hash, missing path
 
-    >>> df_comparison_new_and_deleted_files(False)
+    returns a DataFrame of 'added' and 'deleted' events
+
+    >>> import pandas
+    >>> df_previous = pandas.DataFrame([['/ag/ggn', '9g9248']], columns=('full path', 'hash of file'))
+    >>> df_current  = pandas.DataFrame([['/pa/to/fi', '992d']], columns=('full path', 'hash of file'))
+    >>> df_comparison_new_and_deleted_files(False, df_previous, df_current)
+        status old path   new path old hash new hash
+    0    added     None  /pa/to/fi     None     992d
+    1  deleted  /ag/ggn       None   9g9248     None
     """
+    import pandas # only the DataFrame functions need it
     # https://pandas.pydata.org/pandas-docs/stable/user_guide/merging.html
-    # only merge rows when all three columns match
+    # only merge rows when both columns match
     df_merged_all = pandas.merge(df_current, df_previous, 
                                  on=['hash of file', 'full path'], 
-                                 how='outer', indicator=True, 
-                                 suffixes=['_current', '_previous'])
+                                 how='outer', indicator=True)
 
-    df_new_files     = df_merged_all[df_merged_all['_merge'] == 'left_only']
-    df_deleted_files = df_merged_all[df_merged_all['_merge'] == 'right_only']
+    df_new_files     = df_merged_all[df_merged_all['_merge'] == 'left_only'].sort_values('full path')
+    df_deleted_files = df_merged_all[df_merged_all['_merge'] == 'right_only'].sort_values('full path')
 
-    if df_new_files.shape[0] > 0:
-        print('== new files ==')
-        # https://stackoverflow.com/questions/16476924/how-to-iterate-over-rows-in-a-dataframe-in-pandas
-        for index, row in df_new_files.iterrows():
-            print(row['full path'])
+    df_new_events = events_dataframe('added', None, df_new_files['full path'], None, df_new_files['hash of file'])
+    df_deleted_events = events_dataframe('deleted', df_deleted_files['full path'], None,
+                                         df_deleted_files['hash of file'], None)
+    return pandas.concat([df_new_events, df_deleted_events], ignore_index=True)
 
-    if df_deleted_files.shape[0] > 0:
-        print('== deleted files ==')
-        # https://stackoverflow.com/questions/16476924/how-to-iterate-over-rows-in-a-dataframe-in-pandas
-        for index, row in df_deleted_files.iterrows():
-            print(row['full path'])
-    return
+def diff_dataframes(prnt_debug, df_previous, df_current):
+    """
+    classify every difference between two snapshots; returns a DataFrame with EVENT_COLUMNS
+    The DataFrame counterpart of diff_records, for analysis in pandas; the command line uses diff_records.
+
+    Sequence of analysis: unchanged, changed, moved, added or deleted.
+    Each stage removes the rows it classified with a single anti-join, so the cost is linear in
+    the snapshot size however many files changed.
+    """
+    import pandas # only the DataFrame functions need it
+    list_of_columns = ['full path', 'hash of file']
+    df_previous = df_previous[list_of_columns]
+    df_current = df_current[list_of_columns]
+    df_previous, df_current = df_comparison_unchanged_files(prnt_debug, df_previous, df_current)
+    df_previous, df_current, df_changed = df_comparison_changed_files(prnt_debug, df_previous, df_current)
+    df_previous, df_current, df_moved = df_comparison_moved_files(prnt_debug, df_previous, df_current)
+    df_added_deleted = df_comparison_new_and_deleted_files(prnt_debug, df_previous, df_current)
+    return pandas.concat([df_changed, df_moved, df_added_deleted], ignore_index=True)
+
+def diff_records(prnt_debug, iterable_of_previous, iterable_of_current):
+    """
+    classify every difference between two snapshots of {'full path', 'hash of file'} records
+    (see comparison_records); returns a list of (status, old path, new path, old hash, new hash) events,
+    in the same order as dataframe_to_events(diff_dataframes(...)). Only the standard library is used.
+
+    The previous snapshot is held as one dict of path: hash; the current one is streamed past it.
+
+    >>> diff_records(False, [{'full path': '/a', 'hash of file': '1'}, {'full path': '/b', 'hash of file': '2'}],
+    ...                     [{'full path': '/a', 'hash of file': '3'}, {'full path': '/c', 'hash of file': '2'}])
+    [('changed', '/a', '/a', '1', '3'), ('moved', '/b', '/c', '2', '2')]
+    """
+    dict_of_previous = {}
+    for file_dict in iterable_of_previous:
+        dict_of_previous[file_dict['full path']] = file_dict['hash of file']
+    return diff_against_previous(prnt_debug, dict_of_previous, iterable_of_current)
+
+def diff_against_previous(prnt_debug, dict_of_previous, iterable_of_current, dict_of_current=None):
+    """
+    diff_records with the previous snapshot already held as a dict of path: hash, which is used up.
+    When dict_of_current is given, the current records are collected into it as they stream past,
+    ready to be the previous snapshot of the next diff in a timeline.
+    """
+    list_of_changed = []
+    dict_of_added = {} # hash: list of paths
+    number_unchanged = 0
+    for file_dict in iterable_of_current:
+        this_path = file_dict['full path']
+        new_hash = file_dict['hash of file']
+        if dict_of_current is not None:
+            dict_of_current[this_path] = new_hash
+        old_hash = dict_of_previous.pop(this_path, None)
+        if old_hash is None:
+            dict_of_added.setdefault(new_hash, []).append(this_path)
+        elif old_hash == new_hash:
+            number_unchanged += 1
+        else:
+            list_of_changed.append(('changed', this_path, this_path, old_hash, new_hash))
+    if prnt_debug: print('unchanged files:', number_unchanged)
+    # whatever is left of the previous snapshot was deleted, or moved
+    dict_of_deleted = {}
+    for this_path, old_hash in dict_of_previous.items():
+        dict_of_deleted.setdefault(old_hash, []).append(this_path)
+    dict_of_previous = None
+
+    # the k-th deleted path with a given hash pairs with the k-th added path with that hash
+    list_of_moved = []
+    for this_hash in sorted(set(dict_of_deleted.keys()) & set(dict_of_added.keys())):
+        list_of_old = sorted(dict_of_deleted[this_hash])
+        list_of_new = sorted(dict_of_added[this_hash])
+        number_moved = min(len(list_of_old), len(list_of_new))
+        for old_path, new_path in zip(list_of_old, list_of_new):
+            list_of_moved.append(('moved', old_path, new_path, this_hash, this_hash))
+        dict_of_deleted[this_hash] = list_of_old[number_moved:]
+        dict_of_added[this_hash] = list_of_new[number_moved:]
+
+    list_of_added = sorted((('added', None, this_path, None, this_hash)
+                            for this_hash, list_of_paths in dict_of_added.items() for this_path in list_of_paths),
+                           key=lambda event: event[2])
+    list_of_deleted = sorted((('deleted', this_path, None, this_hash, None)
+                              for this_hash, list_of_paths in dict_of_deleted.items() for this_path in list_of_paths),
+                             key=lambda event: event[1])
+    return sorted(list_of_changed, key=lambda event: event[1]) + list_of_moved + list_of_added + list_of_deleted
+
+def diff_tables(prnt_debug, previous_table, current_table, compare_on='hash',
+                set_of_previous_skips=None, set_of_current_skips=None):
+    """
+    diff_records for two path_table.PathTable, giving the same events in the same order.
+    Rows are matched by directory and basename and compared on the raw digest (or the stat key, see comparison_mode),
+    so full paths and hex digests are only built for the files that end up in an event.
+    Files under set_of_previous_skips and set_of_current_skips (from directory_prefilter) are left out.
+
+    >>> diff_tables(False, path_table.from_records([{'full path': '/a', 'hash of file': '01'}, {'full path': '/b', 'hash of file': '02'}]),
+    ...                    path_table.from_records([{'full path': '/a', 'hash of file': '03'}, {'full path': '/c', 'hash of file': '02'}]))
+    [('changed', '/a', '/a', '01', '03'), ('moved', '/b', '/c', '02', '02')]
+    """
+    if set_of_previous_skips is None:
+        set_of_previous_skips = set()
+    if set_of_current_skips is None:
+        set_of_current_skips = set()
+
+    def row_key(table, row):
+        if compare_on != 'stat':
+            return table.digest(row)
+        stat_key = table.stat_key(row)
+        if stat_key is None:
+            raise Exception('ERROR: snapshots were hashed differently and lack the stat metadata to fall back on:',
+                            table.full_path(row))
+        return stat_key
+
+    def key_to_str(key):
+        if compare_on == 'stat':
+            return 'stat:'+':'.join(str(value) for value in key)
+        return key.hex()
+
+    def skipped_directories(table, set_of_skips):
+        return [is_under_directories(path_table.join_path(dir_path, ''), set_of_skips) for dir_path in table.list_of_dirs]
+
+    list_of_previous_skipped = skipped_directories(previous_table, set_of_previous_skips)
+    list_of_current_skipped = skipped_directories(current_table, set_of_current_skips)
+    matched = bytearray(len(previous_table)) # 1 for the previous rows that are still there
+    list_of_changed = []
+    dict_of_added = {} # key: list of current rows
+    number_unchanged = 0
+    for row in range(len(current_table)):
+        dir_id = current_table.parents[row]
+        if list_of_current_skipped[dir_id]:
+            continue
+        previous_row = previous_table.find_name(current_table.list_of_dirs[dir_id], current_table.names[row])
+        if previous_row is not None and list_of_previous_skipped[previous_table.parents[previous_row]]:
+            previous_row = None
+        new_key = row_key(current_table, row)
+        if previous_row is None:
+            dict_of_added.setdefault(new_key, []).append(row)
+            continue
+        matched[previous_row] = 1
+        old_key = row_key(previous_table, previous_row)
+        if old_key == new_key:
+            number_unchanged += 1
+        else:
+            this_path = current_table.full_path(row)
+            list_of_changed.append(('changed', this_path, this_path, key_to_str(old_key), key_to_str(new_key)))
+    if prnt_debug: print('unchanged files:', number_unchanged)
+    dict_of_deleted = {} # key: list of previous rows
+    for row in range(len(previous_table)):
+        if not matched[row] and not list_of_previous_skipped[previous_table.parents[row]]:
+            dict_of_deleted.setdefault(row_key(previous_table, row), []).append(row)
+
+    # the k-th deleted path with a given key pairs with the k-th added path with that key
+    list_of_moved = []
+    list_of_added = []
+    list_of_deleted = []
+    for key in sorted(set(dict_of_deleted.keys()) & set(dict_of_added.keys()), key=key_to_str):
+        this_hash = key_to_str(key)
+        list_of_old = sorted(previous_table.full_path(row) for row in dict_of_deleted.pop(key))
+        list_of_new = sorted(current_table.full_path(row) for row in dict_of_added.pop(key))
+        number_moved = min(len(list_of_old), len(list_of_new))
+        for old_path, new_path in zip(list_of_old, list_of_new):
+            list_of_moved.append(('moved', old_path, new_path, this_hash, this_hash))
+        list_of_deleted.extend(('deleted', old_path, None, this_hash, None) for old_path in list_of_old[number_moved:])
+        list_of_added.extend(('added', None, new_path, None, this_hash) for new_path in list_of_new[number_moved:])
+    for key, list_of_rows in dict_of_added.items():
+        list_of_added.extend(('added', None, current_table.full_path(row), None, key_to_str(key)) for row in list_of_rows)
+    for key, list_of_rows in dict_of_deleted.items():
+        list_of_deleted.extend(('deleted', previous_table.full_path(row), None, key_to_str(key), None) for row in list_of_rows)
+    return (sorted(list_of_changed, key=lambda event: event[1]) + list_of_moved
+            + sorted(list_of_added, key=lambda event: event[2]) + sorted(list_of_deleted, key=lambda event: event[1]))
+
+def dataframe_to_events(df_events):
+    """
+    (status, old path, new path, old hash, new hash) tuples, with None for missing values
+    """
+    df_events = df_events.astype(object).where(df_events.notna(), None)
+    return list(df_events[EVENT_COLUMNS].itertuples(index=False, name=None))
+
+# rough in-memory size of one two-column record dict, used to turn a memory budget into a record count
+BYTES_PER_RECORD = 600
+
+# the fields of a change event
+EVENT_COLUMNS = ['status', 'old path', 'new path', 'old hash', 'new hash']
+
+# section headings used when printing change events, in the order the events are produced
+EVENT_HEADINGS = {'folder moved': '== moved folders ==',
+                  'changed': 'changed files:',
+                  'moved':   '== moved files ==',
+                  'added':   '== new files ==',
+                  'deleted': '== deleted files =='}
+
+# stat metadata used in place of the hash when two snapshots were hashed differently
+STAT_COLUMNS = ['size', 'mtime_ns', 'inode', 'device']
+
+def comparison_mode(prnt_debug, previous_file, current_file):
+    """
+    'hash' when both snapshots were hashed with the same algorithm and digest size, otherwise 'stat'
+    """
+    return comparison_mode_of_headers(prnt_debug, snapshot_io.read_snapshot_header(previous_file),
+                                      snapshot_io.read_snapshot_header(current_file))
+
+def comparison_mode_of_headers(prnt_debug, previous_header, current_header):
+    """
+    comparison_mode for two snapshot headers (or scan_options)
+
+    >>> comparison_mode_of_headers(False, {'hash': 'md5'}, {'hash': 'md5', 'digest_size': 0})
+    'hash'
+    """
+    previous_settings = ct.hash_settings(previous_header)
+    current_settings = ct.hash_settings(current_header)
+    if previous_settings == current_settings:
+        return 'hash'
+    print('WARNING: snapshots were hashed differently,', previous_settings, 'and', current_settings,
+          '; comparing stat metadata instead of hashes')
+    return 'stat'
+
+def comparison_columns(compare_on):
+    """
+    >>> comparison_columns('stat')
+    ['full path', 'size', 'mtime_ns', 'inode', 'device']
+    """
+    if compare_on == 'stat':
+        return ['full path'] + STAT_COLUMNS
+    return ['full path', 'hash of file']
+
+def comparison_records(iterable_of_dicts, compare_on):
+    """
+    yield {'full path', 'hash of file'} records; when comparing on stat metadata,
+    'hash of file' is a key built from size, mtime_ns, inode and device.
+    A rename keeps all four, so moves are still detected.
+
+    >>> list(comparison_records([{'full path': '/a', 'size': 1, 'mtime_ns': 2, 'inode': 3, 'device': 4}], 'stat'))
+    [{'full path': '/a', 'hash of file': 'stat:1:2:3:4'}]
+    """
+    for file_dict in iterable_of_dicts:
+        if compare_on == 'stat':
+            try:
+                stat_key = 'stat:'+':'.join(str(file_dict[key]) for key in STAT_COLUMNS)
+            except KeyError:
+                raise Exception('ERROR: snapshots were hashed differently and lack the stat metadata to fall back on:',
+                                file_dict['full path'])
+            yield {'full path': file_dict['full path'], 'hash of file': stat_key}
+        else:
+            yield {'full path': file_dict['full path'], 'hash of file': file_dict['hash of file']}
+
+def is_under_directories(path, set_of_dirs):
+    """
+    is any parent directory of path in set_of_dirs? walks up the path, so the cost is its depth
+
+    >>> is_under_directories('/r/a/b/c', set(['/r/a']))
+    True
+    >>> is_under_directories('/r/ab', set(['/r/a']))
+    False
+    """
+    if len(set_of_dirs) == 0:
+        return False
+    dir_path = os.path.dirname(path)
+    while True:
+        if dir_path in set_of_dirs:
+            return True
+        parent_path = os.path.dirname(dir_path)
+        if parent_path == dir_path:
+            return False
+        dir_path = parent_path
+
+def directory_prefilter(prnt_debug, previous_file, current_file):
+    """
+    use the directory digests (see ct.directory_hashes) to avoid comparing files one by one
+
+    * a directory with the same path and digest in both snapshots is unchanged, along with everything under it
+    * a directory that only exists in the previous snapshot and has the same digest as a directory that only
+      exists in the current snapshot was moved; it is reported once as 'folder moved' instead of file by file
+
+    returns the directories to skip in the previous snapshot, the directories to skip in the current snapshot,
+    and a list of 'folder moved' events. Snapshots without directory digests skip nothing.
+    """
+    return compare_directory_hashes(prnt_debug, dict(snapshot_io.iter_directory_hashes(prnt_debug, previous_file)),
+                                    dict(snapshot_io.iter_directory_hashes(prnt_debug, current_file)))
+
+def compare_directory_hashes(prnt_debug, dict_of_previous, dict_of_current):
+    """
+    directory_prefilter for two dicts of directory path: digest
+    """
+    if len(dict_of_previous) == 0 or len(dict_of_current) == 0:
+        return set(), set(), []
+
+    def depth_order(dir_path):
+        return (dir_path.count('/'), dir_path)
+
+    # top-most unchanged directories only; their subdirectories are covered already
+    set_of_unchanged = set()
+    for dir_path in sorted(dict_of_previous.keys(), key=depth_order):
+        if dict_of_current.get(dir_path) == dict_of_previous[dir_path] and not is_under_directories(dir_path, set_of_unchanged):
+            set_of_unchanged.add(dir_path)
+
+    dict_of_added_dirs = {} # digest: current-only directories, top-most first
+    for dir_path in sorted(dict_of_current.keys(), key=depth_order):
+        if dir_path not in dict_of_previous:
+            dict_of_added_dirs.setdefault(dict_of_current[dir_path], []).append(dir_path)
+
+    set_of_previous_moved = set()
+    set_of_current_moved = set()
+    list_of_events = []
+    for dir_path in sorted(dict_of_previous.keys(), key=depth_order):
+        if dir_path in dict_of_current or is_under_directories(dir_path, set_of_previous_moved):
+            continue
+        dir_hash = dict_of_previous[dir_path]
+        for new_dir_path in dict_of_added_dirs.get(dir_hash, []):
+            if new_dir_path not in set_of_current_moved and not is_under_directories(new_dir_path, set_of_current_moved):
+                set_of_previous_moved.add(dir_path)
+                set_of_current_moved.add(new_dir_path)
+                list_of_events.append(('folder moved', dir_path, new_dir_path, dir_hash, dir_hash))
+                break
+    if prnt_debug: print('unchanged directories skipped:', len(set_of_unchanged))
+    if prnt_debug: print('moved directories:', len(list_of_events))
+    return set_of_unchanged | set_of_previous_moved, set_of_unchanged | set_of_current_moved, list_of_events
+
+def records_outside_directories(iterable_of_dicts, set_of_dirs):
+    """
+    drop the records under any directory in set_of_dirs
+    """
+    for file_dict in iterable_of_dicts:
+        if not is_under_directories(file_dict['full path'], set_of_dirs):
+            yield file_dict
+
+def load_comparison_dataframe(prnt_debug, file_name, compare_on='hash', set_of_skipped_dirs=None):
+    """
+    a snapshot as a DataFrame with the columns the comparison needs: 'full path' and 'hash of file'
+    files under set_of_skipped_dirs (from directory_prefilter) are left out
+    """
+    iterable_of_dicts = snapshot_io.iter_snapshot_records(prnt_debug, file_name, comparison_columns(compare_on))
+    return comparison_dataframe(iterable_of_dicts, compare_on, set_of_skipped_dirs)
+
+def comparison_dataframe(iterable_of_dicts, compare_on='hash', set_of_skipped_dirs=None):
+    """
+    load_comparison_dataframe for records already in memory
+    """
+    import pandas # only the DataFrame functions need it
+    if set_of_skipped_dirs is None:
+        set_of_skipped_dirs = set()
+    iterable_of_dicts = records_outside_directories(iterable_of_dicts, set_of_skipped_dirs)
+    return pandas.DataFrame(list(comparison_records(iterable_of_dicts, compare_on)),
+                            columns=['full path', 'hash of file'])
+
+def changed_byte_ranges(list_of_old_blocks, list_of_new_blocks, block_map_size, old_size, new_size):
+    """
+    the (first byte, last byte) ranges of a file that differ between two block maps;
+    adjacent changed blocks are merged into one range
+
+    >>> changed_byte_ranges(['a', 'b', 'c'], ['a', 'x', 'y', 'z'], 100, 250, 380)
+    [(100, 379)]
+    >>> changed_byte_ranges(['a', 'b', 'c'], ['x', 'b', 'c'], 100, 300, 300)
+    [(0, 99)]
+    """
+    list_of_ranges = []
+    file_end = max(old_size, new_size)
+    for block_indx in range(max(len(list_of_old_blocks), len(list_of_new_blocks))):
+        old_block = list_of_old_blocks[block_indx] if block_indx < len(list_of_old_blocks) else None
+        new_block = list_of_new_blocks[block_indx] if block_indx < len(list_of_new_blocks) else None
+        if old_block == new_block:
+            continue
+        first_byte = block_indx*block_map_size
+        last_byte = min((block_indx+1)*block_map_size, file_end) - 1
+        if len(list_of_ranges) > 0 and list_of_ranges[-1][1] == first_byte - 1:
+            list_of_ranges[-1] = (list_of_ranges[-1][0], last_byte)
+        else:
+            list_of_ranges.append((first_byte, last_byte))
+    return list_of_ranges
+
+def block_changes(prnt_debug, previous_file, current_file, set_of_paths):
+    """
+    for each path in set_of_paths that has a block map in both snapshots, the byte ranges that changed
+    """
+    block_map_size = snapshot_io.read_snapshot_header(current_file).get('block_map_size', 0)
+    if block_map_size == 0 or len(set_of_paths) == 0:
+        return {}
+    list_of_columns = ['full path', 'size', 'block hashes']
+    return block_changes_of_records(snapshot_io.iter_snapshot_records(prnt_debug, previous_file, list_of_columns),
+                                    snapshot_io.iter_snapshot_records(prnt_debug, current_file, list_of_columns),
+                                    block_map_size, set_of_paths)
+
+def block_changes_of_records(iterable_of_previous, iterable_of_current, block_map_size, set_of_paths):
+    """
+    block_changes for records already in memory
+    """
+    if block_map_size == 0 or len(set_of_paths) == 0:
+        return {}
+    dict_of_previous = {}
+    for file_dict in iterable_of_previous:
+        if file_dict['full path'] in set_of_paths and 'block hashes' in file_dict:
+            dict_of_previous[file_dict['full path']] = file_dict
+    dict_of_ranges = {}
+    for file_dict in iterable_of_current:
+        previous_dict = dict_of_previous.get(file_dict['full path'])
+        if previous_dict is None or 'block hashes' not in file_dict:
+            continue
+        dict_of_ranges[file_dict['full path']] = changed_byte_ranges(
+            previous_dict['block hashes'], file_dict['block hashes'], block_map_size,
+            previous_dict['size'], file_dict['size'])
+    return dict_of_ranges
+
+def timeline_events(prnt_debug, list_of_snapshot_files):
+    """
+    yield (previous file, current file, list of change events) for each pair of adjacent snapshots,
+    oldest first. Each snapshot is read once: the path: hash dict collected while it is the current
+    snapshot of one diff is the previous snapshot of the next, so the cost grows with the total number of
+    records, not with pairs times records. Only a change of hash settings within the range makes
+    a snapshot be read a second time (its records are compared on stat metadata instead, see comparison_mode).
+    The directory prefilter is not used, so moved folders are reported file by file.
+    The first snapshot is only read into the path: hash dict, in the comparison mode of the first pair; it is not diffed.
+    """
+    if len(list_of_snapshot_files) == 0:
+        return
+    previous_file = list_of_snapshot_files[0]
+    dict_of_previous = {}
+    previous_compare_on = None
+    for current_file in list_of_snapshot_files[1:]:
+        compare_on = comparison_mode(prnt_debug, previous_file, current_file)
+        if compare_on != previous_compare_on:
+            dict_of_previous = {file_dict['full path']: file_dict['hash of file'] for file_dict in comparison_records(
+                snapshot_io.iter_snapshot_records(prnt_debug, previous_file, comparison_columns(compare_on)), compare_on)}
+        dict_of_current = {}
+        list_of_events = diff_against_previous(
+            prnt_debug, dict_of_previous,
+            comparison_records(snapshot_io.iter_snapshot_records(prnt_debug, current_file, comparison_columns(compare_on)),
+                               compare_on),
+            dict_of_current)
+        yield previous_file, current_file, list_of_events
+        previous_file, dict_of_previous, previous_compare_on = current_file, dict_of_current, compare_on
+
+def add_events_to_states(dict_of_states, list_of_events):
+    """
+    dict_of_states maps each path that changed to the list of its states, starting with its state in the first
+    snapshot: a hash, or None while the path does not exist. A move leaves the old path and fills the new one.
+
+    >>> dict_of_states = {}
+    >>> add_events_to_states(dict_of_states, [('added', None, '/a', None, '1')])
+    >>> add_events_to_states(dict_of_states, [('moved', '/a', '/b', '1', '1')])
+    >>> dict_of_states
+    {'/a': [None, '1', None], '/b': [None, '1']}
+    """
+    for status, old_path, new_path, old_hash, new_hash in list_of_events:
+        if status in ['moved', 'deleted']:
+            dict_of_states.setdefault(old_path, [old_hash]).append(None)
+        if status in ['moved', 'added']:
+            dict_of_states.setdefault(new_path, [None]).append(new_hash)
+        if status == 'changed':
+            dict_of_states.setdefault(new_path, [old_hash]).append(new_hash)
+
+def timeline_summary(dict_of_states):
+    """
+    net 'added', 'deleted' and 'changed' paths between the first and last snapshot,
+    'flapped' paths that returned to an earlier state (content changed back, deleted and restored, added and removed),
+    and 'changes' (path: number of content changes)
+
+    >>> timeline_summary({'/a': ['1', '2', '1'], '/b': [None, '3']})['flapped']
+    ['/a']
+    """
+    dict_of_summary = {'added': [], 'deleted': [], 'changed': [], 'flapped': [], 'changes': {}}
+    for this_path in sorted(dict_of_states):
+        list_of_states = dict_of_states[this_path]
+        first_state, last_state = list_of_states[0], list_of_states[-1]
+        if first_state is None and last_state is not None:
+            dict_of_summary['added'].append(this_path)
+        elif first_state is not None and last_state is None:
+            dict_of_summary['deleted'].append(this_path)
+        elif first_state != last_state:
+            dict_of_summary['changed'].append(this_path)
+        # consecutive states always differ, so any repeat is a return to an earlier state
+        if len(set(list_of_states)) < len(list_of_states):
+            dict_of_summary['flapped'].append(this_path)
+        number_of_changes = sum(1 for before, after in zip(list_of_states, list_of_states[1:])
+                                if before is not None and after is not None)
+        if number_of_changes > 0:
+            dict_of_summary['changes'][this_path] = number_of_changes
+    return dict_of_summary
+
+def print_timeline_summary(dict_of_summary, number_of_intervals, top=10):
+    """
+    >>> print_timeline_summary({'added': ['/b'], 'deleted': [], 'changed': [], 'flapped': ['/a'], 'changes': {'/a': 2}}, 2)
+    == net over 2 intervals ==
+    added: 1 deleted: 0 changed: 0
+    files changed 2 times: 1
+    == flapped ==
+    /a
+    == most changed ==
+    /a 2
+    """
+    print('== net over', number_of_intervals, 'intervals ==')
+    print('added:', len(dict_of_summary['added']), 'deleted:', len(dict_of_summary['deleted']),
+          'changed:', len(dict_of_summary['changed']))
+    dict_of_counts = {}
+    for number_of_changes in dict_of_summary['changes'].values():
+        dict_of_counts[number_of_changes] = dict_of_counts.get(number_of_changes, 0) + 1
+    for number_of_changes in sorted(dict_of_counts):
+        print('files changed', number_of_changes, 'times:', dict_of_counts[number_of_changes])
+    if len(dict_of_summary['flapped']) > 0:
+        print('== flapped ==')
+        for this_path in dict_of_summary['flapped']:
+            print(this_path)
+    if len(dict_of_summary['changes']) > 0:
+        print('== most changed ==')
+        for this_path, number_of_changes in sorted(dict_of_summary['changes'].items(),
+                                                   key=lambda item: (-item[1], item[0]))[:top]:
+            print(this_path, number_of_changes)
+
+def print_change_events(prnt_debug, iterable_of_events, dict_of_ranges=None):
+    """
+    events are (status, old path, new path, old hash, new hash) tuples grouped by status;
+    dict_of_ranges (from block_changes) adds the changed byte ranges of changed files
+
+    >>> print_change_events(False, [('moved', '/a/b', '/a/c', '1234', '1234')])
+    == moved files ==
+    /a/b --> /a/c
+    >>> print_change_events(False, [('changed', '/a/b', '/a/b', '1234', '5678')], {'/a/b': [(0, 99), (300, 349)]})
+    changed files:
+    /a/b bytes 0-99, 300-349
+    """
+    if dict_of_ranges is None:
+        dict_of_ranges = {}
+    previous_status = None
+    for status, old_path, new_path, old_hash, new_hash in iterable_of_events:
+        if status != previous_status:
+            print(EVENT_HEADINGS[status])
+            previous_status = status
+        if status in ['moved', 'folder moved']:
+            print(old_path, '-->', new_path)
+        elif status == 'deleted':
+            print(old_path)
+        elif status == 'changed' and new_path in dict_of_ranges:
+            print(new_path, 'bytes', ', '.join(str(first)+'-'+str(last) for first, last in dict_of_ranges[new_path]))
+        else:
+            print(new_path)
+
+def streaming_diff(prnt_debug, previous_file, current_file, memory_budget, compare_on='hash',
+                   set_of_previous_skips=None, set_of_current_skips=None):
+    """
+    yield (status, old path, new path, old hash, new hash) change events between two snapshot files
+    while holding roughly memory_budget MB in memory, however large the snapshots are
+
+    1) both snapshots are streamed in path order and merge-joined in a single pass;
+       a path present in both is unchanged or changed
+    2) paths present in only one snapshot are spilled to a temporary SQLite table keyed by hash,
+       and a second merge-join on hash pairs deleted with added files of the same content: moved
+    3) whatever is left over is added or deleted
+
+    compare_on is 'hash' or 'stat', see comparison_mode;
+    files under set_of_previous_skips and set_of_current_skips (from directory_prefilter) are left out
+    """
+    if set_of_previous_skips is None:
+        set_of_previous_skips = set()
+    if set_of_current_skips is None:
+        set_of_current_skips = set()
+    list_of_columns = comparison_columns(compare_on)
+    # half of the budget for the two sorted streams, the rest for the spill database
+    max_records_in_memory = max(1000, (memory_budget*1024*1024)//(4*BYTES_PER_RECORD))
+    previous_iter = comparison_records(records_outside_directories(snapshot_io.iter_sorted_records(
+        prnt_debug, previous_file, list_of_columns, max_records_in_memory), set_of_previous_skips), compare_on)
+    current_iter = comparison_records(records_outside_directories(snapshot_io.iter_sorted_records(
+        prnt_debug, current_file, list_of_columns, max_records_in_memory), set_of_current_skips), compare_on)
+
+    spill_dir = tempfile.mkdtemp(prefix='diff_changes_')
+    conn = sqlite3.connect(spill_dir+'/unmatched.sqlite')
+    try:
+        conn.execute('PRAGMA journal_mode=OFF')
+        conn.execute('PRAGMA synchronous=OFF')
+        conn.execute('PRAGMA cache_size=-'+str(max(1024, memory_budget*1024//2))) # negative means KiB
+        conn.execute('CREATE TABLE unmatched (side TEXT, hash TEXT, path TEXT)')
+        list_of_spilled = []
+        def spill(side, file_dict):
+            list_of_spilled.append((side, file_dict['hash of file'], file_dict['full path']))
+            if len(list_of_spilled) >= 10000:
+                conn.executemany('INSERT INTO unmatched VALUES (?, ?, ?)', list_of_spilled)
+                list_of_spilled.clear()
+
+        number_unchanged = 0
+        previous_dict = next(previous_iter, None)
+        current_dict = next(current_iter, None)
+        while previous_dict is not None and current_dict is not None:
+            previous_path = previous_dict['full path']
+            current_path = current_dict['full path']
+            if previous_path == current_path:
+                if previous_dict['hash of file'] == current_dict['hash of file']:
+                    number_unchanged += 1
+                else:
+                    yield ('changed', previous_path, current_path,
+                           previous_dict['hash of file'], current_dict['hash of file'])
+                previous_dict = next(previous_iter, None)
+                current_dict = next(current_iter, None)
+            elif previous_path < current_path:
+                spill('deleted', previous_dict)
+                previous_dict = next(previous_iter, None)
+            else:
+                spill('added', current_dict)
+                current_dict = next(current_iter, None)
+        while previous_dict is not None:
+            spill('deleted', previous_dict)
+            previous_dict = next(previous_iter, None)
+        while current_dict is not None:
+            spill('added', current_dict)
+            current_dict = next(current_iter, None)
+        conn.executemany('INSERT INTO unmatched VALUES (?, ?, ?)', list_of_spilled)
+        list_of_spilled.clear()
+        conn.execute('CREATE INDEX unmatched_side_hash ON unmatched (side, hash, path)')
+        conn.commit()
+        if prnt_debug: print('unchanged files:', number_unchanged)
+
+        # moved: the k-th deleted path with a given hash pairs with the k-th added path with that hash
+        conn.execute('CREATE TABLE leftover (side TEXT, hash TEXT, path TEXT)')
+        deleted_cursor = conn.cursor().execute("SELECT hash, path FROM unmatched WHERE side='deleted' ORDER BY hash, path")
+        added_cursor = conn.cursor().execute("SELECT hash, path FROM unmatched WHERE side='added' ORDER BY hash, path")
+        deleted_row = deleted_cursor.fetchone()
+        added_row = added_cursor.fetchone()
+        list_of_leftovers = []
+        while deleted_row is not None or added_row is not None:
+            if added_row is None or (deleted_row is not None and deleted_row[0] < added_row[0]):
+                list_of_leftovers.append(('deleted', deleted_row[0], deleted_row[1]))
+                deleted_row = deleted_cursor.fetchone()
+            elif deleted_row is None or added_row[0] < deleted_row[0]:
+                list_of_leftovers.append(('added', added_row[0], added_row[1]))
+                added_row = added_cursor.fetchone()
+            else:
+                yield ('moved', deleted_row[1], added_row[1], deleted_row[0], added_row[0])
+                deleted_row = deleted_cursor.fetchone()
+                added_row = added_cursor.fetchone()
+            if len(list_of_leftovers) >= 10000:
+                conn.executemany('INSERT INTO leftover VALUES (?, ?, ?)', list_of_leftovers)
+                list_of_leftovers.clear()
+        conn.executemany('INSERT INTO leftover VALUES (?, ?, ?)', list_of_leftovers)
+        list_of_leftovers.clear()
+        conn.commit()
+
+        for status in ['added', 'deleted']:
+            for this_hash, this_path in conn.execute('SELECT hash, path FROM leftover WHERE side=? ORDER BY path', (status,)):
+                if status == 'added':
+                    yield ('added', None, this_path, None, this_hash)
+                else:
+                    yield ('deleted', this_path, None, this_hash, None)
+    finally:
+        conn.close()
+        shutil.rmtree(spill_dir, ignore_errors=True)
 
 my_str = """
 import diff_changes as dc
-import pandas
-import glob
+import snapshot_io
 prnt_debug = False
 path_to_json = '.' 
 path_to_output = '.'
-list_of_json_files = glob.glob(path_to_json+'/*.json')
-latest_json_file, second_latest_json_file = dc.get_latest_json(prnt_debug, list_of_json_files)
-df_previous = pandas.read_json(second_latest_json_file)
-df_current = pandas.read_json(latest_json_file)
+latest_json_file, second_latest_json_file = snapshot_io.latest_snapshots(prnt_debug, path_to_json, 2, 'log')
+# pandas is only imported by the DataFrame functions
+df_previous = dc.load_comparison_dataframe(prnt_debug, second_latest_json_file)
+df_current = dc.load_comparison_dataframe(prnt_debug, latest_json_file)
 """
 
 if __name__ == '__main__':
 
-    prnt_debug, path_to_json, path_to_output, email_addr  = args_use(sys.argv)
-    list_of_json_files = glob.glob(path_to_json+'/*.json')
+    prnt_debug, path_to_json, path_to_output, email_addr, diff_options = args_use(sys.argv)
+    run_metrics = metrics.start_metrics(prnt_debug, metrics.parse_args(sys.argv), 'diff_changes')
+    if diff_options['timeline'] > 0 or diff_options['since'] != '' or diff_options['until'] != '':
+        list_of_snapshot_files = snapshot_io.snapshots_in_range(prnt_debug, path_to_json, diff_options['timeline'],
+                                                                diff_options['since'], diff_options['until'],
+                                                                diff_options['output_prefix'])
+        if len(list_of_snapshot_files) < 2:
+            print("need at least two snapshots in the range. Exiting.")
+            sys.exit(0)
+        dict_of_states = {}
+        with metrics.phase(run_metrics, 'timeline'):
+            for previous_file, current_file, list_of_events in timeline_events(prnt_debug, list_of_snapshot_files):
+                if not diff_options['summary_only']:
+                    print('=== '+os.path.basename(previous_file)+' --> '+os.path.basename(current_file)+' ===')
+                    print_change_events(prnt_debug, list_of_events)
+                add_events_to_states(dict_of_states, list_of_events)
+                if run_metrics is not None: run_metrics.add_progress(len(list_of_events))
+        print_timeline_summary(timeline_summary(dict_of_states), len(list_of_snapshot_files) - 1)
+        sys.exit(0)
+
+    list_of_json_files = snapshot_io.latest_snapshots(prnt_debug, path_to_json, 2, diff_options['output_prefix'])
 
     if len(list_of_json_files) > 1:
-        latest_json_file, second_latest_json_file = get_latest_json(prnt_debug, list_of_json_files)   
+        latest_json_file, second_latest_json_file = list_of_json_files
     else:
         print("need at least two previous JSON files. Exiting.")
         sys.exit(0)
 
-    # https://pandas.pydata.org/pandas-docs/stable/reference/api/pandas.read_json.html 
-    df_previous = pandas.read_json(second_latest_json_file)
-    df_current = pandas.read_json(latest_json_file)
-
-
-    #print('== detecting changes ==')
-    # options:
-    # file added:    new hash,     new path
-    # file removed:  missing hash, missing path
-
-    # file moved, aka renamed:    same hash,     new path
-    # file changed:  changed hash (new hash and missing hash for same same path)
-
-    # https://stackoverflow.com/questions/9758450/pandas-convert-dataframe-to-array-of-tuples/9762084
-    current_tuples = [tuple(x) for x in df_current.values]
-    previous_tuples = [tuple(x) for x in df_previous.values]
-
-    unchanged_tuples = set(current_tuples).intersection(set(previous_tuples))
-    # remove unchanged_tuples from both current_tuples and previous_tuples
-    df_current_to_cat  = pandas.DataFrame(list(set(current_tuples)  - unchanged_tuples), columns=['full path','hash of file'])
-    df_previous_to_cat = pandas.DataFrame(list(set(previous_tuples) - unchanged_tuples), columns=['full path','hash of file'])
-#    print('after removing "no change" files, current df is',df_current_to_cat.shape)
-#    print('after removing "no change" files, prev    df is',df_previous_to_cat.shape)
-
-    df_previous_to_cat, df_current_to_cat = df_comparison_changed_files(prnt_debug, df_previous_to_cat, df_current_to_cat)
-#    print('after detecting changes, current df is',df_current_to_cat.shape)
-#    print('after detecting changes, prev    df is',df_previous_to_cat.shape)
-
-    df_previous_to_cat, df_current_to_cat = df_comparison_moved_files(prnt_debug, df_previous_to_cat, df_current_to_cat)
-#    print('after moved files, current df is',df_current_to_cat.shape)
-#    print('after moved files, prev    df is',df_previous_to_cat.shape)
-
-    df_comparison_new_and_deleted_files(prnt_debug, df_previous_to_cat, df_current_to_cat)
+    compare_on = comparison_mode(prnt_debug, second_latest_json_file, latest_json_file)
+
+    set_of_previous_skips, set_of_current_skips, list_of_folder_events = set(), set(), []
+    if compare_on == 'hash':
+        with metrics.phase(run_metrics, 'directory prefilter'):
+            set_of_previous_skips, set_of_current_skips, list_of_folder_events = directory_prefilter(
+                prnt_debug, second_latest_json_file, latest_json_file)
+        if run_metrics is not None:
+            run_metrics.count('directories skipped', len(set_of_current_skips))
+    print_change_events(prnt_debug, list_of_folder_events)
+
+    if diff_options['streaming']:
+        with metrics.phase(run_metrics, 'streaming diff'):
+            print_change_events(prnt_debug, streaming_diff(prnt_debug, second_latest_json_file, latest_json_file,
+                                                           diff_options['memory_budget'], compare_on,
+                                                           set_of_previous_skips, set_of_current_skips))
+        sys.exit(0)
 
+    list_of_columns = comparison_columns(compare_on)
+    if diff_options['compact']:
+        with metrics.phase(run_metrics, 'load tables'):
+            previous_table = snapshot_io.read_path_table(prnt_debug, second_latest_json_file, list_of_columns)
+            current_table = snapshot_io.read_path_table(prnt_debug, latest_json_file, list_of_columns)
+        with metrics.phase(run_metrics, 'diff'):
+            list_of_events = diff_tables(prnt_debug, previous_table, current_table, compare_on,
+                                         set_of_previous_skips, set_of_current_skips)
+            if run_metrics is not None: run_metrics.add_progress(len(list_of_events))
+        previous_table, current_table = None, None
+    else:
+        with metrics.phase(run_metrics, 'diff'):
+            list_of_events = diff_records(
+                prnt_debug,
+                comparison_records(records_outside_directories(snapshot_io.iter_snapshot_records(
+                    prnt_debug, second_latest_json_file, list_of_columns), set_of_previous_skips), compare_on),
+                comparison_records(records_outside_directories(snapshot_io.iter_snapshot_records(
+                    prnt_debug, latest_json_file, list_of_columns), set_of_current_skips), compare_on))
+            if run_metrics is not None: run_metrics.add_progress(len(list_of_events))
+    dict_of_ranges = {}
+    if compare_on == 'hash':
+        with metrics.phase(run_metrics, 'block changes'):
+            dict_of_ranges = block_changes(prnt_debug, second_latest_json_file, latest_json_file,
+                                           set(event[2] for event in list_of_events if event[0] == 'changed'))
+    with metrics.phase(run_metrics, 'print'):
+        print_change_events(prnt_debug, list_of_events, dict_of_ranges)
@@ -9,6 +9,17 @@ python3 diff_changes.py --path_to_json="/home/jovyan/tmp"
 
 python3 diff_changes.py --path_to_json="/home/jovyan/tmp" --debug
 
+standalone use, directly on a directory tree without a snapshot
+(group by size, then hash the first and last partial_bytes of each same-size file,
+then fully hash only the files that still collide):
+python3 find_dupes.py --search_path="/home/jovyan/tmp" --partial_bytes="4096" --workers="4"
+
+for snapshots of millions of files, group the rows of a path table (see path_table.py) on their raw digests:
+python3 find_dupes.py --path_to_json="/home/jovyan/tmp" --compact
+
+time the size grouping, partial and full hashing (see metrics.py):
+python3 find_dupes.py --search_path="/home/jovyan/tmp" --metrics="dupe_metrics.json" --progress="30"
+
 ********************
 # https://docs.python.org/3/library/profile.html
 python -m cProfile -s time change_tracker.py --path="/home/jovyan/tmp" | head -n 100
@@ -60,9 +71,12 @@ import glob
 import sys
 import os
 import hashlib # hash of file
-import pandas
-#import change_tracker as ct
-import numpy as np
+import change_tracker as ct
+import snapshot_io
+import metrics
+import path_table
+
+DEFAULT_PARTIAL_BYTES = 4096 # bytes hashed at each end of a same-size candidate
 
 def parse_args(list_of_args):
     """
@@ -76,14 +90,44 @@ def parse_args(list_of_args):
     path_to_json = '.'
     path_to_output = '.'
     email_addr = 'none'
+    dupe_options = {'search_path': '', 'partial_bytes': str(DEFAULT_PARTIAL_BYTES), 'workers': '1',
+                    'hash': 'md5', 'digest_size': '0', 'compact': False, 'output_prefix': 'log'}
     for arg in list_of_args:
         if '--debug' in arg:
             prnt_debug = True
         elif '--path_to_json' in arg:
             path_to_json = arg.replace('--path_to_json=', '')
+        elif '--search_path' in arg:
+            dupe_options['search_path'] = arg.replace('--search_path=', '')
+        elif '--partial_bytes' in arg:
+            dupe_options['partial_bytes'] = arg.replace('--partial_bytes=', '')
+        elif '--workers' in arg:
+            dupe_options['workers'] = arg.replace('--workers=', '')
+        elif '--hash' in arg:
+            dupe_options['hash'] = arg.replace('--hash=', '')
+        elif '--digest_size' in arg:
+            dupe_options['digest_size'] = arg.replace('--digest_size=', '')
+        elif '--compact' in arg:
+            dupe_options['compact'] = True
+        elif '--output_prefix' in arg:
+            dupe_options['output_prefix'] = arg.replace('--output_prefix=', '')
     if not os.path.exists(path_to_json):
         raise Exception('ERROR: provided json path does not exist:', path_to_json)
-    return prnt_debug, path_to_json
+    if dupe_options['search_path'] != '' and not os.path.exists(dupe_options['search_path']):
+        raise Exception('ERROR: provided search path does not exist:', dupe_options['search_path'])
+    for option_name in ['partial_bytes', 'workers']:
+        try:
+            dupe_options[option_name] = int(dupe_options[option_name])
+        except ValueError:
+            raise Exception('ERROR: '+option_name+' must be an integer:', dupe_options[option_name])
+        if dupe_options[option_name] < 1:
+            raise Exception('ERROR: '+option_name+' must be greater than 0')
+    try:
+        dupe_options['digest_size'] = int(dupe_options['digest_size'])
+    except ValueError:
+        raise Exception('ERROR: digest_size must be an integer:', dupe_options['digest_size'])
+    check_hash_for_duplicates(dupe_options)
+    return prnt_debug, path_to_json, dupe_options
 
 def args_use(list_of_args):
     """
@@ -93,72 +137,203 @@ def args_use(list_of_args):
     """
     prnt_debug = False
     path_to_search = ''
+    dupe_options = {}
     if len(list_of_args) == 1:
         print('invalid number of arguments')
         print('required argument:')
         print('--path_to_json="/path/to/search"')
+        print('  or')
+        print('--search_path="/path/to/crawl"')
         print('optional argument:')
+        print('--output_prefix="log" (with --path_to_json, the snapshots written with this prefix)')
+        print('--partial_bytes="4096"')
+        print('--workers="4"')
+        print('--hash="md5" (or sha1, sha256, blake2b, blake2s)')
+        print('--digest_size="16"')
+        print('--compact')
+        print('--metrics="dupe_metrics.json"')
+        print('--progress="30"')
+        print('--profile="dupes.prof"')
         print('--debug')
         sys.exit(1) # https://stackoverflow.com/questions/6501121/difference-between-exit-and-sys-exit-in-python
     elif len(list_of_args) > 1:
-        prnt_debug, path_to_json = parse_args(list_of_args)
+        prnt_debug, path_to_json, dupe_options = parse_args(list_of_args)
     else:
         raise Exception('invalid option')
-    return prnt_debug, path_to_json
+    return prnt_debug, path_to_json, dupe_options
 
-def get_latest_json(prnt_debug, list_of_json):
+def check_hash_for_duplicates(header):
     """
-    which json file is the latest and which json file is the second latest?
-    >>> get_latest_json(False, ['file1.json', 'file2.json'])
+    duplicates are found by matching digests across paths, which needs a collision resistant hash;
+    header is a snapshot header or dupe_options
+
+    >>> check_hash_for_duplicates({'hash': 'blake2b', 'digest_size': 16})
+    >>> check_hash_for_duplicates({'hash': 'crc32'})
+    Traceback (most recent call last):
+    ...
+    Exception: ('ERROR: crc32 digests are for change detection only and cannot identify duplicates', 'crc32')
     """
-    import string
-    dict_of_times = {}
-    for json_file in list_of_json:
-        # https://stackoverflow.com/questions/1450897/remove-characters-except-digits-from-string-using-python
-        date_to_parse = json_file.replace('.json', '').replace('_', '').replace('/','').replace('.','').translate(str.maketrans('', '', string.ascii_letters))
-        dict_of_times[json_file] = datetime.datetime.strptime(date_to_parse, "%Y-%m-%d%H-%M")
-    # https://www.w3resource.com/python-exercises/dictionary/python-data-type-dictionary-exercise-15.php
-    latest_json_file = max(dict_of_times.keys(), key=(lambda k: dict_of_times[k]))
-    return latest_json_file
-
+    hash_name = header.get('hash', 'md5')
+    if hash_name == 'crc32':
+        raise Exception('ERROR: crc32 digests are for change detection only and cannot identify duplicates', hash_name)
+    if hash_name not in ct.HASH_ALGORITHMS:
+        raise Exception('ERROR: hash must be one of', ct.HASH_ALGORITHMS)
 
 def find_duplicate_files(prnt_debug, df):
     """
     this is for a single crawl of the directory -- no comparison with previous JSON records needed
+    The DataFrame counterpart of duplicate_groups, for analysis in pandas; the command line uses duplicate_groups.
 
     https://pandas.pydata.org/pandas-docs/stable/reference/api/pandas.DataFrame.duplicated.html
 
-    >>> find_duplicate_files(False, [{'hash of file':'asdfmagin'}])
+    >>> import pandas
+    >>> find_duplicate_files(False, pandas.DataFrame([['/a', 'asdfmagin'], ['/b', 'asdfmagin']], columns=['full path', 'hash of file']))
+    '== duplicate files (based on hash) ==\\nhash: asdfmagin\\n/a\\n/b\\n'
     """
-    dupe_str = ""
     df_dupes = df[df.duplicated(subset='hash of file', keep=False)]
-    if df_dupes.shape[0] > 0:
+    df.loc[df_dupes.index, 'status'] = 'duplicate'
+    # one groupby pass collects the paths of every duplicated hash
+    dict_of_groups = {this_hash: list(path_series.values)
+                      for this_hash, path_series in df_dupes.groupby('hash of file')['full path']}
+    #df_no_dupes = df[df['status']!='duplicate']
+    return duplicate_groups_to_str(dict_of_groups)
+
+def duplicate_groups(iterable_of_dicts):
+    """
+    dict that maps each hash shared by more than one record to the paths that share it; standard library only
+
+    >>> duplicate_groups([{'full path': '/a', 'hash of file': '1'}, {'full path': '/b', 'hash of file': '1'}, {'full path': '/c', 'hash of file': '2'}])
+    {'1': ['/a', '/b']}
+    """
+    dict_of_paths = {}
+    for file_dict in iterable_of_dicts:
+        dict_of_paths.setdefault(file_dict['hash of file'], []).append(file_dict['full path'])
+    return {this_hash: list_of_paths for this_hash, list_of_paths in dict_of_paths.items() if len(list_of_paths) > 1}
+
+def duplicate_groups_of_table(table):
+    """
+    duplicate_groups for a path_table.PathTable: rows are grouped on their raw digests,
+    and full paths are only built for the rows that have a duplicate
+
+    >>> duplicate_groups_of_table(path_table.from_records([{'full path': '/a', 'hash of file': '01'}, {'full path': '/b', 'hash of file': '01'}, {'full path': '/c', 'hash of file': '02'}]))
+    {'01': ['/a', '/b']}
+    """
+    dict_of_first = {} # digest: first row with it
+    dict_of_rows = {} # digest: every row with it, for digests seen more than once
+    for row in range(len(table)):
+        digest = table.digest(row)
+        first_row = dict_of_first.setdefault(digest, row)
+        if first_row != row:
+            dict_of_rows.setdefault(digest, [first_row]).append(row)
+    dict_of_first = None
+    return {digest.hex(): [table.full_path(row) for row in list_of_rows] for digest, list_of_rows in dict_of_rows.items()}
+
+def duplicate_groups_to_str(dict_of_groups):
+    """
+    dict_of_groups maps a hash to the list of paths that share it
+
+    >>> duplicate_groups_to_str({'1234': ['/a', '/b']})
+    '== duplicate files (based on hash) ==\\nhash: 1234\\n/a\\n/b\\n'
+    """
+    dupe_str = ""
+    if len(dict_of_groups) > 0:
         dupe_str += '== duplicate files (based on hash) ==\n'
-        for this_hash in set(df_dupes['hash of file'].values):
+        for this_hash in sorted(dict_of_groups.keys()):
             dupe_str += 'hash: ' + this_hash + '\n'
-            path_series = df_dupes[df_dupes['hash of file']==this_hash]['full path']
-            for idx, this_path in path_series.items():
+            for this_path in sorted(dict_of_groups[this_hash]):
                 dupe_str += this_path + '\n'
-                df.at[idx,'status'] = 'duplicate'
-            # the following overwrites other instances
-            #df['status'] = np.where(df['hash of file'] == this_hash, 'duplicate', '')
-
-    #df_no_dupes = df[df['status']!='duplicate']
     return dupe_str
 
+def find_duplicate_files_on_disk(prnt_debug, path_to_search, dupe_options=None, run_metrics=None):
+    """
+    find duplicate files without a snapshot, reading as few bytes as possible:
+    1) group every file by size; a file with a unique size has no duplicate
+    2) hash the first and last partial_bytes of each same-size candidate
+    3) fully hash only the files whose partial hashes still collide
+    run_metrics (a metrics.Metrics) times each of the three steps
 
-if __name__ == '__main__':
-
-    prnt_debug, path_to_json = args_use(sys.argv)
-
-    list_of_json = glob.glob(path_to_json+'/*.json')
-    #print(list_of_json)
+    returns a dict that maps the full-content hash to the list of paths with that content
+    """
+    if dupe_options is None:
+        dupe_options = {}
+    partial_bytes = dupe_options.get('partial_bytes', DEFAULT_PARTIAL_BYTES)
+    hash_name = dupe_options.get('hash', 'md5')
+    digest_size = dupe_options.get('digest_size', 0)
+    scan_options = {'workers': dupe_options.get('workers', 1), 'hash': hash_name, 'digest_size': digest_size}
+
+    dict_of_sizes = {}
+    with metrics.phase(run_metrics, 'size groups'):
+        for filename, stat_result in ct.walk_files(prnt_debug, path_to_search, dupe_options.get('excludes', []),
+                                                   run_metrics):
+            dict_of_sizes.setdefault(stat_result.st_size, []).append(filename)
+            if run_metrics is not None:
+                run_metrics.add_progress(1, stat_result.st_size)
+                run_metrics.add_file(filename, stat_result.st_size)
+    list_of_size_groups = [list_of_paths for list_of_paths in dict_of_sizes.values() if len(list_of_paths) > 1]
+    if prnt_debug: print('same-size candidates:', sum(len(group) for group in list_of_size_groups))
+
+    dict_of_groups = {}
+    list_of_full_candidates = []
+    with metrics.phase(run_metrics, 'partial hash'):
+        for list_of_paths in list_of_size_groups:
+            dict_of_partial = {}
+            for filename in list_of_paths:
+                got_hash, partial_hash, covers_whole_file, _ = ct.hash_file_sample(
+                    filename, partial_bytes, (0.0, 1.0), hash_name, digest_size)
+                if got_hash:
+                    dict_of_partial.setdefault((partial_hash, covers_whole_file), []).append(filename)
+                else:
+                    ct.count_unhashed(run_metrics, filename)
+                if run_metrics is not None: run_metrics.add_progress(1)
+            for (partial_hash, covers_whole_file), list_of_colliding in dict_of_partial.items():
+                if len(list_of_colliding) < 2:
+                    continue
+                if covers_whole_file:
+                    # small files: the partial hash already covered every byte, so it is the full hash
+                    dict_of_groups[partial_hash] = list_of_colliding
+                else:
+                    list_of_full_candidates.append(list_of_colliding)
+    if prnt_debug: print('full-hash candidates:', sum(len(group) for group in list_of_full_candidates))
+
+    list_of_filenames = [filename for group in list_of_full_candidates for filename in group]
+    with metrics.phase(run_metrics, 'full hash'):
+        list_of_results = ct.hash_files(list_of_filenames, scan_options, None, run_metrics)
+    dict_of_full = {}
+    for filename, (got_hash, hash_of_file, bytes_hashed, list_of_blocks) in zip(list_of_filenames, list_of_results):
+        if got_hash:
+            dict_of_full.setdefault(hash_of_file, []).append(filename)
+        else:
+            ct.count_unhashed(run_metrics, filename)
+    for hash_of_file, list_of_paths in dict_of_full.items():
+        if len(list_of_paths) > 1:
+            dict_of_groups[hash_of_file] = list_of_paths
+    return dict_of_groups
 
-    latest_json = get_latest_json(prnt_debug, list_of_json)
-    #print(latest_json)
 
-    df = pandas.read_json(latest_json)
+if __name__ == '__main__':
 
-    dupe_str = find_duplicate_files(prnt_debug, df)
+    prnt_debug, path_to_json, dupe_options = args_use(sys.argv)
+    run_metrics = metrics.start_metrics(prnt_debug, metrics.parse_args(sys.argv), 'find_dupes')
+
+    if dupe_options['search_path'] != '':
+        print(duplicate_groups_to_str(find_duplicate_files_on_disk(prnt_debug, dupe_options['search_path'], dupe_options,
+                                                                   run_metrics)))
+        sys.exit(0)
+
+    list_of_json = snapshot_io.latest_snapshots(prnt_debug, path_to_json, 1, dupe_options['output_prefix'])
+    if len(list_of_json) == 0:
+        print("no snapshot in the catalog. Exiting.")
+        sys.exit(0)
+    latest_json = list_of_json[0]
+
+    check_hash_for_duplicates(snapshot_io.read_snapshot_header(latest_json))
+    list_of_columns = ['full path', 'hash of file']
+    with metrics.phase(run_metrics, 'group snapshot'):
+        if dupe_options['compact']:
+            dupe_str = duplicate_groups_to_str(duplicate_groups_of_table(
+                snapshot_io.read_path_table(prnt_debug, latest_json, list_of_columns)))
+        else:
+            dupe_str = duplicate_groups_to_str(duplicate_groups(
+                snapshot_io.iter_snapshot_records(prnt_debug, latest_json, list_of_columns)))
 
     print(dupe_str)
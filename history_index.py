@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+
+"""
+an index over every snapshot ever written, for questions like
+"when did this file last change?" and "when did this content first appear, and where has it lived since?"
+
+The index is a SQLite database (history.index) next to the snapshots. It keeps, for each path,
+the runs of consecutive snapshots in which it had the same digest: (path, digest, first snapshot, last snapshot).
+A file that never changes is one row however many snapshots there are, and each run only adds rows for what changed.
+Both the path and the digest columns have B-tree indexes, so a point query reads a handful of pages.
+Snapshots stay in the index after rolling_logs.py deletes them.
+
+New snapshots are picked up from the catalog (see snapshot_io.py), in order and per output prefix;
+change_tracker.py --index (and track.py, merge_shards.py) update the index after writing a snapshot,
+or run --update here to catch up.
+A snapshot older than the newest one already indexed for its prefix is skipped.
+
+standard use:
+python3 history_index.py --path_to_json="." --update
+
+python3 history_index.py --path_to_json="." --path="/home/jovyan/tmp/notes.txt"
+
+python3 history_index.py --path_to_json="." --hash="764efa883dda1e11db47671c4a3bbd9e"
+
+*********************
+# https://docs.python.org/3/library/sqlite3.html
+sqlite3 history.index "SELECT path, hex(hash), first_id, last_id FROM versions LIMIT 10"
+
+*********************
+# https://docs.python.org/3/library/doctest.html
+python3 -m doctest history_index.py
+
+"""
+
+import os
+import sqlite3
+import sys
+import snapshot_io
+
+INDEX_NAME = 'history.index'
+
+def parse_args(list_of_args):
+    """
+    >>> parse_args(['name of py script', '--path_to_json=.', '--update'])
+    (False, '.', {'update': True, 'path': '', 'hash': ''})
+    >>> parse_args(['name of py script', 'invalid arg'])
+    (False, '.', {'update': False, 'path': '', 'hash': ''})
+    """
+    prnt_debug = False
+    path_to_json = '.'
+    query_options = {'update': False, 'path': '', 'hash': ''}
+    for arg in list_of_args:
+        if '--debug' in arg:
+            prnt_debug = True
+        elif '--path_to_json' in arg:
+            path_to_json = arg.replace('--path_to_json=', '')
+        elif '--update' in arg:
+            query_options['update'] = True
+        elif '--path' in arg:
+            query_options['path'] = arg.replace('--path=', '')
+        elif '--hash' in arg:
+            query_options['hash'] = arg.replace('--hash=', '')
+    if not os.path.exists(path_to_json):
+        raise Exception('ERROR: provided json path does not exist:', path_to_json)
+    if query_options['hash'] != '':
+        try:
+            bytes.fromhex(query_options['hash'])
+        except ValueError:
+            raise Exception('ERROR: hash must be a hex digest:', query_options['hash'])
+    return prnt_debug, path_to_json, query_options
+
+def args_use(list_of_args):
+    """
+    >>> args_use(['name of file'])
+    Traceback (most recent call last):
+    ...
+    SystemExit: 1
+    """
+    if len(list_of_args) == 1:
+        print('ERROR: invalid number of arguments')
+        print('required arguments:')
+        print('  --path_to_json="/path/to/snapshots"')
+        print('optional arguments:')
+        print('  --update (index the snapshots the catalog lists that are not indexed yet)')
+        print('  --path="/path/to/file" (every digest the file had, and when)')
+        print('  --hash="764efa88..." (every path that held the content, and when)')
+        print('  --debug')
+        sys.exit(1)
+    elif len(list_of_args) > 1:
+        return parse_args(list_of_args)
+    else:
+        raise Exception('invalid option')
+
+def open_index(path_to_json):
+    """
+    a connection to the index of path_to_json, created if missing
+    """
+    conn = sqlite3.connect(path_to_json+'/'+INDEX_NAME)
+    conn.executescript('''
+        CREATE TABLE IF NOT EXISTS snapshots (id INTEGER PRIMARY KEY, file TEXT, created TEXT, prefix TEXT,
+                                              UNIQUE (file, created));
+        CREATE TABLE IF NOT EXISTS versions (path TEXT, hash BLOB, first_id INTEGER, last_id INTEGER);
+        CREATE INDEX IF NOT EXISTS versions_path ON versions (path, last_id);
+        CREATE INDEX IF NOT EXISTS versions_hash ON versions (hash, first_id);
+        CREATE INDEX IF NOT EXISTS versions_last ON versions (last_id);
+    ''')
+    return conn
+
+def add_snapshot(prnt_debug, conn, file_name, entry):
+    """
+    index one snapshot as the next of its prefix: runs whose path still has the same digest
+    are extended to it, everything else starts a new run. entry is its catalog entry.
+    """
+    previous_id = conn.execute('SELECT max(id) FROM snapshots WHERE prefix = ?', (entry['prefix'],)).fetchone()[0]
+    snapshot_id = conn.execute('INSERT INTO snapshots (file, created, prefix) VALUES (?, ?, ?)',
+                               (entry['file'], entry['created'], entry['prefix'])).lastrowid
+    conn.execute('CREATE TEMP TABLE current_records (path TEXT PRIMARY KEY, hash BLOB)')
+    try:
+        conn.executemany('INSERT OR REPLACE INTO current_records VALUES (?, ?)',
+                         ((snapshot_io.path_to_sqlite(file_dict['full path']), bytes.fromhex(file_dict['hash of file']))
+                          for file_dict in snapshot_io.iter_snapshot_records(prnt_debug, file_name,
+                                                                             ['full path', 'hash of file'])))
+        if previous_id is not None:
+            conn.execute('''UPDATE versions SET last_id = ?
+                            WHERE last_id = ?
+                            AND hash = (SELECT hash FROM current_records WHERE current_records.path = versions.path)''',
+                         (snapshot_id, previous_id))
+        conn.execute('''INSERT INTO versions (path, hash, first_id, last_id)
+                        SELECT path, hash, ?, ? FROM current_records
+                        WHERE NOT EXISTS (SELECT 1 FROM versions WHERE versions.path = current_records.path
+                                                                  AND versions.last_id = ?)''',
+                     (snapshot_id, snapshot_id, snapshot_id))
+    finally:
+        conn.execute('DROP TABLE current_records')
+
+def update_index(prnt_debug, path_to_json):
+    """
+    index every snapshot in the catalog that is not indexed yet, oldest first; returns how many were added.
+    Each snapshot is committed on its own, so an interrupted update resumes where it stopped.
+    """
+    conn = open_index(path_to_json)
+    try:
+        set_of_indexed = set(conn.execute('SELECT file, created FROM snapshots'))
+        dict_of_latest = dict(conn.execute('SELECT prefix, max(created) FROM snapshots GROUP BY prefix'))
+        number_added = 0
+        for entry in snapshot_io.read_catalog(prnt_debug, path_to_json):
+            if (entry['file'], entry['created']) in set_of_indexed:
+                continue
+            file_name = path_to_json+'/'+entry['file']
+            if not os.path.exists(file_name):
+                if prnt_debug: print('not indexed, deleted before it was indexed:', file_name)
+                continue
+            if entry['created'] < dict_of_latest.get(entry['prefix'], ''):
+                if prnt_debug: print('not indexed, older than the newest indexed snapshot:', file_name)
+                continue
+            add_snapshot(prnt_debug, conn, file_name, entry)
+            conn.commit()
+            dict_of_latest[entry['prefix']] = entry['created']
+            number_added += 1
+            if prnt_debug: print('indexed', file_name)
+        return number_added
+    finally:
+        conn.close()
+
+def path_history(conn, path):
+    """
+    every digest path had, oldest first, as (hex digest, created of the first snapshot, created of the last snapshot)
+    """
+    return [(hash_of_file.hex(), first_created, last_created) for hash_of_file, first_created, last_created in conn.execute(
+        '''SELECT versions.hash, first.created, last.created FROM versions
+           JOIN snapshots AS first ON first.id = versions.first_id
+           JOIN snapshots AS last ON last.id = versions.last_id
+           WHERE versions.path = ? ORDER BY versions.first_id''', (snapshot_io.path_to_sqlite(path),))]
+
+def hash_history(conn, hash_of_file):
+    """
+    every path that held the content, in the order it appeared there,
+    as (path, created of the first snapshot, created of the last snapshot)
+    """
+    return [(snapshot_io.path_from_sqlite(path), first_created, last_created)
+            for path, first_created, last_created in conn.execute(
+        '''SELECT versions.path, first.created, last.created FROM versions
+           JOIN snapshots AS first ON first.id = versions.first_id
+           JOIN snapshots AS last ON last.id = versions.last_id
+           WHERE versions.hash = ? ORDER BY versions.first_id, versions.path''', (bytes.fromhex(hash_of_file),))]
+
+def last_change(conn, path):
+    """
+    created of the first snapshot with the content path has now (or had last), or None when it was never indexed
+    """
+    list_of_versions = path_history(conn, path)
+    if len(list_of_versions) == 0:
+        return None
+    return list_of_versions[-1][1]
+
+def history_to_str(list_of_versions):
+    """
+    >>> print(history_to_str([('ab12', '2019-11-10T16:19:00', '2019-11-17T16:19:00')]))
+    ab12 2019-11-10T16:19:00 to 2019-11-17T16:19:00
+    """
+    return '\n'.join(first+' '+second+' to '+third for first, second, third in list_of_versions)
+
+
+if __name__ == '__main__':
+
+    prnt_debug, path_to_json, query_options = args_use(sys.argv)
+    if query_options['update']:
+        print('indexed', update_index(prnt_debug, path_to_json), 'snapshots')
+    conn = open_index(path_to_json)
+    if query_options['path'] != '':
+        print(history_to_str(path_history(conn, query_options['path'])))
+        print('last changed:', last_change(conn, query_options['path']))
+    if query_options['hash'] != '':
+        print(history_to_str(hash_history(conn, query_options['hash'])))
+    conn.close()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+
+"""
+keep the hashing stage of change_tracker.py within an I/O budget on a live volume
+
+* read order: the files to hash are read in walk order by default. "inode" sorts them by (device, inode),
+  which on most file systems follows allocation order; "extent" sorts them by the physical offset of their
+  first extent (Linux FIEMAP), falling back to the inode for files and file systems without extent maps.
+  Both cut seeking on spinning disks; on SSDs the walk order is as good and "extent" costs an extra open per file.
+* throttling: a token bucket caps the bytes read per second and the read calls per second (IOPS)
+  across all hashing threads; with --pool="process" each process gets an equal share of the budget.
+* cache hints: posix_fadvise tells the kernel the file is read sequentially, and with drop_cache
+  that its pages are not needed afterwards, so a scan does not push the applications' data out of the page cache.
+  The pages of a scanned file are dropped whether or not the scan brought them in.
+
+standard use:
+python3 change_tracker.py --search_path="/home/jovyan/tmp" --write_path="." --read_order="extent" --max_bytes_per_second="52428800" --max_iops="200" --drop_cache
+
+*********************
+# https://www.kernel.org/doc/html/latest/filesystems/fiemap.html
+# https://man7.org/linux/man-pages/man2/posix_fadvise.2.html
+# https://docs.python.org/3/library/doctest.html
+python3 -m doctest io_scheduler.py
+
+"""
+
+import os
+import struct
+import threading
+import time
+try:
+    import fcntl # FIEMAP; not on Windows
+except ImportError:
+    fcntl = None
+
+READ_ORDERS = ['walk', 'inode', 'extent']
+
+# from linux/fs.h and linux/fiemap.h
+FS_IOC_FIEMAP = 0xC020660B
+FIEMAP_HEADER = struct.Struct('=QQLLLL') # fm_start, fm_length, fm_flags, fm_mapped_extents, fm_extent_count, fm_reserved
+FIEMAP_EXTENT_SIZE = 56 # fe_logical, fe_physical, fe_length, 2 reserved, fe_flags, 3 reserved
+
+class Throttle:
+    """
+    token buckets for bytes and read calls, shared by every thread that hashes;
+    a bucket holds at most one second of its rate, so bursts stay short.
+    A caller takes what it used and sleeps off any debt, so the long run average stays under the ceiling.
+    A rate of 0 is no limit.
+    """
+    def __init__(self, bytes_per_second=0, ops_per_second=0):
+        self.bytes_per_second = bytes_per_second
+        self.ops_per_second = ops_per_second
+        self.byte_tokens = float(bytes_per_second)
+        self.op_tokens = float(ops_per_second)
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self, number_of_bytes, number_of_ops=1):
+        """
+        account for one read; returns the seconds slept
+
+        >>> Throttle(0, 0).wait(1024)
+        0.0
+        """
+        with self.lock:
+            now = time.monotonic()
+            elapsed = now - self.last_refill
+            self.last_refill = now
+            delay = 0.0
+            if self.bytes_per_second > 0:
+                self.byte_tokens = min(self.byte_tokens + elapsed*self.bytes_per_second, self.bytes_per_second)
+                self.byte_tokens -= number_of_bytes
+                delay = max(delay, -self.byte_tokens/self.bytes_per_second)
+            if self.ops_per_second > 0:
+                self.op_tokens = min(self.op_tokens + elapsed*self.ops_per_second, self.ops_per_second)
+                self.op_tokens -= number_of_ops
+                delay = max(delay, -self.op_tokens/self.ops_per_second)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+_process_throttles = {}
+_process_throttles_lock = threading.Lock()
+
+def shared_throttle(bytes_per_second, ops_per_second):
+    """
+    the one Throttle of this process for these rates (None when both are 0), so the threads of a pool share a budget
+    """
+    if bytes_per_second <= 0 and ops_per_second <= 0:
+        return None
+    with _process_throttles_lock:
+        key = (bytes_per_second, ops_per_second)
+        if key not in _process_throttles:
+            _process_throttles[key] = Throttle(bytes_per_second, ops_per_second)
+        return _process_throttles[key]
+
+def advise_sequential(file_descriptor):
+    """
+    ask for aggressive readahead; a no-op where posix_fadvise is missing
+    """
+    if hasattr(os, 'posix_fadvise'):
+        os.posix_fadvise(file_descriptor, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+def drop_cached_pages(file_descriptor):
+    """
+    tell the kernel the file's cached pages will not be needed again
+    """
+    if hasattr(os, 'posix_fadvise'):
+        os.posix_fadvise(file_descriptor, 0, 0, os.POSIX_FADV_DONTNEED)
+
+def physical_offset_of_file(filename):
+    """
+    the physical byte offset of the first extent of the file, or None when the file system
+    has no extent map for it (no FIEMAP support, empty or inline files, not Linux)
+    """
+    if fcntl is None:
+        return None
+    buf = bytearray(FIEMAP_HEADER.size + FIEMAP_EXTENT_SIZE)
+    FIEMAP_HEADER.pack_into(buf, 0, 0, 0xFFFFFFFFFFFFFFFF, 0, 0, 1, 0)
+    try:
+        with open(filename, 'rb') as fil:
+            fcntl.ioctl(fil.fileno(), FS_IOC_FIEMAP, buf, True)
+    except OSError:
+        return None
+    if FIEMAP_HEADER.unpack_from(buf, 0)[3] == 0:
+        return None
+    # fe_physical follows fe_logical in the first extent
+    return struct.unpack_from('=Q', buf, FIEMAP_HEADER.size + 8)[0]
+
+def read_order(prnt_debug, list_of_filenames, list_of_stats, order='walk'):
+    """
+    the indices of list_of_filenames in the order they should be read;
+    list_of_stats holds the stat dict (see change_tracker.stat_to_dict) of each file
+
+    >>> read_order(False, ['a', 'b', 'c'], [{'device': 1, 'inode': 9}, {'device': 1, 'inode': 2}, {'device': 0, 'inode': 5}], 'inode')
+    [2, 1, 0]
+    """
+    if order == 'walk':
+        return list(range(len(list_of_filenames)))
+    if order == 'inode':
+        return sorted(range(len(list_of_filenames)),
+                      key=lambda indx: (list_of_stats[indx]['device'], list_of_stats[indx]['inode']))
+    if order != 'extent':
+        raise Exception('ERROR: read order must be one of', READ_ORDERS)
+    list_of_keys = []
+    number_without_extents = 0
+    for filename, file_stat in zip(list_of_filenames, list_of_stats):
+        physical_offset = physical_offset_of_file(filename)
+        if physical_offset is None:
+            number_without_extents += 1
+            list_of_keys.append((file_stat['device'], 1, file_stat['inode']))
+        else:
+            list_of_keys.append((file_stat['device'], 0, physical_offset))
+    if prnt_debug and number_without_extents > 0:
+        print(number_without_extents, 'of', len(list_of_filenames), 'files have no extent map; ordered by inode')
+    return sorted(range(len(list_of_filenames)), key=list_of_keys.__getitem__)
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+
+"""
+join the partial snapshots of a sharded scan into one snapshot
+
+change_tracker.py --shard="i/n" writes shard i of n to shards/ under the write path.
+Once all n shards are there (they can be scanned by any number of machines, in any order, and rerun one by one),
+this writes one ordinary snapshot from them: the records of every shard in path order, with the directory
+digests computed over the whole tree, listed in the catalog like any other snapshot,
+so diff_changes.py, find_dupes.py and rolling_logs.py use it unchanged.
+
+The shards have to come from the same search path, hash settings and shard method.
+They are deleted after a successful merge (--keep_shards keeps them), so the next merge
+cannot pick up a stale shard left over from an earlier run.
+
+standard use:
+for i in 0 1 2 3; do python3 change_tracker.py --search_path="/home/jovyan/tmp" --write_path="." --shard="$i/4" & done; wait
+python3 merge_shards.py --write_path="." --shard_count="4"
+
+python3 merge_shards.py --write_path="." --shard_count="4" --output_prefix="logs" --format="sqlite" --debug
+
+*********************
+# https://docs.python.org/3/library/doctest.html
+python3 -m doctest merge_shards.py
+
+"""
+
+import heapq # merge the shards in path order
+import operator
+import os
+import sys
+import change_tracker as ct
+import snapshot_io
+import history_index
+
+def parse_args(list_of_args):
+    """
+    >>> parse_args(['name of py script', '--write_path=.', '--shard_count=4'])
+    (False, '.', 'log', {'shard_count': 4, 'format': '', 'keep_shards': False, 'index': False})
+    >>> parse_args(['name of py script', 'invalid arg'])
+    Traceback (most recent call last):
+    ...
+    Exception: ERROR: shard_count is required and must be at least 1
+    """
+    prnt_debug = False
+    write_path = '.'
+    output_prefix = 'log'
+    merge_options = {'shard_count': '0', 'format': '', 'keep_shards': False, 'index': False}
+    for arg in list_of_args:
+        if '--debug' in arg:
+            prnt_debug = True
+        elif '--write_path' in arg:
+            write_path = arg.replace('--write_path=', '')
+        elif '--output_prefix' in arg:
+            output_prefix = arg.replace('--output_prefix=', '')
+        elif '--shard_count' in arg:
+            merge_options['shard_count'] = arg.replace('--shard_count=', '')
+        elif '--format' in arg:
+            merge_options['format'] = arg.replace('--format=', '')
+        elif '--keep_shards' in arg:
+            merge_options['keep_shards'] = True
+        elif '--index' in arg:
+            merge_options['index'] = True
+    try:
+        merge_options['shard_count'] = int(merge_options['shard_count'])
+    except ValueError:
+        raise Exception('ERROR: shard_count must be an integer:', merge_options['shard_count'])
+    if merge_options['shard_count'] < 1:
+        raise Exception('ERROR: shard_count is required and must be at least 1')
+    if merge_options['format'] not in [''] + list(snapshot_io.SNAPSHOT_FORMATS.keys()):
+        raise Exception('ERROR: format must be one of', list(snapshot_io.SNAPSHOT_FORMATS.keys()))
+    if not os.path.exists(write_path):
+        raise Exception('ERROR: provided write path does not exist:', write_path)
+    return prnt_debug, write_path, output_prefix, merge_options
+
+def args_use(list_of_args):
+    """
+    >>> args_use(['name of file'])
+    Traceback (most recent call last):
+    ...
+    SystemExit: 1
+    """
+    if len(list_of_args) == 1:
+        print('ERROR: invalid number of arguments')
+        print('required arguments:')
+        print('  --write_path="/path/to/write" (the write path the shards were scanned to)')
+        print('  --shard_count="4"')
+        print('optional arguments:')
+        print('  --output_prefix="logs"')
+        print('  --format="json" (or sqlite, pathtable; default: the format of the shards)')
+        print('  --keep_shards')
+        print('  --index (update the history index, see history_index.py)')
+        print('  --debug')
+        sys.exit(1)
+    elif len(list_of_args) > 1:
+        return parse_args(list_of_args)
+    else:
+        raise Exception('invalid option')
+
+def list_shard_files(prnt_debug, write_path, output_prefix, shard_count):
+    """
+    the shard files of one sharded scan, by shard index; every shard has to be present
+    """
+    list_of_shard_files = []
+    list_of_missing = []
+    for shard_index in range(shard_count):
+        list_of_found = [snapshot_io.shard_file_name(write_path, output_prefix, shard_index, shard_count, snapshot_format)
+                         for snapshot_format in snapshot_io.SNAPSHOT_FORMATS]
+        list_of_found = [file_name for file_name in list_of_found if os.path.exists(file_name)]
+        if len(list_of_found) == 0:
+            list_of_missing.append(shard_index)
+        elif len(list_of_found) > 1:
+            raise Exception('ERROR: shard written in more than one format:', list_of_found)
+        else:
+            list_of_shard_files.append(list_of_found[0])
+    if len(list_of_missing) > 0:
+        raise Exception('ERROR: shards not scanned yet (rerun them with --shard="i/'+str(shard_count)+'"):',
+                        list_of_missing)
+    if prnt_debug: print('shards:', list_of_shard_files)
+    return list_of_shard_files
+
+def check_shard_headers(list_of_headers, shard_count):
+    """
+    the shards must cover the same tree the same way; returns the header of the merged snapshot
+
+    >>> check_shard_headers([{'search path': '/r', 'shard': [0, 2], 'shard_by': 'top'}, {'search path': '/r', 'shard': [1, 2], 'shard_by': 'top'}], 2)['merged shards']
+    2
+    """
+    first_header = list_of_headers[0]
+    for shard_index, header in enumerate(list_of_headers):
+        if header.get('shard') != [shard_index, shard_count]:
+            raise Exception('ERROR: not shard '+str(shard_index)+' of '+str(shard_count)+':', header.get('shard'))
+        for key in ['search path', 'shard_by']:
+            if header.get(key) != first_header.get(key):
+                raise Exception('ERROR: shards differ in '+key+':', first_header.get(key), header.get(key))
+        if ct.hash_settings(header) != ct.hash_settings(first_header):
+            raise Exception('ERROR: shards were hashed differently:',
+                            ct.hash_settings(first_header), ct.hash_settings(header))
+    merged_header = ct.snapshot_header(first_header['search path'], dict(first_header, shard=None))
+    merged_header['merged shards'] = shard_count
+    merged_header['shard_by'] = first_header['shard_by']
+    return merged_header
+
+def iter_merged_records(prnt_debug, list_of_shard_files):
+    """
+    the records of every shard in 'full path' order; a path found in two shards
+    (a directory reached through a symlink from two top-level entries) is kept once
+    """
+    path_key = operator.itemgetter('full path')
+    list_of_iterators = [snapshot_io.iter_sorted_records(prnt_debug, shard_file) for shard_file in list_of_shard_files]
+    previous_path = None
+    for file_dict in heapq.merge(*list_of_iterators, key=path_key):
+        if file_dict['full path'] == previous_path:
+            continue
+        previous_path = file_dict['full path']
+        yield file_dict
+
+def merge_shards(prnt_debug, write_path, output_prefix, merge_options):
+    """
+    write the merged snapshot and list it in the catalog; returns its file name
+    """
+    list_of_shard_files = list_shard_files(prnt_debug, write_path, output_prefix, merge_options['shard_count'])
+    list_of_headers = [snapshot_io.read_snapshot_header(shard_file) for shard_file in list_of_shard_files]
+    header = check_shard_headers(list_of_headers, merge_options['shard_count'])
+    snapshot_format = merge_options['format'] or snapshot_io.snapshot_format_of_file(list_of_shard_files[0])
+    # two passes over the merged records, neither of which holds them: the snapshot writers take the directory
+    # digests (over the whole tree, as for an unsharded scan) before the records
+    dict_of_directories = ct.directory_hashes_of_sorted(iter_merged_records(prnt_debug, list_of_shard_files),
+                                                        header['search path'], header['hash'], header['digest_size'])
+    file_name = ct.write_list_of_dicts_to_snapshot(prnt_debug, iter_merged_records(prnt_debug, list_of_shard_files),
+                                                   write_path, output_prefix, snapshot_format, header,
+                                                   dict_of_directories)
+    if not merge_options['keep_shards']:
+        for shard_file in list_of_shard_files:
+            os.remove(shard_file)
+    if merge_options['index']:
+        history_index.update_index(prnt_debug, write_path)
+    return file_name
+
+
+if __name__ == '__main__':
+
+    prnt_debug, write_path, output_prefix, merge_options = args_use(sys.argv)
+    print('wrote', merge_shards(prnt_debug, write_path, output_prefix, merge_options))
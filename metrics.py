@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+
+"""
+instrumentation shared by change_tracker.py, diff_changes.py, find_dupes.py, rolling_logs.py and track.py
+
+Each tool accepts
+  --metrics="run_metrics.json"   write a machine readable summary of the run when it ends
+  --progress="30"                print a progress line every 30 seconds during long phases
+  --profile="run.prof"           run under cProfile and dump the stats when it ends
+
+The summary holds, per phase, the wall and CPU time, items and bytes processed and their rates;
+the time split between walking directories, stat, open, read, hash and waiting on the I/O throttle;
+counters such as permission errors and skipped entries; and the slowest directories and largest files.
+CPU time is for the whole process, so it includes worker threads but not worker processes (--pool="process").
+Reads through mmap (--mmap_threshold) are counted as hashing, since the page faults happen inside the hash.
+
+standard use:
+python3 change_tracker.py --search_path="/home/jovyan/tmp" --write_path="." --metrics="scan_metrics.json" --progress="30"
+
+python3 diff_changes.py --path_to_json="." --metrics="diff_metrics.json" --profile="diff.prof"
+
+python3 -m json.tool < scan_metrics.json
+
+*********************
+# https://docs.python.org/3/library/profile.html
+python3 -c "import pstats; pstats.Stats('diff.prof').sort_stats('cumulative').print_stats(30)"
+
+*********************
+# https://docs.python.org/3/library/doctest.html
+python3 -m doctest metrics.py
+
+"""
+
+import atexit # write the summary and the profile however the tool exits
+import contextlib
+import cProfile
+import datetime
+import heapq # slowest directories, largest files
+import json
+import os
+import pstats
+import threading
+import time
+
+# the parts of a scan the I/O split is made of
+IO_PARTS = ['walk', 'stat', 'open', 'read', 'hash', 'throttle']
+
+def parse_args(list_of_args):
+    """
+    the metrics options; every other argument is left to the tool
+
+    >>> parse_args(['name of py script', '--metrics=m.json', '--progress=30'])
+    {'metrics': 'm.json', 'progress': 30.0, 'profile': '', 'top': 10}
+    """
+    metrics_options = {'metrics': '', 'progress': '0', 'profile': '', 'top': '10'}
+    for arg in list_of_args:
+        if arg.startswith('--metrics='):
+            metrics_options['metrics'] = arg.replace('--metrics=', '')
+        elif arg.startswith('--progress='):
+            metrics_options['progress'] = arg.replace('--progress=', '')
+        elif arg.startswith('--profile='):
+            metrics_options['profile'] = arg.replace('--profile=', '')
+        elif arg.startswith('--metrics_top='):
+            metrics_options['top'] = arg.replace('--metrics_top=', '')
+    try:
+        metrics_options['progress'] = float(metrics_options['progress'])
+        metrics_options['top'] = int(metrics_options['top'])
+    except ValueError:
+        raise Exception('ERROR: progress and metrics_top must be numbers:', metrics_options['progress'], metrics_options['top'])
+    return metrics_options
+
+class Metrics:
+    """
+    counters and timers for one run; safe to update from worker threads
+    """
+    def __init__(self, tool_name, progress_every=0, top=10):
+        self.tool_name = tool_name
+        self.progress_every = progress_every
+        self.top = top
+        self.started = datetime.datetime.now().isoformat(timespec='seconds')
+        self.lock = threading.Lock()
+        self.dict_of_phases = {} # name: {'wall seconds', 'cpu seconds', 'items', 'bytes'}
+        self.dict_of_counters = {}
+        self.dict_of_io = {part: 0.0 for part in IO_PARTS}
+        self.dict_of_dir_seconds = {}
+        self.list_of_largest = [] # min-heap of (size, path), at most top entries
+        self.dict_of_progress = {'phase': '', 'items': 0, 'bytes': 0, 'started': time.time(), 'printed': time.time()}
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """
+        time a phase; items and bytes added with add_progress while it runs are credited to it
+        """
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        with self.lock:
+            self.dict_of_progress.update({'phase': name, 'items': 0, 'bytes': 0, 'started': time.time()})
+        try:
+            yield self
+        finally:
+            with self.lock:
+                phase_dict = self.dict_of_phases.setdefault(name, {'wall seconds': 0.0, 'cpu seconds': 0.0,
+                                                                   'items': 0, 'bytes': 0})
+                phase_dict['wall seconds'] += time.perf_counter() - wall_start
+                phase_dict['cpu seconds'] += time.process_time() - cpu_start
+                phase_dict['items'] += self.dict_of_progress['items']
+                phase_dict['bytes'] += self.dict_of_progress['bytes']
+                self.dict_of_progress.update({'items': 0, 'bytes': 0})
+
+    def count(self, name, number=1):
+        with self.lock:
+            self.dict_of_counters[name] = self.dict_of_counters.get(name, 0) + number
+
+    def add_io(self, dict_of_seconds):
+        """
+        dict_of_seconds maps parts of IO_PARTS to seconds spent in them
+        """
+        with self.lock:
+            for part, seconds in dict_of_seconds.items():
+                self.dict_of_io[part] += seconds
+
+    def add_directory_time(self, dir_path, seconds):
+        with self.lock:
+            self.dict_of_dir_seconds[dir_path] = self.dict_of_dir_seconds.get(dir_path, 0.0) + seconds
+
+    def add_file(self, path, size):
+        """
+        keep track of the largest files
+        """
+        if len(self.list_of_largest) >= self.top and size <= self.list_of_largest[0][0]:
+            return
+        with self.lock:
+            if len(self.list_of_largest) < self.top:
+                heapq.heappush(self.list_of_largest, (size, path))
+            elif size > self.list_of_largest[0][0]:
+                heapq.heapreplace(self.list_of_largest, (size, path))
+
+    def add_progress(self, items=1, number_of_bytes=0):
+        """
+        credit items and bytes to the current phase, and print a progress line when one is due
+        """
+        with self.lock:
+            self.dict_of_progress['items'] += items
+            self.dict_of_progress['bytes'] += number_of_bytes
+            now = time.time()
+            if self.progress_every <= 0 or now - self.dict_of_progress['printed'] < self.progress_every:
+                return
+            self.dict_of_progress['printed'] = now
+            elapsed = max(now - self.dict_of_progress['started'], 1e-9)
+            print('progress:', self.dict_of_progress['phase'], self.dict_of_progress['items'], 'items,',
+                  round(self.dict_of_progress['bytes']/1e6, 1), 'MB,',
+                  round(self.dict_of_progress['items']/elapsed), 'items/s,',
+                  round(self.dict_of_progress['bytes']/1e6/elapsed, 1), 'MB/s', flush=True)
+
+    def summary(self):
+        """
+        the run as a JSON-ready dict
+        """
+        with self.lock:
+            dict_of_phases = {}
+            for name, phase_dict in self.dict_of_phases.items():
+                phase_dict = dict(phase_dict)
+                wall_seconds = max(phase_dict['wall seconds'], 1e-9)
+                phase_dict['items per second'] = phase_dict['items']/wall_seconds
+                phase_dict['bytes per second'] = phase_dict['bytes']/wall_seconds
+                dict_of_phases[name] = phase_dict
+            return {'tool': self.tool_name,
+                    'started': self.started,
+                    'finished': datetime.datetime.now().isoformat(timespec='seconds'),
+                    'phases': dict_of_phases,
+                    'io seconds': dict(self.dict_of_io),
+                    'counters': dict(self.dict_of_counters),
+                    'slowest directories': [{'path': dir_path, 'seconds': seconds} for dir_path, seconds in
+                                            heapq.nlargest(self.top, self.dict_of_dir_seconds.items(),
+                                                           key=lambda item: item[1])],
+                    'largest files': [{'path': path, 'bytes': size} for size, path in
+                                      sorted(self.list_of_largest, reverse=True)]}
+
+    def write(self, file_name):
+        """
+        written to a temporary file and renamed, so a reader never sees half a summary
+        """
+        with open(file_name+'.tmp', 'w') as fil:
+            json.dump(self.summary(), fil, indent=1)
+        os.replace(file_name+'.tmp', file_name)
+
+def phase(run_metrics, name):
+    """
+    run_metrics.phase(name), or a context that does nothing when metrics are off
+
+    >>> with phase(None, 'crawl'):
+    ...     pass
+    """
+    if run_metrics is None:
+        return contextlib.nullcontext()
+    return run_metrics.phase(name)
+
+def start_metrics(prnt_debug, metrics_options, tool_name):
+    """
+    returns a Metrics when --metrics or --progress asks for one (None otherwise), and starts cProfile
+    for --profile; the summary and the profile are written when the process exits, sys.exit included
+    """
+    if metrics_options['profile'] != '':
+        profiler = cProfile.Profile()
+        def dump_profile():
+            profiler.disable()
+            profiler.dump_stats(metrics_options['profile'])
+            if prnt_debug:
+                pstats.Stats(profiler).sort_stats('cumulative').print_stats(20)
+            print('wrote profile', metrics_options['profile'])
+        atexit.register(dump_profile)
+        profiler.enable()
+    if metrics_options['metrics'] == '' and metrics_options['progress'] <= 0:
+        return None
+    run_metrics = Metrics(tool_name, metrics_options['progress'], metrics_options['top'])
+    if metrics_options['metrics'] != '':
+        def write_metrics():
+            run_metrics.write(metrics_options['metrics'])
+            if prnt_debug: print('wrote metrics', metrics_options['metrics'])
+        atexit.register(write_metrics)
+    return run_metrics
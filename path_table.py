@@ -0,0 +1,477 @@
+#!/usr/bin/env python
+
+"""
+a compact, column oriented table of snapshot records, for trees with millions of files
+
+A record dict holds the full path string, a hex digest and a handful of ints as separate Python objects,
+which costs several hundred bytes per file, most of it repeated directory prefixes.
+A PathTable stores instead
+* a directory table: each directory once, as its parent directory id and the part of the path that follows it
+* per file: the id of its directory and its (interned) basename
+* the digests as raw bytes, back to back in one bytearray
+* size, mtime_ns, inode, device and runs since hash in typed arrays (8 bytes per value)
+* block hashes only for the few files that have a block map
+* with change_tracker.py --verify_every, the sample digests (same width as the digests) and the
+  time each file was last fully verified
+Full paths and hex digests are only built when a record is read back out (for output, or for a diff event).
+
+The same columns are the "pathtable" snapshot format (extension .pathtable), each column zlib compressed:
+PATHTABLE 1
+{header}
+{layout: row count, digest size, byte order, and the length of each section}
+<sections>
+
+standard use:
+python3 change_tracker.py --search_path="/home/jovyan/tmp" --write_path="." --compact --format="pathtable"
+
+python3 diff_changes.py --path_to_json="." --compact
+
+python3 snapshot_io.py --input="logs_2019-11-10T16-19.pathtable" --output_format="json"
+
+*********************
+# https://docs.python.org/3/library/array.html
+# https://docs.python.org/3/library/doctest.html
+python3 -m doctest path_table.py
+
+"""
+
+import array
+import json
+import os
+import sys
+import zlib
+
+MAGIC_LINE = b'PATHTABLE 1\n'
+
+# the sections of a pathtable snapshot, in the order they are written
+SECTIONS = ['directories', 'dir parents', 'dir suffixes', 'parents', 'names', 'digests',
+            'sizes', 'mtimes', 'inodes', 'devices', 'runs', 'block hashes', 'samples', 'has sample', 'verified']
+
+# the stat keys of a record, and the array column that holds each
+STAT_COLUMNS = [('size', 'sizes'), ('mtime_ns', 'mtimes'), ('inode', 'inodes'), ('device', 'devices')]
+
+NO_PARENT = -1 # dir parents of a directory whose parent is not in the table
+MISSING = -1 # sizes, runs and verified times of records written without them
+
+def join_path(dir_path, name):
+    """
+    the inverse of os.path.split
+
+    >>> join_path('/r/a', 'x')
+    '/r/a/x'
+    >>> join_path('/', 'x')
+    '/x'
+    >>> join_path('', 'x')
+    'x'
+    """
+    if dir_path == '' or dir_path.endswith('/'):
+        return dir_path + name
+    return dir_path + '/' + name
+
+def encode_strings(list_of_strings):
+    return '\0'.join(list_of_strings).encode('utf-8', 'surrogateescape')
+
+def decode_strings(data, number_of_strings):
+    """
+    >>> decode_strings(encode_strings(['', 'b']), 2)
+    ['', 'b']
+    """
+    if number_of_strings == 0:
+        return []
+    return [sys.intern(this_str) for this_str in data.decode('utf-8', 'surrogateescape').split('\0')]
+
+class PathTable:
+    """
+    snapshot records as columns; iterating yields record dicts, like a list of records would
+
+    >>> table = PathTable()
+    >>> table.append({'full path': '/r/a/x', 'hash of file': '01ff', 'size': 3, 'mtime_ns': 4, 'inode': 5, 'device': 6, 'runs since hash': 0})
+    0
+    >>> table.append({'full path': '/r/a/y', 'hash of file': '02ff'})
+    1
+    >>> list(table)[1]
+    {'full path': '/r/a/y', 'hash of file': '02ff'}
+    >>> table.list_of_dirs
+    ['/', '/r', '/r/a']
+    >>> table.get('/r/a/x')['size']
+    3
+    """
+    __slots__ = ['list_of_dirs', 'dict_of_dir_ids', 'dir_parents', 'parents', 'names', 'digest_size', 'digests',
+                 'sizes', 'mtimes', 'inodes', 'devices', 'runs', 'dict_of_blocks', 'samples', 'has_sample', 'verified',
+                 'dict_of_dir_rows',
+                 'cached_dir', 'dict_of_cached_rows']
+
+    def __init__(self, digest_size=0):
+        self.list_of_dirs = [] # directory id: directory path
+        self.dict_of_dir_ids = {} # directory path: directory id
+        self.dir_parents = array.array('q')
+        self.parents = array.array('q') # per file: directory id
+        self.names = [] # per file: basename
+        self.digest_size = digest_size # bytes per digest; 0 until the first digest is seen
+        self.digests = bytearray()
+        self.sizes = array.array('q')
+        self.mtimes = array.array('q')
+        self.inodes = array.array('Q')
+        self.devices = array.array('Q')
+        self.runs = array.array('q')
+        self.dict_of_blocks = {} # row: list of block hex digests
+        self.samples = bytearray() # per file: sample digest, see change_tracker.verify_files
+        self.has_sample = bytearray() # per file: 1 when it has a sample digest
+        self.verified = array.array('q') # per file: seconds since the epoch of the last full verification
+        self.dict_of_dir_rows = None # directory id: array of rows, built by find
+        self.cached_dir = None
+        self.dict_of_cached_rows = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return self.iter_records()
+
+    def dir_id(self, dir_path):
+        """
+        the id of dir_path, added (with its parents) if missing
+        """
+        dir_id = self.dict_of_dir_ids.get(dir_path)
+        if dir_id is not None:
+            return dir_id
+        parent_path = os.path.dirname(dir_path)
+        if parent_path == dir_path or parent_path == '':
+            parent_id = NO_PARENT
+        else:
+            parent_id = self.dir_id(parent_path)
+        dir_path = sys.intern(dir_path)
+        dir_id = len(self.list_of_dirs)
+        self.list_of_dirs.append(dir_path)
+        self.dict_of_dir_ids[dir_path] = dir_id
+        self.dir_parents.append(parent_id)
+        return dir_id
+
+    def add(self, full_path, hash_of_file, file_stat=None, runs_since_hash=MISSING, list_of_blocks=None):
+        """
+        add one file; hash_of_file is a hex digest, or None for a row whose digest is set later (set_digest).
+        file_stat is a dict of the STAT_COLUMNS keys, as from change_tracker.stat_to_dict. returns the row
+        """
+        row = len(self.names)
+        dir_path, name = os.path.split(full_path)
+        self.parents.append(self.dir_id(dir_path))
+        self.names.append(sys.intern(name))
+        self.digests.extend(bytes(self.digest_size))
+        self.samples.extend(bytes(self.digest_size))
+        self.has_sample.append(0)
+        self.verified.append(MISSING)
+        if hash_of_file is not None:
+            self.set_digest(row, hash_of_file)
+        if file_stat is None or 'size' not in file_stat:
+            file_stat = {'size': MISSING, 'mtime_ns': 0, 'inode': 0, 'device': 0}
+        self.sizes.append(file_stat['size'])
+        self.mtimes.append(file_stat['mtime_ns'])
+        self.inodes.append(file_stat['inode'])
+        self.devices.append(file_stat['device'])
+        self.runs.append(runs_since_hash)
+        if list_of_blocks is not None:
+            self.dict_of_blocks[row] = list_of_blocks
+        self.reset_directory_index()
+        return row
+
+    def append(self, file_dict):
+        """
+        add one record dict; returns the row
+        """
+        row = self.add(file_dict['full path'], file_dict.get('hash of file'), file_dict,
+                       file_dict.get('runs since hash', MISSING), file_dict.get('block hashes'))
+        if 'sample hash' in file_dict:
+            self.set_sample(row, file_dict['sample hash'])
+        if 'last verified' in file_dict:
+            self.verified[row] = file_dict['last verified']
+        return row
+
+    def update_row(self, row, file_dict):
+        """
+        overwrite the columns of a row with the values of a (partial) record dict
+        """
+        if 'hash of file' in file_dict:
+            self.set_digest(row, file_dict['hash of file'])
+        if 'runs since hash' in file_dict:
+            self.runs[row] = file_dict['runs since hash']
+        if 'block hashes' in file_dict:
+            self.set_blocks(row, file_dict['block hashes'])
+        if 'sample hash' in file_dict:
+            self.set_sample(row, file_dict['sample hash'])
+        if 'last verified' in file_dict:
+            self.verified[row] = file_dict['last verified']
+
+    def digest_bytes(self, hash_of_file):
+        """
+        a hex digest as bytes; the first digest fixes the width, and rows added before it hold no digest yet
+        """
+        digest = bytes.fromhex(hash_of_file)
+        if self.digest_size == 0:
+            self.digest_size = len(digest)
+            self.digests = bytearray(self.digest_size*len(self.names))
+            self.samples = bytearray(self.digest_size*len(self.names))
+        if len(digest) != self.digest_size:
+            raise Exception('ERROR: digests of different sizes in one table:', self.digest_size, hash_of_file)
+        return digest
+
+    def set_digest(self, row, hash_of_file):
+        self.digests[row*self.digest_size:(row+1)*self.digest_size] = self.digest_bytes(hash_of_file)
+
+    def set_sample(self, row, sample_hash):
+        self.samples[row*self.digest_size:(row+1)*self.digest_size] = self.digest_bytes(sample_hash)
+        self.has_sample[row] = 1
+
+    def set_blocks(self, row, list_of_blocks):
+        if list_of_blocks is None:
+            self.dict_of_blocks.pop(row, None)
+        else:
+            self.dict_of_blocks[row] = list_of_blocks
+
+    def digest(self, row):
+        """
+        the raw digest of a row, as bytes
+        """
+        return bytes(self.digests[row*self.digest_size:(row+1)*self.digest_size])
+
+    def hash_of_file(self, row):
+        return self.digests[row*self.digest_size:(row+1)*self.digest_size].hex()
+
+    def stat_key(self, row):
+        """
+        (size, mtime_ns, inode, device), or None for a record written without them
+        """
+        if self.sizes[row] == MISSING:
+            return None
+        return (self.sizes[row], self.mtimes[row], self.inodes[row], self.devices[row])
+
+    def dir_path(self, row):
+        return self.list_of_dirs[self.parents[row]]
+
+    def full_path(self, row):
+        return join_path(self.list_of_dirs[self.parents[row]], self.names[row])
+
+    def record(self, row, list_of_columns=None):
+        """
+        the record dict of one row, with the keys of a record from change_tracker.hash_list_of_files
+        """
+        file_dict = {}
+        if list_of_columns is None or 'full path' in list_of_columns:
+            file_dict['full path'] = self.full_path(row)
+        if list_of_columns is None or 'hash of file' in list_of_columns:
+            file_dict['hash of file'] = self.hash_of_file(row)
+        if self.sizes[row] != MISSING:
+            for key, column in STAT_COLUMNS:
+                if list_of_columns is None or key in list_of_columns:
+                    file_dict[key] = getattr(self, column)[row]
+        if self.runs[row] != MISSING and (list_of_columns is None or 'runs since hash' in list_of_columns):
+            file_dict['runs since hash'] = self.runs[row]
+        if row in self.dict_of_blocks and (list_of_columns is None or 'block hashes' in list_of_columns):
+            file_dict['block hashes'] = self.dict_of_blocks[row]
+        if self.has_sample[row] and (list_of_columns is None or 'sample hash' in list_of_columns):
+            file_dict['sample hash'] = self.samples[row*self.digest_size:(row+1)*self.digest_size].hex()
+        if self.verified[row] != MISSING and (list_of_columns is None or 'last verified' in list_of_columns):
+            file_dict['last verified'] = self.verified[row]
+        return file_dict
+
+    def iter_records(self, list_of_columns=None):
+        for row in range(len(self.names)):
+            yield self.record(row, list_of_columns)
+
+    def rows_by_directory(self):
+        """
+        directory id: array of the rows in that directory, in row order
+        """
+        if self.dict_of_dir_rows is None:
+            self.dict_of_dir_rows = {}
+            for row, dir_id in enumerate(self.parents):
+                rows = self.dict_of_dir_rows.get(dir_id)
+                if rows is None:
+                    rows = self.dict_of_dir_rows[dir_id] = array.array('q')
+                rows.append(row)
+            self.cached_dir = None
+        return self.dict_of_dir_rows
+
+    def reset_directory_index(self):
+        """
+        forget the rows by directory and the directory indexed by name; rows were added or removed
+        """
+        self.dict_of_dir_rows = None
+        self.cached_dir = None
+        self.dict_of_cached_rows = {}
+
+    def find(self, full_path):
+        """
+        the row of full_path, or None. Only one directory at a time is indexed by name,
+        so lookups in walk order (a directory's files one after another) cost one small dict per directory
+        """
+        dir_path, name = os.path.split(full_path)
+        return self.find_name(dir_path, name)
+
+    def find_name(self, dir_path, name):
+        """
+        find, for a path already split into its directory and basename
+        """
+        if dir_path != self.cached_dir:
+            dir_id = self.dict_of_dir_ids.get(dir_path)
+            rows = self.rows_by_directory().get(dir_id, [])
+            self.dict_of_cached_rows = {self.names[row]: row for row in rows}
+            self.cached_dir = dir_path
+        return self.dict_of_cached_rows.get(name)
+
+    def get(self, full_path, default=None):
+        """
+        the record of full_path, or default; a PathTable can stand in for a dict of full path: record
+        """
+        row = self.find(full_path)
+        if row is None:
+            return default
+        return self.record(row)
+
+    def remove_rows(self, set_of_rows):
+        """
+        drop set_of_rows (files that could not be hashed, for example); later rows move up
+        """
+        if len(set_of_rows) == 0:
+            return
+        list_of_kept = [row for row in range(len(self.names)) if row not in set_of_rows]
+        digest_size = self.digest_size
+        self.parents = array.array('q', (self.parents[row] for row in list_of_kept))
+        self.names = [self.names[row] for row in list_of_kept]
+        self.digests = bytearray(b''.join(self.digests[row*digest_size:(row+1)*digest_size] for row in list_of_kept))
+        self.samples = bytearray(b''.join(self.samples[row*digest_size:(row+1)*digest_size] for row in list_of_kept))
+        self.has_sample = bytearray(self.has_sample[row] for row in list_of_kept)
+        for column in ['sizes', 'mtimes', 'inodes', 'devices', 'runs', 'verified']:
+            old_column = getattr(self, column)
+            setattr(self, column, array.array(old_column.typecode, (old_column[row] for row in list_of_kept)))
+        dict_of_new_rows = {row: new_row for new_row, row in enumerate(list_of_kept) if row in self.dict_of_blocks}
+        self.dict_of_blocks = {dict_of_new_rows[row]: list_of_blocks for row, list_of_blocks in self.dict_of_blocks.items()
+                               if row in dict_of_new_rows}
+        self.reset_directory_index()
+
+    def dir_suffixes(self):
+        """
+        each directory as the part of its path after its parent's path; only roots are stored whole
+        """
+        list_of_suffixes = []
+        for dir_path, parent_id in zip(self.list_of_dirs, self.dir_parents):
+            if parent_id == NO_PARENT:
+                list_of_suffixes.append(dir_path)
+            else:
+                list_of_suffixes.append(dir_path[len(self.list_of_dirs[parent_id]):])
+        return list_of_suffixes
+
+def from_records(iterable_of_dicts):
+    """
+    a PathTable of record dicts
+    """
+    table = PathTable()
+    for file_dict in iterable_of_dicts:
+        table.append(file_dict)
+    return table
+
+def write_table_snapshot(iterable_of_dicts, file_name, header, dict_of_directories):
+    """
+    iterable_of_dicts is a PathTable, or records to build one from; returns the number of records written
+    """
+    table = iterable_of_dicts if isinstance(iterable_of_dicts, PathTable) else from_records(iterable_of_dicts)
+    dict_of_sections = {
+        'directories': json.dumps(sorted(dict_of_directories.items()), separators=(',', ':')).encode('utf-8', 'surrogateescape'),
+        'dir parents': table.dir_parents.tobytes(),
+        'dir suffixes': encode_strings(table.dir_suffixes()),
+        'parents': table.parents.tobytes(),
+        'names': encode_strings(table.names),
+        'digests': bytes(table.digests),
+        'sizes': table.sizes.tobytes(),
+        'mtimes': table.mtimes.tobytes(),
+        'inodes': table.inodes.tobytes(),
+        'devices': table.devices.tobytes(),
+        'runs': table.runs.tobytes(),
+        'block hashes': json.dumps(table.dict_of_blocks, separators=(',', ':')).encode('utf-8'),
+        'samples': bytes(table.samples),
+        'has sample': bytes(table.has_sample),
+        'verified': table.verified.tobytes()}
+    list_of_blobs = [zlib.compress(dict_of_sections[section]) for section in SECTIONS]
+    layout = {'rows': len(table), 'dirs': len(table.list_of_dirs), 'digest_size': table.digest_size,
+              'byteorder': sys.byteorder,
+              'sections': [[section, len(blob)] for section, blob in zip(SECTIONS, list_of_blobs)]}
+    with open(file_name, 'wb') as fil:
+        fil.write(MAGIC_LINE)
+        fil.write(json.dumps(header, separators=(',', ':')).encode('utf-8', 'surrogateescape')+b'\n')
+        fil.write(json.dumps(layout, separators=(',', ':')).encode('utf-8')+b'\n')
+        for blob in list_of_blobs:
+            fil.write(blob)
+    return len(table)
+
+def read_table_start(fil, file_name):
+    """
+    the header and the layout of an open pathtable snapshot; fil is left at the first section
+    """
+    if fil.readline() != MAGIC_LINE:
+        raise Exception('ERROR: not a pathtable snapshot:', file_name)
+    header = json.loads(fil.readline().decode('utf-8', 'surrogateescape'))
+    layout = json.loads(fil.readline().decode('utf-8'))
+    return header, layout
+
+def read_table_header(file_name):
+    with open(file_name, 'rb') as fil:
+        return read_table_start(fil, file_name)[0]
+
+def read_table_sections(file_name, set_of_sections):
+    """
+    the decompressed bytes of the sections in set_of_sections, and the layout; other sections are skipped over
+    """
+    dict_of_sections = {}
+    with open(file_name, 'rb') as fil:
+        header, layout = read_table_start(fil, file_name)
+        for section, length in layout['sections']:
+            if section in set_of_sections:
+                dict_of_sections[section] = zlib.decompress(fil.read(length))
+            else:
+                fil.seek(length, os.SEEK_CUR)
+    return dict_of_sections, layout
+
+def read_table_directory_hashes(file_name):
+    """
+    the (directory path, digest) pairs of a pathtable snapshot
+    """
+    dict_of_sections, layout = read_table_sections(file_name, set(['directories']))
+    return [tuple(pair) for pair in json.loads(dict_of_sections['directories'].decode('utf-8', 'surrogateescape'))]
+
+def read_table(file_name):
+    """
+    the PathTable stored in a pathtable snapshot
+    """
+    dict_of_sections, layout = read_table_sections(file_name, set(SECTIONS) - set(['directories']))
+    table = PathTable(layout['digest_size'])
+    def column(section, typecode):
+        values = array.array(typecode)
+        values.frombytes(dict_of_sections[section])
+        if layout['byteorder'] != sys.byteorder:
+            values.byteswap()
+        return values
+    table.dir_parents = column('dir parents', 'q')
+    for dir_id, suffix in enumerate(decode_strings(dict_of_sections['dir suffixes'], layout['dirs'])):
+        parent_id = table.dir_parents[dir_id]
+        dir_path = suffix if parent_id == NO_PARENT else table.list_of_dirs[parent_id] + suffix
+        dir_path = sys.intern(dir_path)
+        table.list_of_dirs.append(dir_path)
+        table.dict_of_dir_ids[dir_path] = dir_id
+    table.parents = column('parents', 'q')
+    table.names = decode_strings(dict_of_sections['names'], layout['rows'])
+    table.digests = bytearray(dict_of_sections['digests'])
+    for section, typecode in [('sizes', 'q'), ('mtimes', 'q'), ('inodes', 'Q'), ('devices', 'Q'), ('runs', 'q')]:
+        setattr(table, section, column(section, typecode))
+    table.dict_of_blocks = {int(row): list_of_blocks for row, list_of_blocks in
+                            json.loads(dict_of_sections['block hashes'].decode('utf-8')).items()}
+    if 'verified' in dict_of_sections:
+        table.samples = bytearray(dict_of_sections['samples'])
+        table.has_sample = bytearray(dict_of_sections['has sample'])
+        table.verified = column('verified', 'q')
+    else:
+        # written before --verify_every
+        table.samples = bytearray(len(table.digests))
+        table.has_sample = bytearray(layout['rows'])
+        table.verified = array.array('q', [MISSING])*layout['rows']
+    if len(table.names) != layout['rows']:
+        raise Exception('ERROR: pathtable snapshot is damaged; expected rows:', layout['rows'], len(table.names))
+    return table
@@ -9,6 +9,22 @@ python3 rolling_logs.py --path_to_json="/home/jovyan/tmp" --number_to_keep="4"
 
 python3 rolling_logs.py --path_to_json="/home/jovyan/tmp" --debug
 
+tiered retention: besides the newest number_to_keep, keep the newest snapshot of each of the last 7 days,
+13 weeks and 12 months (the snapshots are listed in snapshots.catalog, see snapshot_io.py):
+python3 rolling_logs.py --path_to_json="/home/jovyan/tmp" --number_to_keep="2" --keep_daily="7" --keep_weekly="13" --keep_monthly="12"
+
+keep a long history cheaply: every full snapshot is folded into history/<output prefix>/ as a delta against
+the previous one of the same prefix (one base snapshot plus one delta per run) before the old full snapshots are deleted.
+Deltas older than the newest deltas_to_keep are merged into a new base instead of piling up:
+python3 rolling_logs.py --path_to_json="/home/jovyan/tmp" --number_to_keep="2" --history --deltas_to_keep="52"
+
+rebuild the snapshot of any run still in the history (written to history/<output prefix>/restored_<timestamp>.json;
+a minute gives the last run of that minute):
+python3 rolling_logs.py --path_to_json="/home/jovyan/tmp" --restore="2019-11-10T16-19" --output_prefix="log"
+
+time the history, compaction and deletion (see metrics.py):
+python3 rolling_logs.py --path_to_json="/home/jovyan/tmp" --history --metrics="roll_metrics.json"
+
 ********************
 # https://docs.python.org/3/library/profile.html
 python -m cProfile -s time change_tracker.py --path="/home/jovyan/tmp" | head -n 100
@@ -36,8 +52,9 @@ import glob
 import sys
 import os
 import hashlib # hash of file
-import pandas
 import change_tracker as ct
+import snapshot_io
+import metrics
 
 def parse_args(list_of_args):
     """
@@ -51,6 +68,8 @@ def parse_args(list_of_args):
     path_to_json = '.'
     number_to_keep = '3'
     email_addr = 'none'
+    retention_options = {'history': False, 'deltas_to_keep': '52', 'restore': '', 'output_prefix': 'log',
+                         'keep_daily': '0', 'keep_weekly': '0', 'keep_monthly': '0'}
     for arg in list_of_args:
         if '--debug' in arg:
             prnt_debug = True
@@ -58,15 +77,36 @@ def parse_args(list_of_args):
             path_to_json = arg.replace('--path_to_json=', '')
         elif '--number_to_keep' in arg:
             number_to_keep = arg.replace('--number_to_keep=', '')
+        elif '--history' in arg:
+            retention_options['history'] = True
+        elif '--deltas_to_keep' in arg:
+            retention_options['deltas_to_keep'] = arg.replace('--deltas_to_keep=', '')
+        elif '--restore' in arg:
+            retention_options['restore'] = arg.replace('--restore=', '')
+        elif '--output_prefix' in arg:
+            retention_options['output_prefix'] = arg.replace('--output_prefix=', '')
+        elif '--keep_daily' in arg:
+            retention_options['keep_daily'] = arg.replace('--keep_daily=', '')
+        elif '--keep_weekly' in arg:
+            retention_options['keep_weekly'] = arg.replace('--keep_weekly=', '')
+        elif '--keep_monthly' in arg:
+            retention_options['keep_monthly'] = arg.replace('--keep_monthly=', '')
     try:
         number_to_keep = int(number_to_keep)
     except:
         print('unable to convert')
     if number_to_keep<1:
         raise Exception('ERROR: number to keep must be greater than 0')
+    for option_name in ['deltas_to_keep', 'keep_daily', 'keep_weekly', 'keep_monthly']:
+        try:
+            retention_options[option_name] = int(retention_options[option_name])
+        except ValueError:
+            raise Exception('ERROR: '+option_name+' must be an integer:', retention_options[option_name])
+        if retention_options[option_name] < 0:
+            raise Exception('ERROR: '+option_name+' must be 0 or greater')
     if not os.path.exists(path_to_json):
         raise Exception('ERROR: provided json path does not exist:', path_to_json)
-    return prnt_debug, path_to_json, number_to_keep
+    return prnt_debug, path_to_json, number_to_keep, retention_options
 
 def args_use(prnt_debug, list_of_args):
     """
@@ -81,68 +121,281 @@ def args_use(prnt_debug, list_of_args):
         print('--path_to_json="/path/to/search"')
         print('--number_to_keep="3"')
         print('optional argument:')
+        print('--history')
+        print('--deltas_to_keep="52"')
+        print('--restore="2019-11-10T16-19"')
+        print('--output_prefix="log" (the snapshots --restore rebuilds)')
+        print('--keep_daily="7"')
+        print('--keep_weekly="13"')
+        print('--keep_monthly="12"')
+        print('--metrics="roll_metrics.json"')
+        print('--profile="roll.prof"')
         print('--debug')
         sys.exit(1) # https://stackoverflow.com/questions/6501121/difference-between-exit-and-sys-exit-in-python
     elif len(list_of_args) > 1:
-        prnt_debug, path_to_json, number_to_keep = parse_args(list_of_args)
+        prnt_debug, path_to_json, number_to_keep, retention_options = parse_args(list_of_args)
     else:
         raise Exception('invalid option')
-    return prnt_debug, path_to_json, number_to_keep
+    return prnt_debug, path_to_json, number_to_keep, retention_options
 
-def identify_logs_to_delete(prnt_debug, list_of_json_files, number_to_keep):
-    """
-    >>> identify_logs_to_delete(False, ['file1.json', 'file2.json', 'file3.json', 2]
+# retention tiers: option name, and the period a snapshot falls in
+RETENTION_TIERS = [('keep_daily',   lambda created: created.date()),
+                   ('keep_weekly',  lambda created: created.isocalendar()[:2]),
+                   ('keep_monthly', lambda created: (created.year, created.month))]
 
+def identify_logs_to_delete(prnt_debug, list_of_entries, number_to_keep, retention_options=None):
     """
-    import string
-    dict_of_times = {}
-    for json_file in list_of_json_files:
-        # https://stackoverflow.com/questions/1450897/remove-characters-except-digits-from-string-using-python
-        date_to_parse = json_file.replace('.json', '').replace('_', '').translate(str.maketrans('', '', string.ascii_letters)).replace('.','').replace('/','')
-        dict_of_times[json_file] = datetime.datetime.strptime(date_to_parse, "%Y-%m-%d%H-%M")
-    # https://www.w3resource.com/python-exercises/dictionary/python-data-type-dictionary-exercise-15.php
+    list_of_entries is the catalog (oldest first). Keep the newest number_to_keep snapshots, and
+    for each tier in retention_options the newest snapshot of each of the last keep_daily days,
+    keep_weekly weeks and keep_monthly months that have a snapshot. Everything else is returned.
+    One pass over the sorted catalog.
 
+    >>> list_of_entries = [{'file': 'logs_'+str(day), 'created': '2019-11-'+str(day).zfill(2)+'T00:00:00'} for day in range(1, 15)]
+    >>> identify_logs_to_delete(False, list_of_entries, 2, {'keep_weekly': 2})
+    ['logs_1', 'logs_2', 'logs_3', 'logs_4', 'logs_5', 'logs_6', 'logs_7', 'logs_8', 'logs_9', 'logs_11', 'logs_12']
+    """
+    if retention_options is None:
+        retention_options = {}
+    dict_of_last_period = {}
+    dict_of_kept_periods = {}
     list_of_files_to_delete = []
-    keep_indx = 0
-    while len(dict_of_times)>0:
-        keep_indx += 1
-        latest_json_file = max(dict_of_times.keys(), key=(lambda k: dict_of_times[k]))
-        if prnt_debug: print('latest_json_file:',latest_json_file)
-
-        if keep_indx <= number_to_keep:
-            if prnt_debug: print('keeping',latest_json_file)
-            pass
+    for keep_indx, entry in enumerate(reversed(list_of_entries)):
+        keep = keep_indx < number_to_keep
+        created = datetime.datetime.fromisoformat(entry['created'])
+        for option_name, period_of in RETENTION_TIERS:
+            period = period_of(created)
+            if (dict_of_kept_periods.get(option_name, 0) < retention_options.get(option_name, 0)
+                    and dict_of_last_period.get(option_name) != period):
+                dict_of_last_period[option_name] = period
+                dict_of_kept_periods[option_name] = dict_of_kept_periods.get(option_name, 0) + 1
+                keep = True
+        if keep:
+            if prnt_debug: print('keeping', entry['file'])
         else:
-            list_of_files_to_delete.append(latest_json_file)
-            if prnt_debug: print('to eliminate:',latest_json_file)
-        del dict_of_times[latest_json_file]
+            if prnt_debug: print('to eliminate:', entry['file'])
+            list_of_files_to_delete.append(entry['file'])
+    return list_of_files_to_delete[::-1]
 
-    return list_of_files_to_delete
-
-def delete_old_logs(prnt_debug, path_to_json, number_to_keep):
+def delete_old_logs(prnt_debug, path_to_json, number_to_keep, retention_options=None):
     """
+    delete the snapshots identify_logs_to_delete picks, and drop them from the catalog
     """
-    list_of_json_files = glob.glob(path_to_json+'/*.json')
+    list_of_entries = snapshot_io.read_catalog(prnt_debug, path_to_json)
 
-    if prnt_debug: print('list of json files:', list_of_json_files)
+    if prnt_debug: print('list of snapshots:', [entry['file'] for entry in list_of_entries])
  
-    if len(list_of_json_files) > 1:
-        list_of_files = identify_logs_to_delete(prnt_debug, list_of_json_files, number_to_keep) 
+    if len(list_of_entries) > 1:
+        list_of_files = identify_logs_to_delete(prnt_debug, list_of_entries, number_to_keep, retention_options)
     else:
         print("need at least two previous JSON files. Exiting.")
-        sys.exit(0)
+        return
 
     for this_file in list_of_files:
         if prnt_debug: print('delete',this_file)
         try:
-            os.remove(this_file)
+            os.remove(path_to_json+'/'+this_file)
+        except FileNotFoundError:
+            pass # already gone; it still leaves the catalog
         except:
             raise Exception("unable to delete file")
+    snapshot_io.catalog_remove(prnt_debug, path_to_json, list_of_files)
     return
 
+# the history lives in this subdirectory of path_to_json, one directory per output prefix
+HISTORY_DIR = 'history'
+
+def history_timestamp(created):
+    """
+    the created time of a snapshot, to the second, as used in history file names
+
+    >>> history_timestamp('2019-11-10T16:19:05')
+    '2019-11-10T16-19-05'
+    """
+    return created.replace(':', '-')
+
+def list_history_files(history_path):
+    """
+    (timestamp, kind, file name) for every base and delta in history_path, oldest first
+    """
+    list_of_entries = []
+    for kind in ['base', 'delta']:
+        for file_name in glob.glob(history_path+'/'+kind+'_*.json'):
+            timestamp = os.path.basename(file_name)[len(kind)+1:-len('.json')]
+            list_of_entries.append((timestamp, kind, file_name))
+    return sorted(list_of_entries)
+
+def list_history_paths(path_to_json):
+    """
+    the history directory of every output prefix with a history
+    """
+    return sorted(dir_path for dir_path in glob.glob(path_to_json+'/'+HISTORY_DIR+'/*') if os.path.isdir(dir_path))
+
+def history_record(file_dict):
+    """
+    the part of a record a delta tracks; 'runs since hash' changes on every incremental run without
+    the file changing, so it is left out (restored snapshots count from 0)
+    """
+    return {key: value for key, value in file_dict.items() if key != 'runs since hash'}
+
+def restore_snapshot(prnt_debug, history_path, timestamp=None):
+    """
+    replay the newest base at or before timestamp and the deltas after it, up to timestamp (None: the latest);
+    a timestamp to the minute includes every run in that minute.
+    returns (header, dict of full path: record)
+    """
+    list_of_entries = [entry for entry in list_history_files(history_path)
+                       if timestamp is None or entry[0][:len(timestamp)] <= timestamp]
+    list_of_bases = [indx for indx, (_, kind, _) in enumerate(list_of_entries) if kind == 'base']
+    if len(list_of_bases) == 0:
+        raise Exception('ERROR: no base snapshot in the history at or before', timestamp)
+    header = {}
+    dict_of_records = {}
+    for _, kind, file_name in list_of_entries[list_of_bases[-1]:]:
+        header = snapshot_io.read_snapshot_header(file_name)
+        if kind == 'base':
+            dict_of_records = {}
+        for file_dict in snapshot_io.iter_snapshot_records(prnt_debug, file_name):
+            if file_dict.get('removed', False):
+                dict_of_records.pop(file_dict['full path'], None)
+            else:
+                dict_of_records[file_dict['full path']] = file_dict
+    header.pop('delta of', None)
+    return header, dict_of_records
+
+def snapshot_delta(dict_of_previous, iterable_of_dicts):
+    """
+    yield the records of iterable_of_dicts that are new or differ from dict_of_previous,
+    then a {'full path': ..., 'removed': True} marker for each path that is gone
+
+    >>> list(snapshot_delta({'/a': {'full path': '/a', 'hash of file': '1'}, '/b': {'full path': '/b', 'hash of file': '2'}}, [{'full path': '/a', 'hash of file': '3'}]))
+    [{'full path': '/a', 'hash of file': '3'}, {'full path': '/b', 'removed': True}]
+    """
+    set_of_seen = set()
+    for file_dict in iterable_of_dicts:
+        file_dict = history_record(file_dict)
+        set_of_seen.add(file_dict['full path'])
+        if dict_of_previous.get(file_dict['full path']) != file_dict:
+            yield file_dict
+    for full_path in sorted(dict_of_previous.keys()):
+        if full_path not in set_of_seen:
+            yield {'full path': full_path, 'removed': True}
+
+def write_history_file(prnt_debug, history_path, kind, timestamp, header, iterable_of_dicts):
+    file_name = history_path+'/'+kind+'_'+timestamp+'.json'
+    snapshot_io.write_snapshot(prnt_debug, iterable_of_dicts, file_name, 'json', header)
+    return file_name
+
+def add_to_history(prnt_debug, path_to_json):
+    """
+    fold the full snapshots of each output prefix into the history of that prefix, see add_prefix_to_history
+    """
+    dict_of_prefixes = {}
+    for entry in snapshot_io.read_catalog(prnt_debug, path_to_json):
+        dict_of_prefixes.setdefault(entry['prefix'], []).append(entry)
+    for output_prefix, list_of_entries in dict_of_prefixes.items():
+        add_prefix_to_history(prnt_debug, path_to_json, output_prefix, list_of_entries)
+
+def add_prefix_to_history(prnt_debug, path_to_json, output_prefix, list_of_catalog_entries):
+    """
+    fold every snapshot of list_of_catalog_entries (one prefix, oldest first) that is newer than the history into it;
+    the first one becomes the base, each later one a delta against the state before it.
+    A snapshot is known by its catalog file and created time, which each history file records,
+    so a snapshot rewritten under the same name within a minute is still folded in
+    """
+    history_path = path_to_json+'/'+HISTORY_DIR+'/'+output_prefix
+    os.makedirs(history_path, exist_ok=True)
+    list_of_entries = list_history_files(history_path)
+    latest_in_history = list_of_entries[-1][0] if len(list_of_entries) > 0 else ''
+    set_of_in_history = set()
+    for _, _, file_name in list_of_entries:
+        header = snapshot_io.read_snapshot_header(file_name)
+        set_of_in_history.add((header.get('snapshot file'), header.get('created')))
+    list_of_new = [entry for entry in list_of_catalog_entries
+                   if (entry['file'], entry['created']) not in set_of_in_history
+                   and history_timestamp(entry['created']) > latest_in_history]
+    if len(list_of_new) == 0:
+        return
+    dict_of_previous = None
+    if len(list_of_entries) > 0:
+        _, dict_of_previous = restore_snapshot(prnt_debug, history_path)
+    for entry in list_of_new:
+        snapshot_file = path_to_json+'/'+entry['file']
+        timestamp = history_timestamp(entry['created'])
+        header = snapshot_io.read_snapshot_header(snapshot_file)
+        header['created'] = entry['created']
+        header['snapshot file'] = entry['file']
+        if dict_of_previous is None:
+            write_history_file(prnt_debug, history_path, 'base', timestamp, header,
+                               (history_record(file_dict) for file_dict in snapshot_io.iter_snapshot_records(prnt_debug, snapshot_file)))
+            dict_of_previous = {}
+        else:
+            header['delta of'] = latest_in_history
+            write_history_file(prnt_debug, history_path, 'delta', timestamp, header,
+                               snapshot_delta(dict_of_previous, snapshot_io.iter_snapshot_records(prnt_debug, snapshot_file)))
+        # the next delta is taken against this snapshot
+        dict_of_previous = {file_dict['full path']: history_record(file_dict)
+                            for file_dict in snapshot_io.iter_snapshot_records(prnt_debug, snapshot_file)}
+        latest_in_history = timestamp
+        if prnt_debug: print('added', snapshot_file, 'to the history')
+
+def compact_history(prnt_debug, path_to_json, deltas_to_keep):
+    """
+    compact the history of every output prefix, see compact_prefix_history
+    """
+    for history_path in list_history_paths(path_to_json):
+        compact_prefix_history(prnt_debug, history_path, deltas_to_keep)
+
+def compact_prefix_history(prnt_debug, history_path, deltas_to_keep):
+    """
+    merge all but the newest deltas_to_keep deltas into a new base. The new base is written before
+    the old base and the merged deltas are deleted, so an interrupted compaction loses nothing.
+    """
+    list_of_entries = list_history_files(history_path)
+    list_of_deltas = [entry for entry in list_of_entries if entry[1] == 'delta']
+    if len(list_of_deltas) <= deltas_to_keep:
+        return
+    new_base_timestamp = list_of_deltas[len(list_of_deltas) - deltas_to_keep - 1][0]
+    header, dict_of_records = restore_snapshot(prnt_debug, history_path, new_base_timestamp)
+    new_base_file = write_history_file(prnt_debug, history_path, 'base', new_base_timestamp, header,
+                                       (dict_of_records[full_path] for full_path in sorted(dict_of_records.keys())))
+    for timestamp, kind, file_name in list_of_entries:
+        if timestamp <= new_base_timestamp and file_name != new_base_file:
+            if prnt_debug: print('compacted', file_name)
+            os.remove(file_name)
+
+def write_restored_snapshot(prnt_debug, path_to_json, timestamp, output_prefix='log'):
+    """
+    write the snapshot of run timestamp of output_prefix, rebuilt from the history,
+    as history/<output_prefix>/restored_<timestamp>.json
+    """
+    history_path = path_to_json+'/'+HISTORY_DIR+'/'+output_prefix
+    header, dict_of_records = restore_snapshot(prnt_debug, history_path, timestamp)
+    list_of_dicts = [dict_of_records[full_path] for full_path in sorted(dict_of_records.keys())]
+    for file_dict in list_of_dicts:
+        file_dict['runs since hash'] = 0
+    dict_of_directories = ct.directory_hashes(list_of_dicts, header.get('search path', ''),
+                                              header.get('hash', 'md5'), header.get('digest_size', 0))
+    file_name = history_path+'/restored_'+timestamp+'.json'
+    snapshot_io.write_snapshot(prnt_debug, list_of_dicts, file_name, 'json', header, dict_of_directories)
+    return file_name
+
 if __name__ == '__main__':
 
-    prnt_debug, path_to_json, number_to_keep  = args_use(False, sys.argv)
+    prnt_debug, path_to_json, number_to_keep, retention_options = args_use(False, sys.argv)
+    run_metrics = metrics.start_metrics(prnt_debug, metrics.parse_args(sys.argv), 'rolling_logs')
+
+    if retention_options['restore'] != '':
+        with metrics.phase(run_metrics, 'restore'):
+            print(write_restored_snapshot(prnt_debug, path_to_json, retention_options['restore'],
+                                          retention_options['output_prefix']))
+        sys.exit(0)
+
+    if retention_options['history']:
+        with metrics.phase(run_metrics, 'history'):
+            add_to_history(prnt_debug, path_to_json)
+        with metrics.phase(run_metrics, 'compact history'):
+            compact_history(prnt_debug, path_to_json, retention_options['deltas_to_keep'])
 
-    delete_old_logs(prnt_debug, path_to_json, number_to_keep)
+    with metrics.phase(run_metrics, 'delete old logs'):
+        delete_old_logs(prnt_debug, path_to_json, number_to_keep, retention_options)
 
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+
+"""
+an append-only journal of a scan in progress, so an interrupted change_tracker.py run can be resumed
+
+With --checkpoint_every="60", change_tracker.py appends every record it finishes hashing to
+<output_prefix>.journal in the write path, and a line for each directory whose files are all done
+(with the mtime the walk saw). Lines are buffered and written out, and fsync'ed, every 60 seconds,
+when the scan stops, and on SIGTERM; a crash loses at most the last interval, and a torn last line is dropped.
+
+--resume picks up the journal of the interrupted run (from the same search path, walk and hash settings)
+and keeps appending to it:
+* a file in the journal whose size, mtime, inode and device are unchanged keeps its digest
+* a finished directory whose mtime is unchanged is not stat'ed file by file; its files are taken
+  as the interrupted run recorded them (from the journal, or from the previous snapshot for reused hashes)
+A file edited in place in a finished directory keeps the digest it had when it was hashed,
+as any file the scan had passed before the edit would; the next scan picks the edit up.
+A long scan can so be spread over several maintenance windows. The journal is deleted once the snapshot
+is written; the snapshot itself only appears when it is complete (see snapshot_io.write_snapshot).
+
+standard use:
+python3 change_tracker.py --search_path="/home/jovyan/tmp" --write_path="." --checkpoint_every="60"
+
+python3 change_tracker.py --search_path="/home/jovyan/tmp" --write_path="." --resume
+
+*********************
+# https://docs.python.org/3/library/os.html#os.fsync
+# https://docs.python.org/3/library/doctest.html
+python3 -m doctest scan_journal.py
+
+"""
+
+import json
+import os
+import time
+
+JOURNAL_SUFFIX = '.journal'
+
+DEFAULT_CHECKPOINT_SECONDS = 60 # with --resume but no --checkpoint_every
+
+def journal_file_name(write_path, output_prefix, shard=None):
+    """
+    one journal per output prefix (and shard), since that is what a rerun would resume
+
+    >>> journal_file_name('/tmp', 'logs')
+    '/tmp/logs.journal'
+    >>> journal_file_name('/tmp', 'logs', [2, 8])
+    '/tmp/logs_shard-2-of-8.journal'
+    """
+    if shard is not None:
+        output_prefix += '_shard-'+str(shard[0])+'-of-'+str(shard[1])
+    return write_path+'/'+output_prefix+JOURNAL_SUFFIX
+
+class ScanJournal:
+    """
+    the journal of the current run; dict_of_records and dict_of_done_dirs hold what the interrupted run finished
+    """
+    def __init__(self, file_name, checkpoint_every=DEFAULT_CHECKPOINT_SECONDS, dict_of_records=None,
+                 dict_of_done_dirs=None):
+        self.file_name = file_name
+        self.checkpoint_every = checkpoint_every
+        self.dict_of_records = {} if dict_of_records is None else dict_of_records # full path: record
+        self.dict_of_done_dirs = {} if dict_of_done_dirs is None else dict_of_done_dirs # directory: mtime_ns
+        self.dict_of_dir_mtimes = {} # directory: mtime_ns, filled in by change_tracker.walk_files
+        self.dict_of_pending = {} # directory: files still to hash
+        self.list_of_lines = []
+        self.last_checkpoint = time.monotonic()
+        self.fil = open(file_name, 'a')
+
+    def write_line(self, entry):
+        self.list_of_lines.append(json.dumps(entry, separators=(',', ':')))
+        if time.monotonic() - self.last_checkpoint >= self.checkpoint_every:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """
+        write out the buffered lines and force them to disk
+        """
+        if len(self.list_of_lines) > 0:
+            self.fil.write('\n'.join(self.list_of_lines)+'\n')
+            self.list_of_lines = []
+        self.fil.flush()
+        os.fsync(self.fil.fileno())
+        self.last_checkpoint = time.monotonic()
+
+    def expect(self, filename):
+        """
+        filename will be hashed; its directory is not finished until it is
+        """
+        dir_path = os.path.dirname(filename)
+        self.dict_of_pending[dir_path] = self.dict_of_pending.get(dir_path, 0) + 1
+
+    def end_of_crawl(self):
+        """
+        every directory with nothing to hash is finished already
+        """
+        for dir_path, mtime_ns in self.dict_of_dir_mtimes.items():
+            if dir_path not in self.dict_of_pending:
+                self.write_line({'directory': dir_path, 'mtime_ns': mtime_ns})
+
+    def finish(self, filename, file_dict):
+        """
+        filename was hashed into file_dict (None when it could not be read)
+        """
+        if file_dict is not None:
+            self.write_line(file_dict)
+        dir_path = os.path.dirname(filename)
+        self.dict_of_pending[dir_path] -= 1
+        if self.dict_of_pending[dir_path] == 0 and dir_path in self.dict_of_dir_mtimes:
+            self.write_line({'directory': dir_path, 'mtime_ns': self.dict_of_dir_mtimes[dir_path]})
+
+    def close(self):
+        if self.fil.closed:
+            return
+        self.checkpoint()
+        self.fil.close()
+
+    def remove(self):
+        """
+        the scan is complete and its snapshot written
+        """
+        self.close()
+        os.remove(self.file_name)
+
+def read_journal(prnt_debug, file_name, header):
+    """
+    (dict of full path: record, dict of finished directory: mtime_ns, bytes of whole lines) from a journal;
+    a journal from another search path or other settings than header resumes nothing
+    """
+    dict_of_records = {}
+    dict_of_done_dirs = {}
+    valid_length = 0
+    with open(file_name, 'rb') as fil:
+        for line in fil:
+            if not line.endswith(b'\n'):
+                if prnt_debug: print('dropping the torn last line of', file_name)
+                break
+            entry = json.loads(line.decode('utf-8', 'surrogateescape'))
+            if valid_length == 0:
+                if entry.get('journal') != header:
+                    print('WARNING: the journal is of a different scan; starting over:', entry.get('journal'))
+                    return {}, {}, 0
+            elif 'directory' in entry:
+                dict_of_done_dirs[entry['directory']] = entry['mtime_ns']
+            else:
+                dict_of_records[entry['full path']] = entry
+            valid_length += len(line)
+    return dict_of_records, dict_of_done_dirs, valid_length
+
+def open_journal(prnt_debug, file_name, header, resume=False, checkpoint_every=DEFAULT_CHECKPOINT_SECONDS):
+    """
+    a ScanJournal for this run. With resume, an existing journal that matches header is read and appended to;
+    otherwise the journal is started over with header on its first line
+    """
+    dict_of_records, dict_of_done_dirs, valid_length = {}, {}, 0
+    if resume:
+        if os.path.exists(file_name):
+            dict_of_records, dict_of_done_dirs, valid_length = read_journal(prnt_debug, file_name, header)
+            print('resuming:', len(dict_of_records), 'files and', len(dict_of_done_dirs), 'directories already done')
+        else:
+            print('WARNING: no journal to resume; starting over:', file_name)
+    if valid_length > 0:
+        # cut a torn last line, so the next line does not run into it
+        os.truncate(file_name, valid_length)
+    else:
+        with open(file_name, 'w') as fil:
+            fil.write(json.dumps({'journal': header}, separators=(',', ':'))+'\n')
+    return ScanJournal(file_name, checkpoint_every, dict_of_records, dict_of_done_dirs)
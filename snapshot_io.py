@@ -0,0 +1,616 @@
+#!/usr/bin/env python
+
+"""
+read and write the snapshots produced by change_tracker.py
+
+Three on-disk formats are supported:
+* json   -- a list of records, one record per line, so it can be written and read as a stream.
+            Files written by older versions (a single-line pandas dump) can still be read.
+* sqlite -- one row per file in an indexed table; digests are stored as raw bytes rather than hex strings.
+            Readers only load the columns they ask for.
+* pathtable -- the columns of a path_table.PathTable: a directory table, basenames, raw digests and
+            typed stat arrays, each zlib compressed; a fraction of the size of the other two.
+            It is read back whole, as a PathTable.
+
+Every snapshot change_tracker.py writes is listed in a catalog (snapshots.catalog) next to it,
+with its creation time, search path, record count, hash algorithm and size in bytes.
+The tools look up the latest, previous and older snapshots there instead of globbing and parsing file names,
+so stray files in the directory are ignored. Directories without a catalog get one built from the file names.
+
+Both formats carry a header (a small dict) describing how the snapshot was made,
+for example which hash algorithm produced the digests,
+and optionally a digest per directory (see change_tracker.directory_hashes).
+The JSON layout is line oriented so each section can be streamed:
+{"header":{...},"directories":[
+["/dir/path","digest"],
+...
+],"records":[
+{"full path":...},
+...
+]}
+
+standard use (convert a snapshot; the JSON output is the export format):
+python3 snapshot_io.py --input="logs_2019-11-10T16-19.sqlite" --output_format="json"
+
+python3 snapshot_io.py --input="logs_2019-11-10T16-19.json" --output_format="sqlite" --debug
+
+*********************
+# https://docs.python.org/3/library/sqlite3.html
+sqlite3 logs_2019-11-10T16-19.sqlite "SELECT full_path, hex(hash) FROM files LIMIT 10"
+
+*********************
+# https://docs.python.org/3/library/doctest.html
+python3 -m doctest snapshot_io.py
+
+"""
+
+import datetime # timestamps of snapshots written before the catalog
+import glob
+import heapq # merge sorted runs
+import json
+import operator
+import os
+import sqlite3
+import sys
+import tempfile # spill files for the external sort
+import path_table
+
+# file extension for each snapshot format
+SNAPSHOT_FORMATS = {'json': '.json', 'sqlite': '.sqlite', 'pathtable': '.pathtable'}
+
+# lists the snapshots in a directory, oldest first
+CATALOG_NAME = 'snapshots.catalog'
+
+# the timestamp at the end of every snapshot file name
+FILE_TIMESTAMP_FORMAT = '%Y-%m-%dT%H-%M'
+
+# partial snapshots of a sharded scan, kept out of the catalog until merge_shards.py joins them
+SHARD_DIR = 'shards'
+
+# record key, sqlite column, sqlite type
+# keys of type BLOB hold hex strings in the records and raw bytes in the database
+# a path that is not valid UTF-8 is stored as its raw bytes, see path_to_sqlite
+SQLITE_COLUMNS = [('full path',       'full_path',       'TEXT PRIMARY KEY'),
+                  ('hash of file',    'hash',            'BLOB'),
+                  ('size',            'size',            'INTEGER'),
+                  ('mtime_ns',        'mtime_ns',        'INTEGER'),
+                  ('inode',           'inode',           'INTEGER'),
+                  ('device',          'device',          'INTEGER'),
+                  ('runs since hash', 'runs_since_hash', 'INTEGER'),
+                  ('block hashes',    'block_hashes',    'TEXT'),
+                  ('sample hash',     'sample_hash',     'BLOB'),
+                  ('last verified',   'last_verified',   'INTEGER')]
+
+# record keys whose values are lists, stored in sqlite as JSON text
+JSON_COLUMNS = ['block hashes']
+
+def parse_args(list_of_args):
+    """
+    >>> parse_args(['name of py script', '--input='+__file__, '--output_format=sqlite'])[2]
+    'sqlite'
+    >>> parse_args(['name of py script', 'invalid arg'])
+    Traceback (most recent call last):
+    ...
+    Exception: ('ERROR: provided input snapshot does not exist:', '')
+    """
+    prnt_debug = False
+    input_file = ''
+    output_format = 'json'
+    for arg in list_of_args:
+        if '--debug' in arg:
+            prnt_debug = True
+        elif '--input' in arg:
+            input_file = arg.replace('--input=', '')
+        elif '--output_format' in arg:
+            output_format = arg.replace('--output_format=', '')
+    if not os.path.exists(input_file):
+        raise Exception('ERROR: provided input snapshot does not exist:', input_file)
+    if output_format not in SNAPSHOT_FORMATS:
+        raise Exception('ERROR: output format must be one of', list(SNAPSHOT_FORMATS.keys()))
+    return prnt_debug, input_file, output_format
+
+def args_use(list_of_args):
+    """
+    >>> args_use(['name of file'])
+    Traceback (most recent call last):
+    ...
+    SystemExit: 1
+    """
+    if len(list_of_args) == 1:
+        print('ERROR: invalid number of arguments')
+        print('required arguments:')
+        print('  --input="/path/to/snapshot.sqlite"')
+        print('optional arguments:')
+        print('  --output_format="json" (or sqlite, pathtable)')
+        print('  --debug')
+        sys.exit(1)
+    elif len(list_of_args) > 1:
+        prnt_debug, input_file, output_format = parse_args(list_of_args)
+    else:
+        raise Exception('invalid option')
+    return prnt_debug, input_file, output_format
+
+def snapshot_format_of_file(file_name):
+    """
+    >>> snapshot_format_of_file('logs_2019-11-10T16-19.sqlite')
+    'sqlite'
+    >>> snapshot_format_of_file('logs_2019-11-10T16-19.json')
+    'json'
+    """
+    for snapshot_format, extension in SNAPSHOT_FORMATS.items():
+        if file_name.endswith(extension):
+            return snapshot_format
+    raise Exception('ERROR: unrecognized snapshot file extension:', file_name)
+
+def snapshot_timestamp(file_name):
+    """
+    the FILE_TIMESTAMP_FORMAT stamp at the end of a snapshot (or history) file name
+
+    >>> snapshot_timestamp('/tmp/logs_2019-11-10T16-19.sqlite')
+    '2019-11-10T16-19'
+    >>> snapshot_timestamp('history/delta_2019-11-17T16-19.json')
+    '2019-11-17T16-19'
+    """
+    stem = os.path.basename(file_name).rsplit('.', 1)[0]
+    return stem[-len('YYYY-mm-ddTHH-MM'):]
+
+def shard_file_name(path_to_json, output_prefix, shard_index, shard_count, snapshot_format='json'):
+    """
+    where shard shard_index of shard_count is written; the name has no timestamp,
+    so rerunning a shard replaces its earlier output
+
+    >>> shard_file_name('/tmp', 'logs', 3, 8)
+    '/tmp/shards/logs_shard-3-of-8.json'
+    """
+    return (path_to_json+'/'+SHARD_DIR+'/'+output_prefix+'_shard-'+str(shard_index)+'-of-'+str(shard_count)
+            + SNAPSHOT_FORMATS[snapshot_format])
+
+def read_catalog(prnt_debug, path_to_json):
+    """
+    the catalog entries of path_to_json, oldest first. Each entry is a dict with
+    'file' (relative to path_to_json), 'created', 'prefix', 'search path', 'records', 'hash' and 'bytes'
+    """
+    catalog_file = path_to_json+'/'+CATALOG_NAME
+    if not os.path.exists(catalog_file):
+        return rebuild_catalog(prnt_debug, path_to_json)
+    with open(catalog_file, 'r') as fil:
+        return json.load(fil)['snapshots']
+
+def write_catalog(path_to_json, list_of_entries):
+    """
+    replaces the catalog in one step, so readers see the old or the new catalog and never half of one
+    """
+    catalog_file = path_to_json+'/'+CATALOG_NAME
+    list_of_entries = sorted(list_of_entries, key=operator.itemgetter('created', 'file'))
+    with open(catalog_file+'.tmp', 'w') as fil:
+        fil.write('{"snapshots":[\n')
+        fil.write(',\n'.join(json.dumps(entry, separators=(',', ':')) for entry in list_of_entries))
+        fil.write('\n]}\n')
+    os.replace(catalog_file+'.tmp', catalog_file)
+
+def catalog_entry(file_name, output_prefix, header, number_of_records):
+    return {'file': os.path.basename(file_name),
+            'created': header.get('created') or datetime.datetime.now().isoformat(timespec='seconds'),
+            'prefix': output_prefix,
+            'search path': header.get('search path', ''),
+            'records': number_of_records,
+            'hash': header.get('hash', 'md5'),
+            'bytes': os.path.getsize(file_name)}
+
+def rebuild_catalog(prnt_debug, path_to_json):
+    """
+    a catalog for a directory of snapshots written before catalogs existed;
+    only files whose name ends in a timestamp count, and 'records' is unknown (None)
+    """
+    list_of_entries = []
+    for extension in SNAPSHOT_FORMATS.values():
+        for file_name in glob.glob(path_to_json+'/*'+extension):
+            stem = os.path.basename(file_name)[:-len(extension)]
+            try:
+                created = datetime.datetime.strptime(snapshot_timestamp(file_name), FILE_TIMESTAMP_FORMAT)
+            except ValueError:
+                if prnt_debug: print('not a snapshot:', file_name)
+                continue
+            header = {'created': created.isoformat(timespec='seconds')}
+            try:
+                header.update(read_snapshot_header(file_name))
+            except (ValueError, sqlite3.DatabaseError):
+                if prnt_debug: print('not a snapshot:', file_name)
+                continue
+            list_of_entries.append(catalog_entry(file_name, stem[:-len('_YYYY-mm-ddTHH-MM')], header, None))
+    if prnt_debug: print('built a catalog of', len(list_of_entries), 'snapshots in', path_to_json)
+    if os.access(path_to_json, os.W_OK):
+        write_catalog(path_to_json, list_of_entries)
+    return sorted(list_of_entries, key=operator.itemgetter('created', 'file'))
+
+def catalog_add(prnt_debug, path_to_json, file_name, output_prefix, header, number_of_records):
+    """
+    list a snapshot that was just written; a snapshot rewritten under the same name replaces its entry
+    """
+    list_of_entries = [entry for entry in read_catalog(prnt_debug, path_to_json)
+                       if entry['file'] != os.path.basename(file_name)]
+    list_of_entries.append(catalog_entry(file_name, output_prefix, header, number_of_records))
+    write_catalog(path_to_json, list_of_entries)
+
+def catalog_remove(prnt_debug, path_to_json, list_of_file_names):
+    """
+    drop entries from the catalog, e.g. after the files were deleted
+    """
+    set_of_names = set(os.path.basename(file_name) for file_name in list_of_file_names)
+    write_catalog(path_to_json, [entry for entry in read_catalog(prnt_debug, path_to_json)
+                                 if entry['file'] not in set_of_names])
+
+def latest_snapshots(prnt_debug, path_to_json, number_of_snapshots, output_prefix=None):
+    """
+    the paths of the newest number_of_snapshots snapshots, newest first;
+    output_prefix (None: any) restricts them to one prefix
+    """
+    list_of_entries = read_catalog(prnt_debug, path_to_json)
+    list_of_latest = []
+    # the catalog is sorted, so this only walks back past snapshots of other prefixes
+    for entry in reversed(list_of_entries):
+        if len(list_of_latest) == number_of_snapshots:
+            break
+        if output_prefix is None or entry['prefix'] == output_prefix:
+            list_of_latest.append(path_to_json+'/'+entry['file'])
+    if prnt_debug: print('latest snapshots:', list_of_latest)
+    return list_of_latest
+
+def snapshots_in_range(prnt_debug, path_to_json, number_of_snapshots=0, since='', until='', output_prefix=None):
+    """
+    the paths of the snapshots created between since and until (ISO dates or times, '' is open ended), oldest first;
+    number_of_snapshots > 0 keeps only the newest that many of them
+    """
+    list_of_files = []
+    for entry in read_catalog(prnt_debug, path_to_json):
+        if output_prefix is not None and entry['prefix'] != output_prefix:
+            continue
+        if entry['created'] < since or (until != '' and entry['created'][:len(until)] > until):
+            continue
+        list_of_files.append(path_to_json+'/'+entry['file'])
+    if number_of_snapshots > 0:
+        list_of_files = list_of_files[-number_of_snapshots:]
+    if prnt_debug: print('snapshots in range:', list_of_files)
+    return list_of_files
+
+def write_snapshot(prnt_debug, iterable_of_dicts, file_name, snapshot_format='json', header=None,
+                   dict_of_directories=None):
+    """
+    records are written as they are produced; nothing is buffered beyond one record.
+    dict_of_directories maps a directory path to its digest.
+    The file appears under file_name only once it is complete.
+    """
+    if header is None:
+        header = {}
+    if dict_of_directories is None:
+        dict_of_directories = {}
+    tmp_file_name = file_name+'.tmp'
+    if snapshot_format == 'json':
+        number_written = write_json_snapshot(iterable_of_dicts, tmp_file_name, header, dict_of_directories)
+    elif snapshot_format == 'sqlite':
+        number_written = write_sqlite_snapshot(iterable_of_dicts, tmp_file_name, header, dict_of_directories)
+    elif snapshot_format == 'pathtable':
+        number_written = path_table.write_table_snapshot(iterable_of_dicts, tmp_file_name, header, dict_of_directories)
+    else:
+        raise Exception('ERROR: unknown snapshot format:', snapshot_format)
+    # https://docs.python.org/3/library/os.html#os.replace
+    os.replace(tmp_file_name, file_name)
+    if prnt_debug: print('wrote', number_written, 'records to', file_name)
+    return number_written
+
+def write_json_snapshot(iterable_of_dicts, file_name, header, dict_of_directories):
+    """
+    the header on the first line, then one directory and one record per line
+    """
+    number_written = 0
+    with open(file_name, 'w') as fil:
+        fil.write('{"header":'+json.dumps(header, separators=(',', ':')))
+        if len(dict_of_directories) > 0:
+            fil.write(',"directories":[\n')
+            fil.write(',\n'.join(json.dumps([dir_path, dir_hash], separators=(',', ':'))
+                                 for dir_path, dir_hash in sorted(dict_of_directories.items())))
+            fil.write('\n]')
+        fil.write(',"records":[\n')
+        for file_dict in iterable_of_dicts:
+            if number_written > 0:
+                fil.write(',\n')
+            fil.write(json.dumps(file_dict, separators=(',', ':')))
+            number_written += 1
+        fil.write('\n]}\n')
+    return number_written
+
+def write_sqlite_snapshot(iterable_of_dicts, file_name, header, dict_of_directories):
+    if os.path.exists(file_name):
+        os.remove(file_name)
+    conn = sqlite3.connect(file_name)
+    try:
+        # the database is written once, start to finish, so the rollback journal buys nothing
+        conn.execute('PRAGMA journal_mode=OFF')
+        conn.execute('PRAGMA synchronous=OFF')
+        conn.execute('CREATE TABLE header (key TEXT PRIMARY KEY, value TEXT)')
+        conn.executemany('INSERT INTO header VALUES (?, ?)',
+                         [(key, json.dumps(value)) for key, value in header.items()])
+        conn.execute('CREATE TABLE files ('+', '.join(column+' '+sql_type for _, column, sql_type in SQLITE_COLUMNS)+')')
+        insert_sql = ('INSERT INTO files ('+', '.join(column for _, column, _ in SQLITE_COLUMNS)+') VALUES ('
+                      + ', '.join('?' for _ in SQLITE_COLUMNS)+')')
+        counter = {'rows': 0}
+        def rows():
+            for file_dict in iterable_of_dicts:
+                counter['rows'] += 1
+                yield tuple(record_value_to_sqlite(file_dict.get(key), key, sql_type) for key, _, sql_type in SQLITE_COLUMNS)
+        conn.executemany(insert_sql, rows())
+        conn.execute('CREATE INDEX files_hash ON files (hash)')
+        conn.execute('CREATE TABLE directories (dir_path TEXT PRIMARY KEY, hash BLOB)')
+        conn.executemany('INSERT INTO directories VALUES (?, ?)',
+                         ((path_to_sqlite(dir_path), bytes.fromhex(dir_hash))
+                          for dir_path, dir_hash in dict_of_directories.items()))
+        conn.execute('CREATE INDEX directories_hash ON directories (hash)')
+        conn.commit()
+    finally:
+        conn.close()
+    return counter['rows']
+
+def record_value_to_sqlite(value, key, sql_type):
+    """
+    >>> record_value_to_sqlite('764efa883dda1e11db47671c4a3bbd9e', 'hash of file', 'BLOB')
+    b'vN\\xfa\\x88=\\xda\\x1e\\x11\\xdbGg\\x1cJ;\\xbd\\x9e'
+    >>> record_value_to_sqlite(['ab', 'cd'], 'block hashes', 'TEXT')
+    '["ab","cd"]'
+    """
+    if value is None:
+        return value
+    if key == 'full path':
+        return path_to_sqlite(value)
+    if sql_type == 'BLOB':
+        return bytes.fromhex(value)
+    if key in JSON_COLUMNS:
+        return json.dumps(value, separators=(',', ':'))
+    return value
+
+def path_to_sqlite(path):
+    """
+    a path as stored in sqlite: text, or the raw bytes of a name that is not valid UTF-8
+    (os.scandir returns such names with surrogate escapes, which sqlite3 cannot encode)
+
+    >>> path_to_sqlite('/r/a')
+    '/r/a'
+    >>> path_to_sqlite('/r/\\udcff')
+    b'/r/\\xff'
+    """
+    if path.isascii():
+        return path
+    try:
+        path.encode('utf-8')
+        return path
+    except UnicodeEncodeError:
+        return os.fsencode(path)
+
+def path_from_sqlite(value):
+    """
+    >>> path_from_sqlite(b'/r/\\xff')
+    '/r/\\udcff'
+    """
+    if isinstance(value, bytes):
+        return os.fsdecode(value)
+    return value
+
+def iter_snapshot_records(prnt_debug, file_name, list_of_columns=None):
+    """
+    yield one dict per file; list_of_columns limits which keys are loaded (None loads all of them)
+    """
+    snapshot_format = snapshot_format_of_file(file_name)
+    if prnt_debug: print('reading', file_name)
+    if snapshot_format == 'sqlite':
+        return iter_sqlite_records(file_name, list_of_columns)
+    if snapshot_format == 'pathtable':
+        return path_table.read_table(file_name).iter_records(list_of_columns)
+    return iter_json_records(file_name, list_of_columns)
+
+def read_snapshot(prnt_debug, file_name, list_of_columns=None):
+    """
+    the whole snapshot as a list of dicts
+    """
+    return list(iter_snapshot_records(prnt_debug, file_name, list_of_columns))
+
+def read_path_table(prnt_debug, file_name, list_of_columns=None):
+    """
+    the snapshot as a path_table.PathTable, whatever its format;
+    list_of_columns limits what is read from json and sqlite snapshots
+    """
+    if snapshot_format_of_file(file_name) == 'pathtable':
+        if prnt_debug: print('reading', file_name)
+        return path_table.read_table(file_name)
+    return path_table.from_records(iter_snapshot_records(prnt_debug, file_name, list_of_columns))
+
+def read_snapshot_header(file_name):
+    """
+    the header dict of a snapshot; snapshots written before headers existed give {}
+    """
+    if snapshot_format_of_file(file_name) == 'pathtable':
+        return path_table.read_table_header(file_name)
+    if snapshot_format_of_file(file_name) == 'sqlite':
+        conn = sqlite3.connect('file:'+file_name+'?mode=ro', uri=True)
+        try:
+            if conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='header'").fetchone() is None:
+                return {}
+            return {key: json.loads(value) for key, value in conn.execute('SELECT key, value FROM header')}
+        finally:
+            conn.close()
+    with open(file_name, 'r') as fil:
+        first_line = fil.readline()
+        if first_line.startswith('{"header":') and first_line.rstrip().endswith('":['):
+            return json.loads(first_line.rstrip()+']}')['header']
+        if first_line.strip() == '[':
+            return {}
+        # a single-line dump; it has to be parsed in one go
+        fil.seek(0)
+        whole_file = json.load(fil)
+        if isinstance(whole_file, dict):
+            return whole_file.get('header', {})
+        return {}
+
+def iter_json_section(file_name, section_name):
+    """
+    yield the entries of one section ('records' or 'directories') of a JSON snapshot
+    """
+    with open(file_name, 'r') as fil:
+        first_line = fil.readline().rstrip()
+        if first_line == '[':
+            # line oriented, written before headers existed: records only
+            current_section = 'records'
+        elif first_line.startswith('{"header":') and first_line.endswith('":['):
+            current_section = first_line.rsplit('"', 2)[1]
+        else:
+            # a single-line dump written by pandas; it has to be parsed in one go
+            fil.seek(0)
+            whole_file = json.load(fil)
+            if isinstance(whole_file, list):
+                whole_file = {'records': whole_file}
+            yield from whole_file.get(section_name, [])
+            return
+        for line in fil:
+            line = line.rstrip()
+            if line.startswith(']'):
+                if current_section == section_name:
+                    return
+                if line.endswith('":['):
+                    current_section = line.rsplit('"', 2)[1]
+                continue
+            if current_section == section_name and line != '':
+                yield json.loads(line.rstrip(','))
+
+def iter_json_records(file_name, list_of_columns=None):
+    for file_dict in iter_json_section(file_name, 'records'):
+        if list_of_columns is not None:
+            file_dict = {key: file_dict[key] for key in list_of_columns if key in file_dict}
+        yield file_dict
+
+def iter_directory_hashes(prnt_debug, file_name):
+    """
+    yield (directory path, digest) pairs; snapshots without directory digests yield nothing
+    """
+    if snapshot_format_of_file(file_name) == 'json':
+        for dir_path, dir_hash in iter_json_section(file_name, 'directories'):
+            yield dir_path, dir_hash
+        return
+    if snapshot_format_of_file(file_name) == 'pathtable':
+        yield from path_table.read_table_directory_hashes(file_name)
+        return
+    conn = sqlite3.connect('file:'+file_name+'?mode=ro', uri=True)
+    try:
+        if conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='directories'").fetchone() is None:
+            return
+        for dir_path, dir_hash in conn.execute('SELECT dir_path, hash FROM directories'):
+            yield path_from_sqlite(dir_path), dir_hash.hex()
+    finally:
+        conn.close()
+
+def iter_sqlite_records(file_name, list_of_columns=None, order_by_path=False):
+    conn = sqlite3.connect('file:'+file_name+'?mode=ro', uri=True)
+    try:
+        # snapshots written by older versions lack the newer columns
+        set_of_existing = set(row[1] for row in conn.execute('PRAGMA table_info(files)'))
+        list_of_selected = [(key, column, sql_type) for key, column, sql_type in SQLITE_COLUMNS
+                            if (list_of_columns is None or key in list_of_columns) and column in set_of_existing]
+        select_sql = 'SELECT '+', '.join(column for _, column, _ in list_of_selected)+' FROM files'
+
+        def row_to_dict(row):
+            file_dict = {}
+            for (key, _, sql_type), value in zip(list_of_selected, row):
+                if value is None:
+                    continue
+                if key == 'full path':
+                    value = path_from_sqlite(value)
+                elif sql_type == 'BLOB':
+                    value = value.hex()
+                elif key in JSON_COLUMNS:
+                    value = json.loads(value)
+                file_dict[key] = value
+            return file_dict
+
+        if not order_by_path:
+            yield from map(row_to_dict, conn.execute(select_sql))
+            return
+        # served by the primary key index; BINARY collation matches Python's str ordering.
+        # sqlite sorts the paths stored as bytes after all text, so those (rare) ones are merged back in
+        path_key = operator.itemgetter('full path')
+        list_of_byte_paths = sorted(map(row_to_dict, conn.execute(select_sql+" WHERE full_path >= x''")), key=path_key)
+        yield from heapq.merge(map(row_to_dict, conn.execute(select_sql+" WHERE full_path < x'' ORDER BY full_path")),
+                               list_of_byte_paths, key=path_key)
+    finally:
+        conn.close()
+
+def iter_sorted_records(prnt_debug, file_name, list_of_columns=None, max_records_in_memory=1000000):
+    """
+    yield the records of a snapshot in ascending 'full path' order,
+    holding at most max_records_in_memory records in memory at a time
+
+    SQLite snapshots are read through the primary key index.
+    JSON snapshots are sorted externally: sorted runs are spilled to temporary files and merged.
+    """
+    if list_of_columns is not None and 'full path' not in list_of_columns:
+        list_of_columns = ['full path'] + list(list_of_columns)
+    if snapshot_format_of_file(file_name) == 'sqlite':
+        yield from iter_sqlite_records(file_name, list_of_columns, order_by_path=True)
+        return
+    path_key = operator.itemgetter('full path')
+    list_of_run_files = []
+    try:
+        run = []
+        for file_dict in iter_snapshot_records(prnt_debug, file_name, list_of_columns):
+            run.append(file_dict)
+            if len(run) >= max_records_in_memory:
+                list_of_run_files.append(spill_sorted_run(run, path_key))
+                run = []
+        run.sort(key=path_key)
+        if len(list_of_run_files) == 0:
+            # everything fit in memory
+            yield from run
+            return
+        if len(run) > 0:
+            list_of_run_files.append(spill_sorted_run(run, path_key))
+            run = []
+        if prnt_debug: print('merging', len(list_of_run_files), 'sorted runs of', file_name)
+        # https://docs.python.org/3/library/heapq.html#heapq.merge
+        list_of_run_iterators = [iter_json_lines(run_file) for run_file in list_of_run_files]
+        yield from heapq.merge(*list_of_run_iterators, key=path_key)
+    finally:
+        for run_file in list_of_run_files:
+            os.remove(run_file)
+
+def spill_sorted_run(run, path_key):
+    """
+    sort run and write it to a temporary file of JSON lines; returns the file name
+    """
+    run.sort(key=path_key)
+    file_descriptor, run_file = tempfile.mkstemp(prefix='snapshot_run_', suffix='.jsonl')
+    with os.fdopen(file_descriptor, 'w') as fil:
+        for file_dict in run:
+            fil.write(json.dumps(file_dict, separators=(',', ':'))+'\n')
+    return run_file
+
+def iter_json_lines(file_name):
+    with open(file_name, 'r') as fil:
+        for line in fil:
+            yield json.loads(line)
+
+def convert_snapshot(prnt_debug, input_file, output_format):
+    """
+    write input_file in output_format next to it; returns the new file name
+    """
+    input_format = snapshot_format_of_file(input_file)
+    output_file = input_file[:-len(SNAPSHOT_FORMATS[input_format])]+SNAPSHOT_FORMATS[output_format]
+    if output_file == input_file:
+        raise Exception('ERROR: snapshot is already in format', output_format)
+    if os.path.exists(output_file):
+        raise Exception('ERROR: output snapshot already exists:', output_file)
+    write_snapshot(prnt_debug, iter_snapshot_records(prnt_debug, input_file), output_file, output_format,
+                   read_snapshot_header(input_file), dict(iter_directory_hashes(prnt_debug, input_file)))
+    return output_file
+
+
+if __name__ == '__main__':
+
+    prnt_debug, input_file, output_format = args_use(sys.argv)
+    output_file = convert_snapshot(prnt_debug, input_file, output_format)
+    print(output_file)
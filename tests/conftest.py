@@ -0,0 +1,10 @@
+"""
+the tools are flat scripts in the repository root; make them importable from the tests
+
+python3 -m pytest -q tests
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
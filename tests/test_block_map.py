@@ -0,0 +1,54 @@
+"""
+block maps of large files: appends reuse the known blocks, in-place edits must not
+"""
+
+import os
+import change_tracker as ct
+import diff_changes as dc
+
+BLOCK_MAP_SIZE = 4096
+SCAN_OPTIONS = {'incremental': True, 'block_map_threshold': 1, 'block_map_size': BLOCK_MAP_SIZE, 'block_size': 1024}
+
+def full_hash(filename):
+    return ct.hash_file_blocks(filename, BLOCK_MAP_SIZE, 1024)
+
+def rescan(path_to_search, list_of_previous):
+    previous_snapshot = {file_dict['full path']: file_dict for file_dict in list_of_previous}
+    return ct.hash_list_of_files(False, path_to_search, SCAN_OPTIONS, previous_snapshot)
+
+def test_append_reads_only_the_tail(tmp_path):
+    filename = str(tmp_path/'big')
+    with open(filename, 'wb') as fil:
+        fil.write(os.urandom(10*BLOCK_MAP_SIZE))
+    list_of_previous = rescan(str(tmp_path), [])
+    with open(filename, 'ab') as fil:
+        fil.write(os.urandom(BLOCK_MAP_SIZE//2))
+    previous_dict = list_of_previous[0]
+    file_stat = ct.stat_of_file(filename)
+    start_block, list_of_known = ct.block_start_of_file(previous_dict, file_stat, BLOCK_MAP_SIZE, 0)
+    assert start_block == 10
+    got_hash, hash_of_file, bytes_hashed, list_of_blocks = ct.hash_file_blocks(
+        filename, BLOCK_MAP_SIZE, 1024, None, 'md5', 0, start_block, list_of_known)
+    # the head block and the last known block are checked, then only the new tail is read
+    assert bytes_hashed == 2*BLOCK_MAP_SIZE + BLOCK_MAP_SIZE//2
+    assert (got_hash, hash_of_file, list_of_blocks) == full_hash(filename)[:2] + (full_hash(filename)[3],)
+
+def edit_and_grow(filename, offset):
+    with open(filename, 'r+b') as fil:
+        fil.seek(offset)
+        fil.write(b'x'*10)
+        fil.seek(0, os.SEEK_END)
+        fil.write(os.urandom(100))
+
+def test_edit_in_place_and_grow(tmp_path):
+    filename = str(tmp_path/'big')
+    for offset in [0, 4*BLOCK_MAP_SIZE - 5]: # in the head block, in the last known block
+        with open(filename, 'wb') as fil:
+            fil.write(os.urandom(4*BLOCK_MAP_SIZE))
+        list_of_previous = rescan(str(tmp_path), [])
+        edit_and_grow(filename, offset)
+        list_of_current = rescan(str(tmp_path), list_of_previous)
+        assert list_of_current[0]['hash of file'] == full_hash(filename)[1]
+        assert list_of_current[0]['block hashes'] == full_hash(filename)[3]
+        dict_of_ranges = dc.block_changes_of_records(list_of_previous, list_of_current, BLOCK_MAP_SIZE, {filename})
+        assert dict_of_ranges[filename][0][0] <= offset
@@ -0,0 +1,45 @@
+"""
+the snapshot catalog, and how diff_changes.py and find_dupes.py pick snapshots from it
+"""
+
+import os
+import subprocess
+import sys
+import snapshot_io
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def add_snapshot(path_to_json, output_prefix, created, dict_of_hashes):
+    file_name = path_to_json+'/'+output_prefix+'_'+created[:16].replace(':', '-')+'.json'
+    list_of_dicts = [{'full path': full_path, 'hash of file': hash_of_file}
+                     for full_path, hash_of_file in sorted(dict_of_hashes.items())]
+    header = {'search path': '/'+output_prefix, 'created': created, 'hash': 'md5', 'digest_size': 0}
+    snapshot_io.write_snapshot(False, list_of_dicts, file_name, 'json', header)
+    snapshot_io.catalog_add(False, path_to_json, file_name, output_prefix, header, len(list_of_dicts))
+
+def interleaved_prefixes(path_to_json):
+    add_snapshot(path_to_json, 'home', '2019-11-10T16:19:00', {'/home/a': '01', '/home/b': '01'})
+    add_snapshot(path_to_json, 'data', '2019-11-10T17:19:00', {'/data/c': '02'})
+    add_snapshot(path_to_json, 'home', '2019-11-11T16:19:00', {'/home/a': '03', '/home/b': '01'})
+    add_snapshot(path_to_json, 'data', '2019-11-11T17:19:00', {'/data/c': '02', '/data/d': '02'})
+
+def run(script, *list_of_args):
+    return subprocess.run([sys.executable, REPO_DIR+'/'+script] + list(list_of_args), cwd=REPO_DIR,
+                          capture_output=True, text=True, check=True).stdout
+
+def test_latest_snapshots_of_one_prefix(tmp_path):
+    path_to_json = str(tmp_path)
+    interleaved_prefixes(path_to_json)
+    assert snapshot_io.latest_snapshots(False, path_to_json, 2, 'home') == \
+        [path_to_json+'/home_2019-11-11T16-19.json', path_to_json+'/home_2019-11-10T16-19.json']
+    assert snapshot_io.snapshots_in_range(False, path_to_json, 0, '2019-11-11', '', 'data') == \
+        [path_to_json+'/data_2019-11-11T17-19.json']
+
+def test_scripts_compare_one_prefix(tmp_path):
+    path_to_json = str(tmp_path)
+    interleaved_prefixes(path_to_json)
+    assert run('diff_changes.py', '--path_to_json='+path_to_json, '--output_prefix=home') == 'changed files:\n/home/a\n'
+    assert run('diff_changes.py', '--path_to_json='+path_to_json, '--output_prefix=data') == '== new files ==\n/data/d\n'
+    assert '/data/' not in run('diff_changes.py', '--path_to_json='+path_to_json, '--output_prefix=home', '--timeline=2')
+    assert '/data/' not in run('find_dupes.py', '--path_to_json='+path_to_json, '--output_prefix=home')
+    assert '/data/d' in run('find_dupes.py', '--path_to_json='+path_to_json, '--output_prefix=data')
@@ -0,0 +1,34 @@
+"""
+the size, partial-hash, full-hash duplicate finder of find_dupes.py
+"""
+
+import os
+import change_tracker as ct
+import find_dupes as fd
+import metrics
+
+def make_tree(tmp_path):
+    content = os.urandom(5000)
+    for name in ['a', 'b', 'c']:
+        (tmp_path/name).write_bytes(content)
+    (tmp_path/'d').write_bytes(content[:-1]+b'x') # same size, same head and tail with partial_bytes=100
+    (tmp_path/'e').write_bytes(os.urandom(5000)[:-1]+b'x')
+    return str(tmp_path)
+
+def test_duplicates_on_disk(tmp_path):
+    path_to_search = make_tree(tmp_path)
+    dict_of_groups = fd.find_duplicate_files_on_disk(False, path_to_search, {'partial_bytes': 100})
+    assert list(dict_of_groups.values()) == [[path_to_search+'/'+name for name in ['a', 'b', 'c']]]
+
+def test_file_vanished_before_the_partial_hash(tmp_path, monkeypatch):
+    path_to_search = make_tree(tmp_path)
+    real_hash_file_sample = ct.hash_file_sample
+    def hash_file_sample(fname, *args):
+        if fname.endswith('/b') and os.path.exists(fname):
+            os.remove(fname)
+        return real_hash_file_sample(fname, *args)
+    monkeypatch.setattr(ct, 'hash_file_sample', hash_file_sample)
+    run_metrics = metrics.Metrics('test')
+    dict_of_groups = fd.find_duplicate_files_on_disk(False, path_to_search, {'partial_bytes': 100}, run_metrics)
+    assert sorted(dict_of_groups.values()) == [[path_to_search+'/a', path_to_search+'/c']]
+    assert run_metrics.dict_of_counters['vanished files'] == 1
@@ -0,0 +1,57 @@
+"""
+hash_files and the crawl/hash passes of change_tracker.hash_list_of_files
+"""
+
+import os
+import change_tracker as ct
+import metrics
+
+def make_tree(tmp_path, number_of_files=6):
+    for indx in range(number_of_files):
+        (tmp_path / ('f'+str(indx))).write_bytes(os.urandom(1000 + indx))
+    return str(tmp_path)
+
+def test_hash_files_missing_file():
+    assert ct.hash_files(['/nonexistent/file'], {}) == [(False, '', 0, None)]
+    assert ct.hash_files(['/nonexistent/file'], {}, [(0, [])]) == [(False, '', 0, [])]
+
+def test_hash_files_missing_file_in_pool(tmp_path):
+    path_to_search = make_tree(tmp_path, 2)
+    list_of_filenames = ['/nonexistent/file', path_to_search+'/f0', path_to_search+'/f1']
+    for pool in ['thread', 'process']:
+        list_of_results = ct.hash_files(list_of_filenames, {'workers': 2, 'pool': pool})
+        assert [result[0] for result in list_of_results] == [False, True, True]
+
+def vanish_during_hash(monkeypatch, filename):
+    """
+    delete filename between the crawl and the hash pass
+    """
+    real_hash_files = ct.hash_files
+    def hash_files(*args, **kwargs):
+        if os.path.exists(filename):
+            os.remove(filename)
+        return real_hash_files(*args, **kwargs)
+    monkeypatch.setattr(ct, 'hash_files', hash_files)
+
+def test_vanished_file_costs_one_record(tmp_path, monkeypatch):
+    path_to_search = make_tree(tmp_path)
+    vanish_during_hash(monkeypatch, path_to_search+'/f2')
+    run_metrics = metrics.Metrics('test')
+    list_of_dicts = ct.hash_list_of_files(False, path_to_search, {'workers': 2}, None, run_metrics)
+    assert sorted(file_dict['full path'] for file_dict in list_of_dicts) == \
+        [path_to_search+'/f'+str(indx) for indx in [0, 1, 3, 4, 5]]
+    assert run_metrics.dict_of_counters['vanished files'] == 1
+
+def test_vanished_file_compact(tmp_path, monkeypatch):
+    path_to_search = make_tree(tmp_path)
+    vanish_during_hash(monkeypatch, path_to_search+'/f0')
+    run_metrics = metrics.Metrics('test')
+    table = ct.hash_list_of_files(False, path_to_search, {'compact': True}, None, run_metrics)
+    assert len(table) == 5 and table.find(path_to_search+'/f0') is None
+    assert run_metrics.dict_of_counters['vanished files'] == 1
+
+def test_parallel_hashes_match_serial(tmp_path):
+    path_to_search = make_tree(tmp_path, 20)
+    list_of_serial = ct.hash_list_of_files(False, path_to_search, {})
+    for pool in ['thread', 'process']:
+        assert ct.hash_list_of_files(False, path_to_search, {'workers': 4, 'pool': pool}) == list_of_serial
@@ -0,0 +1,59 @@
+"""
+the delta-encoded history of rolling_logs.py
+"""
+
+import os
+import rolling_logs as rl
+import snapshot_io
+
+def add_snapshot(path_to_json, output_prefix, created, dict_of_hashes):
+    """
+    write and catalog a snapshot; the file name has the minute of created, as change_tracker.py names it
+    """
+    file_name = path_to_json+'/'+output_prefix+'_'+created[:16].replace(':', '-')+'.json'
+    list_of_dicts = [{'full path': full_path, 'hash of file': hash_of_file}
+                     for full_path, hash_of_file in sorted(dict_of_hashes.items())]
+    header = {'search path': '/'+output_prefix, 'created': created}
+    snapshot_io.write_snapshot(False, list_of_dicts, file_name, 'json', header)
+    snapshot_io.catalog_add(False, path_to_json, file_name, output_prefix, header, len(list_of_dicts))
+
+def restored_hashes(path_to_json, output_prefix, timestamp=None):
+    _, dict_of_records = rl.restore_snapshot(False, path_to_json+'/'+rl.HISTORY_DIR+'/'+output_prefix, timestamp)
+    return {full_path: file_dict['hash of file'] for full_path, file_dict in dict_of_records.items()}
+
+def test_one_history_per_prefix(tmp_path):
+    path_to_json = str(tmp_path)
+    add_snapshot(path_to_json, 'home', '2019-11-10T16:19:05', {'/home/a': '1'})
+    add_snapshot(path_to_json, 'data', '2019-11-10T16:19:30', {'/data/b': '2'})
+    add_snapshot(path_to_json, 'home', '2019-11-11T16:19:05', {'/home/a': '3'})
+    rl.add_to_history(False, path_to_json)
+    assert restored_hashes(path_to_json, 'home') == {'/home/a': '3'}
+    assert restored_hashes(path_to_json, 'home', '2019-11-10T16-19') == {'/home/a': '1'}
+    assert restored_hashes(path_to_json, 'data') == {'/data/b': '2'}
+    assert sorted(os.listdir(path_to_json+'/'+rl.HISTORY_DIR+'/home')) == \
+        ['base_2019-11-10T16-19-05.json', 'delta_2019-11-11T16-19-05.json']
+
+def test_same_minute_snapshot_is_kept(tmp_path):
+    path_to_json = str(tmp_path)
+    add_snapshot(path_to_json, 'home', '2019-11-10T16:19:05', {'/home/a': '1'})
+    rl.add_to_history(False, path_to_json)
+    # rewritten under the same file name within the minute
+    add_snapshot(path_to_json, 'home', '2019-11-10T16:19:40', {'/home/a': '2'})
+    rl.add_to_history(False, path_to_json)
+    rl.add_to_history(False, path_to_json)
+    assert restored_hashes(path_to_json, 'home') == {'/home/a': '2'}
+    assert len(rl.list_history_files(path_to_json+'/'+rl.HISTORY_DIR+'/home')) == 2
+
+def test_compaction_keeps_every_state(tmp_path):
+    path_to_json = str(tmp_path)
+    for day in range(1, 6):
+        add_snapshot(path_to_json, 'home', '2019-11-0'+str(day)+'T00:00:00', {'/home/a': str(day), '/home/'+str(day): 'x'})
+    rl.add_to_history(False, path_to_json)
+    rl.compact_history(False, path_to_json, 2)
+    history_path = path_to_json+'/'+rl.HISTORY_DIR+'/home'
+    assert [kind for _, kind, _ in rl.list_history_files(history_path)] == ['base', 'delta', 'delta']
+    assert restored_hashes(path_to_json, 'home') == {'/home/a': '5', '/home/5': 'x'}
+    assert restored_hashes(path_to_json, 'home', '2019-11-03T00-00') == {'/home/a': '3', '/home/3': 'x'}
+    # nothing is folded in twice after compaction
+    rl.add_to_history(False, path_to_json)
+    assert len(rl.list_history_files(history_path)) == 3
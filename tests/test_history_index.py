@@ -0,0 +1,68 @@
+"""
+history_index.py: runs of unchanged digests across snapshots, per output prefix
+"""
+
+import os
+import history_index as hi
+import snapshot_io
+
+def add_snapshot(path_to_json, output_prefix, created, dict_of_hashes):
+    file_name = path_to_json+'/'+output_prefix+'_'+created[:16].replace(':', '-')+'.json'
+    list_of_dicts = [{'full path': full_path, 'hash of file': hash_of_file}
+                     for full_path, hash_of_file in sorted(dict_of_hashes.items())]
+    header = {'search path': '/r', 'created': created}
+    snapshot_io.write_snapshot(False, list_of_dicts, file_name, 'json', header)
+    snapshot_io.catalog_add(False, path_to_json, file_name, output_prefix, header, len(list_of_dicts))
+    return file_name
+
+def path_history(path_to_json, path):
+    conn = hi.open_index(path_to_json)
+    try:
+        return hi.path_history(conn, path)
+    finally:
+        conn.close()
+
+def test_runs_extend_within_a_prefix_only(tmp_path):
+    path_to_json = str(tmp_path)
+    add_snapshot(path_to_json, 'home', '2019-11-10T16:19:00', {'/r/a': 'aa', '/r/b': 'bb'})
+    add_snapshot(path_to_json, 'data', '2019-11-10T17:19:00', {'/r/a': 'aa'})
+    add_snapshot(path_to_json, 'home', '2019-11-11T16:19:00', {'/r/a': 'aa', '/r/b': 'cc'})
+    add_snapshot(path_to_json, 'home', '2019-11-12T16:19:00', {'/r/a': 'aa', '/r/b': 'bb'})
+    assert hi.update_index(False, path_to_json) == 4
+    assert hi.update_index(False, path_to_json) == 0
+    assert path_history(path_to_json, '/r/b') == [('bb', '2019-11-10T16:19:00', '2019-11-10T16:19:00'),
+                                                  ('cc', '2019-11-11T16:19:00', '2019-11-11T16:19:00'),
+                                                  ('bb', '2019-11-12T16:19:00', '2019-11-12T16:19:00')]
+    # one run in each prefix, neither extended by the other's snapshot
+    assert path_history(path_to_json, '/r/a') == [('aa', '2019-11-10T16:19:00', '2019-11-12T16:19:00'),
+                                                  ('aa', '2019-11-10T17:19:00', '2019-11-10T17:19:00')]
+    conn = hi.open_index(path_to_json)
+    try:
+        assert hi.hash_history(conn, 'bb') == [('/r/b', '2019-11-10T16:19:00', '2019-11-10T16:19:00'),
+                                               ('/r/b', '2019-11-12T16:19:00', '2019-11-12T16:19:00')]
+        assert hi.last_change(conn, '/r/b') == '2019-11-12T16:19:00'
+        assert hi.last_change(conn, '/r/missing') is None
+    finally:
+        conn.close()
+
+def test_deleted_and_older_snapshots_are_skipped(tmp_path):
+    path_to_json = str(tmp_path)
+    add_snapshot(path_to_json, 'home', '2019-11-10T16:19:00', {'/r/a': 'aa'})
+    os.remove(add_snapshot(path_to_json, 'home', '2019-11-11T16:19:00', {'/r/a': 'bb'}))
+    add_snapshot(path_to_json, 'home', '2019-11-12T16:19:00', {'/r/a': 'aa'})
+    assert hi.update_index(False, path_to_json) == 2
+    add_snapshot(path_to_json, 'home', '2019-11-09T16:19:00', {'/r/a': 'cc'})
+    assert hi.update_index(False, path_to_json) == 0
+    assert path_history(path_to_json, '/r/a') == [('aa', '2019-11-10T16:19:00', '2019-11-12T16:19:00')]
+
+def test_name_that_is_not_utf8(tmp_path):
+    path_to_json = str(tmp_path)
+    add_snapshot(path_to_json, 'home', '2019-11-10T16:19:00', {'/r/\udcff': 'aa'})
+    add_snapshot(path_to_json, 'home', '2019-11-11T16:19:00', {'/r/\udcff': 'aa'})
+    assert hi.update_index(False, path_to_json) == 2
+    assert path_history(path_to_json, '/r/\udcff') == [('aa', '2019-11-10T16:19:00', '2019-11-11T16:19:00')]
+    conn = hi.open_index(path_to_json)
+    try:
+        assert hi.hash_history(conn, 'aa') == [('/r/\udcff', '2019-11-10T16:19:00', '2019-11-11T16:19:00')]
+    finally:
+        conn.close()
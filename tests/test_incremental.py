@@ -0,0 +1,45 @@
+"""
+change_tracker.py --incremental: hashes are reused while the stat metadata is unchanged
+"""
+
+import os
+import change_tracker as ct
+
+def scan(path_to_search, list_of_previous=None, scan_options=None):
+    scan_options = dict({'incremental': True}, **(scan_options or {}))
+    previous_snapshot = {file_dict['full path']: file_dict for file_dict in list_of_previous or []}
+    return {file_dict['full path']: file_dict
+            for file_dict in ct.hash_list_of_files(False, path_to_search, scan_options, previous_snapshot)}
+
+def test_unchanged_files_are_reused(tmp_path):
+    (tmp_path/'a').write_bytes(b'one')
+    (tmp_path/'b').write_bytes(b'two')
+    dict_of_first = scan(str(tmp_path))
+    dict_of_second = scan(str(tmp_path), dict_of_first.values())
+    assert [file_dict['runs since hash'] for file_dict in dict_of_second.values()] == [1, 1]
+    assert [file_dict['hash of file'] for file_dict in dict_of_second.values()] == \
+        [file_dict['hash of file'] for file_dict in dict_of_first.values()]
+
+def test_changed_stat_is_rehashed(tmp_path):
+    (tmp_path/'a').write_bytes(b'one')
+    dict_of_first = scan(str(tmp_path))
+    (tmp_path/'a').write_bytes(b'uno')
+    os.utime(tmp_path/'a', ns=(0, dict_of_first[str(tmp_path/'a')]['mtime_ns'] + 1))
+    file_dict = scan(str(tmp_path), dict_of_first.values())[str(tmp_path/'a')]
+    assert file_dict['runs since hash'] == 0
+    assert file_dict['hash of file'] == ct.hash_file(str(tmp_path/'a'))[1]
+
+def test_paranoid_every(tmp_path):
+    (tmp_path/'a').write_bytes(b'one')
+    list_of_runs = []
+    dict_of_records = {}
+    for _ in range(5):
+        dict_of_records = scan(str(tmp_path), dict_of_records.values(), {'paranoid_every': 3})
+        list_of_runs.append(dict_of_records[str(tmp_path/'a')]['runs since hash'])
+    assert list_of_runs == [0, 1, 2, 0, 1]
+
+def test_dotfiles_and_excludes(tmp_path):
+    (tmp_path/'.hidden').write_bytes(b'x')
+    (tmp_path/'.git').mkdir()
+    (tmp_path/'.git'/'HEAD').write_bytes(b'y')
+    assert sorted(scan(str(tmp_path), None, {'excludes': ['.git']})) == [str(tmp_path/'.hidden')]
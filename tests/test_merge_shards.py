@@ -0,0 +1,84 @@
+"""
+sharded scans (change_tracker.py --shard) and merge_shards.py
+"""
+
+import os
+import random
+import pytest
+import change_tracker as ct
+import merge_shards as ms
+import snapshot_io
+
+MERGE_OPTIONS = {'shard_count': 2, 'format': '', 'keep_shards': False, 'index': False}
+
+def make_tree(tmp_path):
+    path_to_search = tmp_path/'tree'
+    for dir_name in ['a', 'b', 'c', 'd', 'e']:
+        (path_to_search/dir_name).mkdir(parents=True)
+        for indx in range(2):
+            (path_to_search/dir_name/('f'+str(indx))).write_bytes(os.urandom(50 + indx))
+    (path_to_search/'top').write_bytes(b'top')
+    return str(path_to_search)
+
+def scan_shard(path_to_search, write_path, shard_index, snapshot_format='json'):
+    scan_options = {'shard': [shard_index, 2], 'shard_by': 'top', 'format': snapshot_format}
+    list_of_dicts = ct.hash_list_of_files(False, path_to_search, scan_options)
+    ct.write_shard_snapshot(False, list_of_dicts, write_path, 'log', scan_options,
+                            ct.snapshot_header(path_to_search, scan_options))
+    return list_of_dicts
+
+def hashes(iterable_of_dicts):
+    return {file_dict['full path']: file_dict['hash of file'] for file_dict in iterable_of_dicts}
+
+@pytest.mark.parametrize('snapshot_format', ['json', 'sqlite'])
+def test_merged_shards_equal_a_full_scan(tmp_path, snapshot_format):
+    path_to_search = make_tree(tmp_path)
+    write_path = str(tmp_path)
+    list_of_shards = [scan_shard(path_to_search, write_path, shard_index, snapshot_format) for shard_index in range(2)]
+    assert all(len(list_of_dicts) > 0 for list_of_dicts in list_of_shards)
+    file_name = ms.merge_shards(False, write_path, 'log', MERGE_OPTIONS)
+    dict_of_merged = hashes(snapshot_io.iter_snapshot_records(False, write_path+'/'+file_name))
+    assert dict_of_merged == hashes(ct.hash_list_of_files(False, path_to_search))
+    list_of_full_scan = ct.hash_list_of_files(False, path_to_search)
+    assert dict(snapshot_io.iter_directory_hashes(False, write_path+'/'+file_name)) == \
+        ct.directory_hashes(list_of_full_scan, path_to_search)
+    assert snapshot_io.read_snapshot_header(write_path+'/'+file_name)['merged shards'] == 2
+    assert [entry['file'] for entry in snapshot_io.read_catalog(False, write_path)] == [file_name]
+    assert os.listdir(write_path+'/'+snapshot_io.SHARD_DIR) == []
+
+def test_path_in_two_shards_is_kept_once(tmp_path):
+    list_of_shard_files = []
+    for shard_index, list_of_paths in enumerate([['/r/a/x', '/r/l/x'], ['/r/b/y', '/r/l/x']]):
+        file_name = snapshot_io.shard_file_name(str(tmp_path), 'log', shard_index, 2)
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        snapshot_io.write_snapshot(False, [{'full path': full_path, 'hash of file': '01'} for full_path in list_of_paths],
+                                   file_name, 'json', {})
+        list_of_shard_files.append(file_name)
+    assert [file_dict['full path'] for file_dict in ms.iter_merged_records(False, list_of_shard_files)] == \
+        ['/r/a/x', '/r/b/y', '/r/l/x']
+
+def test_mismatched_shards_are_rejected(tmp_path):
+    path_to_search = make_tree(tmp_path)
+    header = ct.snapshot_header(path_to_search, {'shard': [0, 2], 'shard_by': 'top'})
+    with pytest.raises(Exception, match='hashed differently'):
+        ms.check_shard_headers([header, dict(header, shard=[1, 2], hash='sha256')], 2)
+    with pytest.raises(Exception, match='not shard 1 of 2'):
+        ms.check_shard_headers([header, header], 2)
+    scan_shard(path_to_search, str(tmp_path), 0)
+    with pytest.raises(Exception, match='shards not scanned yet'):
+        ms.merge_shards(False, str(tmp_path), 'log', MERGE_OPTIONS)
+
+def test_directory_hashes_of_sorted_records():
+    rng = random.Random(3)
+    for _ in range(50):
+        list_of_paths = set()
+        for _ in range(rng.randrange(1, 40)):
+            depth = rng.randrange(1, 5)
+            list_of_paths.add('/r/'+'/'.join(rng.choice(['a', 'a-b', 'a.c', 'b', 'ab', '\udcff'])
+                                             for _ in range(depth)))
+        # a file and a directory of the same name cannot both exist
+        list_of_paths = sorted(path for path in list_of_paths
+                               if not any(other.startswith(path+'/') for other in list_of_paths))
+        list_of_dicts = [{'full path': path, 'hash of file': format(rng.getrandbits(8), '02x')}
+                         for path in list_of_paths]
+        assert ct.directory_hashes_of_sorted(list_of_dicts, '/r') == ct.directory_hashes(list_of_dicts, '/r')
@@ -0,0 +1,52 @@
+"""
+path_table.PathTable and the pathtable snapshot format
+"""
+
+import diff_changes as dc
+import path_table
+import snapshot_io
+
+LIST_OF_RECORDS = [
+    {'full path': '/r/a', 'hash of file': '01'*16, 'size': 1, 'mtime_ns': 2, 'inode': 3, 'device': 4, 'runs since hash': 0},
+    {'full path': '/r/d/b', 'hash of file': '02'*16, 'size': 5, 'mtime_ns': 6, 'inode': 7, 'device': 8, 'runs since hash': 2,
+     'block hashes': ['aa'*16, 'bb'*16]},
+    {'full path': '/r/d/e/', 'hash of file': '03'*16}, # an empty basename
+    {'full path': '/r/d/', 'hash of file': '04'*16},
+    {'full path': '/r/\udcff', 'hash of file': '05'*16, 'sample hash': '06'*16, 'last verified': 9}]
+
+def test_records_round_trip():
+    table = path_table.from_records(LIST_OF_RECORDS)
+    assert list(table.iter_records()) == LIST_OF_RECORDS
+    assert table.find('/r/d/b') == 1 and table.find('/r/missing') is None
+    assert table.get('/r/d/b')['block hashes'] == ['aa'*16, 'bb'*16]
+
+def test_snapshot_round_trip(tmp_path):
+    file_name = str(tmp_path/'log.pathtable')
+    snapshot_io.write_snapshot(False, LIST_OF_RECORDS, file_name, 'pathtable', {'hash': 'md5'}, {'/r': 'ff'})
+    assert list(snapshot_io.iter_snapshot_records(False, file_name)) == LIST_OF_RECORDS
+    assert snapshot_io.read_snapshot_header(file_name)['hash'] == 'md5'
+    assert dict(snapshot_io.iter_directory_hashes(False, file_name)) == {'/r': 'ff'}
+
+def test_remove_rows():
+    table = path_table.from_records(LIST_OF_RECORDS)
+    table.remove_rows({0, 2})
+    assert [file_dict['full path'] for file_dict in table.iter_records()] == ['/r/d/b', '/r/d/', '/r/\udcff']
+    assert table.find('/r/d/') == 1
+
+def test_diff_tables_matches_diff_records():
+    list_of_previous = [{'full path': '/r/a', 'hash of file': '01'}, {'full path': '/r/b', 'hash of file': '02'},
+                        {'full path': '/r/c', 'hash of file': '03'}, {'full path': '/r/d/x', 'hash of file': '04'}]
+    list_of_current = [{'full path': '/r/a', 'hash of file': '05'}, {'full path': '/r/e/b', 'hash of file': '02'},
+                       {'full path': '/r/d/x', 'hash of file': '04'}, {'full path': '/r/f', 'hash of file': '06'}]
+    assert dc.diff_tables(False, path_table.from_records(list_of_previous), path_table.from_records(list_of_current)) == \
+        dc.diff_records(False, list_of_previous, list_of_current)
+
+def test_find_after_add_and_remove():
+    table = path_table.from_records(LIST_OF_RECORDS)
+    assert table.find('/r/d/b') == 1
+    assert table.find('/r/d/c') is None
+    row = table.add('/r/d/c', '07'*16)
+    assert table.find('/r/d/c') == row
+    table.remove_rows({0, 1})
+    assert table.find('/r/d/b') is None
+    assert table.get('/r/d/c')['hash of file'] == '07'*16
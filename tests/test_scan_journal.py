@@ -0,0 +1,88 @@
+"""
+scan_journal.py: checkpointing a scan, and resuming it with change_tracker.py --resume
+"""
+
+import os
+import change_tracker as ct
+import metrics
+import scan_journal
+
+def make_tree(tmp_path):
+    path_to_search = tmp_path/'tree'
+    for dir_name in ['a', 'b']:
+        (path_to_search/dir_name).mkdir(parents=True)
+        for indx in range(3):
+            (path_to_search/dir_name/('f'+str(indx))).write_bytes(os.urandom(100 + indx))
+    return str(path_to_search)
+
+def start(path_to_search, tmp_path, resume):
+    scan_options = {'resume': resume, 'checkpoint_every': 60}
+    return ct.start_journal(False, path_to_search, str(tmp_path), 'log', scan_options)
+
+def interrupted_scan(path_to_search, tmp_path):
+    """
+    a scan whose journal was checkpointed but whose snapshot was never written
+    """
+    journal = start(path_to_search, tmp_path, False)
+    list_of_dicts = ct.hash_list_of_files(False, path_to_search, {}, None, None, journal)
+    journal.close()
+    return list_of_dicts
+
+def record_hashed_files(monkeypatch):
+    list_of_hashed = []
+    real_hash_files = ct.hash_files
+    def hash_files(list_of_filenames, *args, **kwargs):
+        list_of_hashed.extend(list_of_filenames)
+        return real_hash_files(list_of_filenames, *args, **kwargs)
+    monkeypatch.setattr(ct, 'hash_files', hash_files)
+    return list_of_hashed
+
+def test_resume_reuses_the_journal(tmp_path, monkeypatch):
+    path_to_search = make_tree(tmp_path)
+    list_of_first = interrupted_scan(path_to_search, tmp_path)
+    list_of_hashed = record_hashed_files(monkeypatch)
+    run_metrics = metrics.Metrics('test')
+    journal = start(path_to_search, tmp_path, True)
+    assert len(journal.dict_of_records) == 6 and len(journal.dict_of_done_dirs) == 3 # the tree, a and b
+    list_of_second = ct.hash_list_of_files(False, path_to_search, {}, None, run_metrics, journal)
+    journal.remove()
+    assert list_of_hashed == []
+    assert run_metrics.dict_of_counters['hashes resumed'] == 6
+    assert list_of_second == list_of_first
+    assert not os.path.exists(journal.file_name)
+
+def test_torn_last_line_is_dropped(tmp_path):
+    path_to_search = make_tree(tmp_path)
+    interrupted_scan(path_to_search, tmp_path)
+    file_name = scan_journal.journal_file_name(str(tmp_path), 'log')
+    whole_length = os.path.getsize(file_name)
+    with open(file_name, 'a') as fil:
+        fil.write('{"full path":"'+path_to_search+'/a/f9","hash')
+    header = ct.journal_header(path_to_search, {})
+    dict_of_records, _, valid_length = scan_journal.read_journal(False, file_name, header)
+    assert valid_length == whole_length and len(dict_of_records) == 6
+    journal = scan_journal.open_journal(False, file_name, header, True)
+    journal.write_line({'directory': '/x', 'mtime_ns': 1})
+    journal.close()
+    assert len(scan_journal.read_journal(False, file_name, header)[1]) == 4
+
+def test_journal_of_another_scan_starts_over(tmp_path):
+    path_to_search = make_tree(tmp_path)
+    interrupted_scan(path_to_search, tmp_path)
+    file_name = scan_journal.journal_file_name(str(tmp_path), 'log')
+    journal = scan_journal.open_journal(False, file_name, ct.journal_header(path_to_search, {'hash': 'sha256'}), True)
+    journal.close()
+    assert journal.dict_of_records == {}
+    with open(file_name) as fil:
+        assert len(fil.readlines()) == 1
+
+def test_changed_directory_is_stated_again(tmp_path, monkeypatch):
+    path_to_search = make_tree(tmp_path)
+    interrupted_scan(path_to_search, tmp_path)
+    (tmp_path/'tree'/'b'/'new').write_bytes(b'new')
+    list_of_hashed = record_hashed_files(monkeypatch)
+    journal = start(path_to_search, tmp_path, True)
+    list_of_dicts = ct.hash_list_of_files(False, path_to_search, {}, None, None, journal)
+    journal.remove()
+    assert list_of_hashed == [path_to_search+'/b/new']
+    assert len(list_of_dicts) == 7
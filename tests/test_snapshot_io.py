@@ -0,0 +1,28 @@
+"""
+the json, sqlite and pathtable snapshot formats of snapshot_io.py
+"""
+
+import os
+import pytest
+import change_tracker as ct
+import snapshot_io
+
+@pytest.mark.parametrize('snapshot_format', ['json', 'sqlite', 'pathtable'])
+def test_non_utf8_names_round_trip(tmp_path, snapshot_format):
+    path_to_search = tmp_path/'tree'
+    (path_to_search/'d').mkdir(parents=True)
+    for name in [b'a', b'\xff', b'\xe9t\xe9', 'été'.encode(), b'z']:
+        with open(os.fsencode(path_to_search/'d')+b'/'+name, 'wb') as fil:
+            fil.write(name)
+    with open(os.fsencode(path_to_search)+b'/\x80', 'wb') as fil:
+        fil.write(b'x')
+    list_of_dicts = ct.hash_list_of_files(False, str(path_to_search))
+    assert str(path_to_search)+'/d/\udcff' in [file_dict['full path'] for file_dict in list_of_dicts]
+    dict_of_directories = ct.directory_hashes(list_of_dicts, str(path_to_search))
+    file_name = str(tmp_path/('log'+snapshot_io.SNAPSHOT_FORMATS[snapshot_format]))
+    snapshot_io.write_snapshot(False, list_of_dicts, file_name, snapshot_format, {}, dict_of_directories)
+    assert sorted(snapshot_io.iter_snapshot_records(False, file_name), key=lambda file_dict: file_dict['full path']) == \
+        sorted(list_of_dicts, key=lambda file_dict: file_dict['full path'])
+    assert dict(snapshot_io.iter_directory_hashes(False, file_name)) == dict_of_directories
+    list_of_sorted = [file_dict['full path'] for file_dict in snapshot_io.iter_sorted_records(False, file_name)]
+    assert list_of_sorted == sorted(file_dict['full path'] for file_dict in list_of_dicts)
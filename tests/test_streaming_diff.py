@@ -0,0 +1,70 @@
+"""
+diff_changes.streaming_diff and the external sort of snapshot_io.iter_sorted_records
+"""
+
+import os
+import random
+import tempfile
+import diff_changes as dc
+import snapshot_io
+
+def random_snapshots(number_of_files=3000, seed=7):
+    """
+    two snapshots with unchanged, changed, moved (including duplicate content), added and deleted files
+    """
+    rng = random.Random(seed)
+    dict_of_previous = {'/r/d'+str(indx % 37)+'/f'+str(indx): format(rng.getrandbits(32), '08x')
+                        for indx in range(number_of_files)}
+    dict_of_current = {}
+    for indx, (full_path, hash_of_file) in enumerate(sorted(dict_of_previous.items())):
+        choice = indx % 10
+        if choice == 0:
+            dict_of_current[full_path] = format(rng.getrandbits(32), '08x') # changed
+        elif choice == 1:
+            dict_of_current[full_path+'.moved'] = hash_of_file # moved
+        elif choice == 2:
+            pass # deleted
+        else:
+            dict_of_current[full_path] = hash_of_file
+    for indx in range(50):
+        dict_of_current['/r/new/f'+str(indx)] = 'd0d0d0d0' # added, all with the same content
+    dict_of_previous['/r/old/dup'] = 'd0d0d0d0'
+    return dict_of_previous, dict_of_current
+
+def write(tmp_path, name, dict_of_hashes, snapshot_format='json'):
+    file_name = str(tmp_path/(name+snapshot_io.SNAPSHOT_FORMATS[snapshot_format]))
+    list_of_dicts = [{'full path': full_path, 'hash of file': hash_of_file}
+                     for full_path, hash_of_file in dict_of_hashes.items()]
+    random.Random(1).shuffle(list_of_dicts) # not in path order
+    snapshot_io.write_snapshot(False, list_of_dicts, file_name, snapshot_format, {})
+    return file_name
+
+def to_records(dict_of_hashes):
+    return [{'full path': full_path, 'hash of file': hash_of_file} for full_path, hash_of_file in dict_of_hashes.items()]
+
+def test_streaming_diff_matches_diff_records(tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    dict_of_previous, dict_of_current = random_snapshots()
+    list_of_expected = sorted(dc.diff_records(False, to_records(dict_of_previous), to_records(dict_of_current)))
+    for snapshot_format in ['json', 'sqlite']:
+        previous_file = write(tmp_path, 'previous', dict_of_previous, snapshot_format)
+        current_file = write(tmp_path, 'current', dict_of_current, snapshot_format)
+        # the smallest budget sorts the json snapshots in several runs
+        assert sorted(dc.streaming_diff(False, previous_file, current_file, 0)) == list_of_expected
+    assert [name for name in os.listdir(tmp_path) if name.startswith(('snapshot_run_', 'diff_changes_'))] == []
+
+def test_external_sort(tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    dict_of_previous, _ = random_snapshots(500)
+    file_name = write(tmp_path, 'previous', dict_of_previous)
+    list_of_sorted = list(snapshot_io.iter_sorted_records(False, file_name, None, 7))
+    assert [file_dict['full path'] for file_dict in list_of_sorted] == sorted(dict_of_previous)
+    assert [name for name in os.listdir(tmp_path) if name.startswith('snapshot_run_')] == []
+
+def test_directory_skips(tmp_path):
+    dict_of_previous = {'/r/a/x': '1', '/r/b/y': '2'}
+    dict_of_current = {'/r/a/x': '3', '/r/b/y': '4'}
+    previous_file = write(tmp_path, 'previous', dict_of_previous)
+    current_file = write(tmp_path, 'current', dict_of_current)
+    assert list(dc.streaming_diff(False, previous_file, current_file, 1, 'hash', {'/r/a'}, {'/r/a'})) == \
+        [('changed', '/r/b/y', '/r/b/y', '2', '4')]
@@ -0,0 +1,58 @@
+"""
+diff_changes.timeline_events: one pass over a range of snapshots
+"""
+
+import diff_changes as dc
+import snapshot_io
+
+def write_snapshots(tmp_path, list_of_states, list_of_headers=None):
+    list_of_files = []
+    for indx, dict_of_hashes in enumerate(list_of_states):
+        file_name = str(tmp_path/('log_2019-11-1'+str(indx)+'T00-00.json'))
+        list_of_dicts = [{'full path': full_path, 'hash of file': hash_of_file, 'size': len(hash_of_file),
+                          'mtime_ns': int(hash_of_file, 16), 'inode': 1, 'device': 1}
+                         for full_path, hash_of_file in sorted(dict_of_hashes.items())]
+        header = {} if list_of_headers is None else list_of_headers[indx]
+        snapshot_io.write_snapshot(False, list_of_dicts, file_name, 'json', header)
+        list_of_files.append(file_name)
+    return list_of_files
+
+LIST_OF_STATES = [{'/a': '01', '/b': '02', '/c': '03'},
+                  {'/a': '04', '/b': '02', '/d': '03'},
+                  {'/a': '01', '/d': '03', '/e': '05'}]
+
+def count_diffs(monkeypatch):
+    list_of_calls = []
+    real_diff = dc.diff_against_previous
+    def diff_against_previous(*args, **kwargs):
+        list_of_calls.append(args[1])
+        return real_diff(*args, **kwargs)
+    monkeypatch.setattr(dc, 'diff_against_previous', diff_against_previous)
+    return list_of_calls
+
+def test_timeline_matches_pairwise_diffs(tmp_path, monkeypatch):
+    list_of_files = write_snapshots(tmp_path, LIST_OF_STATES)
+    list_of_calls = count_diffs(monkeypatch)
+    list_of_timeline = list(dc.timeline_events(False, list_of_files))
+    # the first snapshot seeds the running state and is not diffed against an empty one
+    assert len(list_of_calls) == 2 and len(list_of_calls[0]) > 0
+    assert [(previous_file, current_file) for previous_file, current_file, _ in list_of_timeline] == \
+        list(zip(list_of_files, list_of_files[1:]))
+    for (previous_file, current_file, list_of_events), (previous_state, current_state) in zip(
+            list_of_timeline, zip(LIST_OF_STATES, LIST_OF_STATES[1:])):
+        assert list_of_events == dc.diff_records(
+            False, [{'full path': path, 'hash of file': hash_of_file} for path, hash_of_file in previous_state.items()],
+            [{'full path': path, 'hash of file': hash_of_file} for path, hash_of_file in sorted(current_state.items())])
+
+def test_timeline_of_one_snapshot(tmp_path):
+    assert list(dc.timeline_events(False, write_snapshots(tmp_path, LIST_OF_STATES[:1]))) == []
+    assert list(dc.timeline_events(False, [])) == []
+
+def test_timeline_across_hash_settings(tmp_path):
+    list_of_headers = [{'hash': 'md5'}, {'hash': 'sha1'}, {'hash': 'sha1'}]
+    list_of_files = write_snapshots(tmp_path, LIST_OF_STATES, list_of_headers)
+    list_of_timeline = list(dc.timeline_events(False, list_of_files))
+    # compared on stat metadata across the change of algorithm, on hashes after it
+    assert ('changed', '/a', '/a') in [event[:3] for event in list_of_timeline[0][2]]
+    assert [event[:3] for event in list_of_timeline[1][2]] == \
+        [event[:3] for event in list(dc.timeline_events(False, list_of_files[1:]))[0][2]]
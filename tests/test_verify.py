@@ -0,0 +1,67 @@
+"""
+the tiered verification of change_tracker.py --verify_every
+"""
+
+import os
+import change_tracker as ct
+import metrics
+
+def test_every_file_is_due_once_per_cycle():
+    list_of_filenames = ['/r/d'+str(indx % 13)+'/f'+str(indx) for indx in range(1000)]
+    for verify_every in [1, 4, 7]:
+        for first_run in [0, 5]:
+            list_of_due = [filename for verify_run in range(first_run, first_run + verify_every)
+                           for filename in list_of_filenames if ct.verify_due(filename, verify_run, verify_every)]
+            assert sorted(list_of_due) == sorted(list_of_filenames)
+
+def scan(path_to_search, list_of_previous, scan_options, run_metrics=None):
+    previous_snapshot = {file_dict['full path']: file_dict for file_dict in list_of_previous}
+    return ct.hash_list_of_files(False, path_to_search, scan_options, previous_snapshot, run_metrics)
+
+def test_content_changed_behind_the_stat(tmp_path):
+    filename = tmp_path/'f'
+    filename.write_bytes(b'a' * 100000)
+    for compact in [False, True]:
+        scan_options = {'incremental': True, 'verify_every': 1, 'sample_size': 4096, 'verify_run': 0,
+                        'compact': compact}
+        list_of_first = list(scan(str(tmp_path), [], scan_options))
+        # flip a byte outside the samples, and put the mtime back
+        stat_result = os.stat(filename)
+        with open(filename, 'r+b') as fil:
+            fil.seek(20000)
+            fil.write(b'b')
+        os.utime(filename, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns))
+        run_metrics = metrics.Metrics('test')
+        list_of_second = list(scan(str(tmp_path), list_of_first, scan_options, run_metrics))
+        assert run_metrics.dict_of_counters['verification failures'] == 1
+        assert list_of_second[0]['hash of file'] == ct.hash_file(str(filename))[1]
+        assert list_of_second[0]['runs since hash'] == 0
+        filename.write_bytes(b'a' * 100000)
+
+def test_sample_mismatch_forces_a_rehash(tmp_path):
+    filename = tmp_path/'f'
+    filename.write_bytes(b'a' * 100000)
+    # a cycle long enough that the file is not due in the second run
+    scan_options = {'incremental': True, 'verify_every': 1000, 'sample_size': 4096, 'verify_run': 0}
+    while ct.verify_due(str(filename), 1, 1000):
+        filename = filename.with_name(filename.name+'f')
+        os.rename(tmp_path/os.listdir(tmp_path)[0], filename)
+    list_of_first = scan(str(tmp_path), [], scan_options)
+    stat_result = os.stat(filename)
+    with open(filename, 'r+b') as fil:
+        fil.write(b'b')
+    os.utime(filename, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns))
+    run_metrics = metrics.Metrics('test')
+    list_of_second = scan(str(tmp_path), list_of_first, dict(scan_options, verify_run=1), run_metrics)
+    assert run_metrics.dict_of_counters['quick check mismatches'] == 1
+    assert run_metrics.dict_of_counters['verification failures'] == 1
+    assert list_of_second[0]['hash of file'] == ct.hash_file(str(filename))[1]
+
+def test_quick_check_counts_the_bytes_read(tmp_path):
+    (tmp_path/'small').write_bytes(b'a' * 1000)
+    (tmp_path/'large').write_bytes(b'a' * 100000)
+    scan_options = {'sample_size': 4096}
+    list_of_results = ct.hash_files([str(tmp_path/'small'), str(tmp_path/'large'), str(tmp_path/'missing')],
+                                    scan_options, None, None, ct.sample_worker)
+    assert [bytes_read for _, _, bytes_read, _ in list_of_results] == [1000, 4096*len(ct.SAMPLE_FRACTIONS), 0]
+    assert list_of_results[0][1] == ct.hash_file(str(tmp_path/'small'))[1]
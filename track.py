@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+
+"""
+scan, diff, find duplicates and roll the logs in one process
+
+change_diff_roll.sh used to start change_tracker.py, diff_changes.py, rolling_logs.py and find_dupes.py one after
+the other; each re-read the snapshot directory and the diff and the duplicate finder parsed the new snapshot again.
+Here the fresh scan stays in memory and is handed to each stage, and the previous snapshot is read once,
+for both the incremental scan and the diff.
+
+Every stage but the scan can be skipped with --skip (repeatable): diff, dupes, retention.
+The scan options are the ones change_tracker.py takes; the retention options the ones rolling_logs.py takes.
+
+standard use:
+python3 track.py --search_path="/home/jovyan/tmp" --write_path="." --output_prefix="logs" --number_to_keep="3"
+
+python3 track.py --search_path="/home/jovyan/tmp" --write_path="." --incremental --workers="4" --skip="dupes" --debug
+
+python3 track.py --search_path="/home/jovyan/tmp" --write_path="." --history --keep_weekly="13"
+
+for trees with millions of files, keep the scan and the previous snapshot as path tables (see path_table.py):
+python3 track.py --search_path="/home/jovyan/tmp" --write_path="." --incremental --compact --format="pathtable"
+
+a long scan can be checkpointed and resumed after an interruption (see scan_journal.py):
+python3 track.py --search_path="/home/jovyan/tmp" --write_path="." --incremental --checkpoint_every="60" --resume
+
+one metrics summary covers every stage (see metrics.py):
+python3 track.py --search_path="/home/jovyan/tmp" --write_path="." --metrics="track_metrics.json" --progress="30"
+
+*********************
+# https://docs.python.org/3/library/doctest.html
+python3 -m doctest track.py
+
+"""
+
+import sys
+import os
+import change_tracker as ct
+import diff_changes as dc
+import find_dupes as fd
+import rolling_logs as rl
+import snapshot_io
+import history_index
+import metrics
+import path_table
+
+# the stages after the scan, in the order they run
+STAGES = ['diff', 'dupes', 'retention']
+
+def parse_args(list_of_args):
+    """
+    >>> parse_args(['name of py script', '--search_path=.', '--write_path=.', '--skip=dupes'])[6]
+    ['diff', 'retention']
+    >>> parse_args(['name of py script', 'invalid arg'])[:4]
+    (False, '.', '.', 'log')
+    """
+    prnt_debug, path_to_search, write_path, output_prefix, scan_options = ct.parse_args(list_of_args)
+    if scan_options['shard'] is not None:
+        raise Exception('ERROR: track.py scans the whole tree; scan shards with change_tracker.py and join them with merge_shards.py')
+    # rolling_logs validates its own options; the snapshots it rolls are the ones in write_path
+    _, _, number_to_keep, retention_options = rl.parse_args(list_of_args + ['--path_to_json='+write_path])
+    retention_options['number_to_keep'] = number_to_keep
+    list_of_stages = list(STAGES)
+    for arg in list_of_args:
+        if '--skip' in arg:
+            stage = arg.replace('--skip=', '')
+            if stage not in STAGES:
+                raise Exception('ERROR: skip must be one of', STAGES)
+            if stage in list_of_stages:
+                list_of_stages.remove(stage)
+    return prnt_debug, path_to_search, write_path, output_prefix, scan_options, retention_options, list_of_stages
+
+def args_use(list_of_args):
+    """
+    >>> args_use(['name of file'])
+    Traceback (most recent call last):
+    ...
+    SystemExit: 1
+    """
+    if len(list_of_args) == 1:
+        print('ERROR: invalid number of arguments')
+        print('required arguments:')
+        print('  --search_path="/path/to/search"')
+        print('  --write_path="/path/to/write"')
+        print('optional arguments:')
+        print('  --output_prefix="logs"')
+        print('  --skip="diff" (repeatable; diff, dupes, retention)')
+        print('  any option of change_tracker.py, e.g. --incremental --workers="4" --format="sqlite"')
+        print('  any option of rolling_logs.py, e.g. --number_to_keep="3" --history --keep_daily="7"')
+        print('  --metrics="track_metrics.json" --progress="30" --profile="track.prof"')
+        print('  --debug')
+        sys.exit(1)
+    elif len(list_of_args) > 1:
+        return parse_args(list_of_args)
+    else:
+        raise Exception('invalid option')
+
+def read_previous_snapshot(prnt_debug, write_path, output_prefix, list_of_stages, scan_options):
+    """
+    the latest snapshot with this output_prefix, read once for the incremental scan and the diff;
+    returns (file name or None, header, dict of full path: record),
+    with a path_table.PathTable in place of the dict when scan_options['compact'] is set
+    """
+    list_of_previous = snapshot_io.latest_snapshots(prnt_debug, write_path, 1, output_prefix)
+    if len(list_of_previous) == 0 or ('diff' not in list_of_stages and not scan_options['incremental']):
+        return None, {}, {}
+    previous_file = list_of_previous[0]
+    if scan_options['compact']:
+        return previous_file, snapshot_io.read_snapshot_header(previous_file), snapshot_io.read_path_table(
+            prnt_debug, previous_file)
+    dict_of_previous = {file_dict['full path']: file_dict
+                        for file_dict in snapshot_io.iter_snapshot_records(prnt_debug, previous_file)}
+    return previous_file, snapshot_io.read_snapshot_header(previous_file), dict_of_previous
+
+def scan_stage(prnt_debug, path_to_search, write_path, output_prefix, scan_options, previous_header, dict_of_previous,
+               run_metrics=None):
+    """
+    change_tracker.py: hash the tree and write the snapshot; returns (list of records, dict of directory digests)
+    """
+    previous_snapshot = {}
+    if scan_options['incremental'] and ct.hash_settings(previous_header) == ct.hash_settings(scan_options):
+        previous_snapshot = dict_of_previous
+    if scan_options['verify_every'] > 0:
+        ct.start_verify_run(scan_options, previous_header)
+    journal = ct.start_journal(prnt_debug, path_to_search, write_path, output_prefix, scan_options)
+    try:
+        list_of_dicts = ct.hash_list_of_files(prnt_debug, path_to_search, scan_options, previous_snapshot, run_metrics,
+                                              journal)
+    finally:
+        if journal is not None: journal.close()
+    with metrics.phase(run_metrics, 'directory hashes'):
+        dict_of_directories = ct.directory_hashes(list_of_dicts, path_to_search, scan_options['hash'],
+                                                  scan_options['digest_size'])
+    with metrics.phase(run_metrics, 'write'):
+        file_name = ct.write_list_of_dicts_to_snapshot(prnt_debug, list_of_dicts, write_path, output_prefix,
+                                                       scan_options['format'], ct.snapshot_header(path_to_search, scan_options),
+                                                       dict_of_directories)
+    if journal is not None: journal.remove()
+    if prnt_debug: print('wrote', file_name)
+    return list_of_dicts, dict_of_directories
+
+def diff_stage(prnt_debug, previous_file, previous_header, dict_of_previous, list_of_dicts, dict_of_directories,
+               scan_options):
+    """
+    diff_changes.py, with the current snapshot taken from memory
+    """
+    compare_on = dc.comparison_mode_of_headers(prnt_debug, previous_header, scan_options)
+    set_of_previous_skips, set_of_current_skips, list_of_folder_events = set(), set(), []
+    if compare_on == 'hash':
+        set_of_previous_skips, set_of_current_skips, list_of_folder_events = dc.compare_directory_hashes(
+            prnt_debug, dict(snapshot_io.iter_directory_hashes(prnt_debug, previous_file)), dict_of_directories)
+    dc.print_change_events(prnt_debug, list_of_folder_events)
+
+    if isinstance(dict_of_previous, path_table.PathTable):
+        # --compact: both snapshots are path tables
+        iterable_of_previous = dict_of_previous
+        list_of_events = dc.diff_tables(prnt_debug, dict_of_previous, list_of_dicts, compare_on,
+                                        set_of_previous_skips, set_of_current_skips)
+    else:
+        iterable_of_previous = dict_of_previous.values()
+        list_of_events = dc.diff_records(
+            prnt_debug,
+            dc.comparison_records(dc.records_outside_directories(iterable_of_previous, set_of_previous_skips), compare_on),
+            dc.comparison_records(dc.records_outside_directories(list_of_dicts, set_of_current_skips), compare_on))
+    dict_of_ranges = {}
+    if compare_on == 'hash':
+        dict_of_ranges = dc.block_changes_of_records(
+            iterable_of_previous, list_of_dicts, ct.hash_settings(scan_options)[2],
+            set(event[2] for event in list_of_events if event[0] == 'changed'))
+    dc.print_change_events(prnt_debug, list_of_events, dict_of_ranges)
+
+def dupes_stage(prnt_debug, list_of_dicts, scan_options):
+    """
+    find_dupes.py, with the snapshot taken from memory
+    """
+    if scan_options['hash'] == 'crc32':
+        print('WARNING: crc32 digests cannot identify duplicates; skipping the duplicate search')
+        return
+    if isinstance(list_of_dicts, path_table.PathTable):
+        print(fd.duplicate_groups_to_str(fd.duplicate_groups_of_table(list_of_dicts)))
+        return
+    print(fd.duplicate_groups_to_str(fd.duplicate_groups(list_of_dicts)))
+
+def retention_stage(prnt_debug, write_path, retention_options):
+    """
+    rolling_logs.py
+    """
+    if retention_options['history']:
+        rl.add_to_history(prnt_debug, write_path)
+        rl.compact_history(prnt_debug, write_path, retention_options['deltas_to_keep'])
+    rl.delete_old_logs(prnt_debug, write_path, retention_options['number_to_keep'], retention_options)
+
+def track(prnt_debug, path_to_search, write_path, output_prefix, scan_options, retention_options, list_of_stages,
+          run_metrics=None):
+    """
+    run the scan, then each stage in list_of_stages; run_metrics (a metrics.Metrics) times every stage
+    """
+    with metrics.phase(run_metrics, 'read previous'):
+        previous_file, previous_header, dict_of_previous = read_previous_snapshot(
+            prnt_debug, write_path, output_prefix, list_of_stages, scan_options)
+    list_of_dicts, dict_of_directories = scan_stage(prnt_debug, path_to_search, write_path, output_prefix,
+                                                    scan_options, previous_header, dict_of_previous, run_metrics)
+    if scan_options['index']:
+        # before retention, so the index sees every snapshot before it can be deleted
+        with metrics.phase(run_metrics, 'index'):
+            history_index.update_index(prnt_debug, write_path)
+    if 'diff' in list_of_stages:
+        if previous_file is None:
+            print("no previous snapshot to compare with.")
+        else:
+            with metrics.phase(run_metrics, 'diff'):
+                diff_stage(prnt_debug, previous_file, previous_header, dict_of_previous, list_of_dicts,
+                           dict_of_directories, scan_options)
+    # the previous snapshot is not needed past the diff
+    dict_of_previous = None
+    if 'dupes' in list_of_stages:
+        with metrics.phase(run_metrics, 'dupes'):
+            dupes_stage(prnt_debug, list_of_dicts, scan_options)
+    if 'retention' in list_of_stages:
+        with metrics.phase(run_metrics, 'retention'):
+            retention_stage(prnt_debug, write_path, retention_options)
+
+
+if __name__ == '__main__':
+
+    prnt_debug, path_to_search, write_path, output_prefix, scan_options, retention_options, list_of_stages = args_use(sys.argv)
+    run_metrics = metrics.start_metrics(prnt_debug, metrics.parse_args(sys.argv), 'track')
+    track(prnt_debug, path_to_search, write_path, output_prefix, scan_options, retention_options, list_of_stages,
+          run_metrics)
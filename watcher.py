@@ -0,0 +1,430 @@
+#!/usr/bin/env python
+
+"""
+keep a live index of a directory tree with Linux inotify, instead of a full crawl per run
+
+After one crawl at start up (which reuses hashes from the previous snapshot with --incremental),
+only the files inotify reports as touched are rehashed.
+Events are debounced: a path is rehashed once it has been quiet for --debounce seconds,
+so a file that is being written is hashed once, after the writer is done.
+Hashing runs in a background thread (which uses the --workers pool), so the event queue keeps being drained.
+
+A snapshot that diff_changes.py can compare is written
+* every --snapshot_every seconds (0 means never on a schedule)
+* when the process receives SIGUSR1
+* when the process is stopped with SIGINT or SIGTERM
+
+If the kernel event queue overflows, events were lost and the tree is rescanned by stat;
+only files whose size, mtime, inode or device changed are rehashed.
+A directory that is created or moved into the tree is rescanned the same way, and is watched from then on.
+
+The scan options are the ones change_tracker.py takes.
+
+standard use:
+python3 watcher.py --search_path="/home/jovyan/tmp" --write_path="." --snapshot_every="3600"
+
+python3 watcher.py --search_path="/home/jovyan/tmp" --write_path="." --incremental --debounce="5" --workers="4" --debug
+
+kill -USR1 <pid of watcher.py>
+
+*********************
+# https://man7.org/linux/man-pages/man7/inotify.7.html
+Every watched directory uses one inotify watch; large trees may need a higher limit:
+sysctl fs.inotify.max_user_watches=1048576
+
+*********************
+# https://docs.python.org/3/library/doctest.html
+python3 -m doctest watcher.py
+
+"""
+
+import ctypes # inotify system calls
+import os
+import queue # work handed to the hashing thread
+import select # wait for inotify events with a timeout
+import signal # snapshot on demand, clean shutdown
+import struct # decode inotify events
+import sys
+import threading # hashing thread
+import time
+import change_tracker as ct
+
+# https://man7.org/linux/man-pages/man7/inotify.7.html ; values from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ONLYDIR
+
+EVENT_HEADER = struct.Struct('iIII') # wd, mask, cookie, len
+
+def parse_args(list_of_args):
+    """
+    the change_tracker.py options, plus --debounce and --snapshot_every (both in seconds)
+
+    >>> parse_args(['name of py script', '--search_path=.', '--write_path=.', '--debounce=5'])[4]['debounce']
+    5.0
+    >>> parse_args(['name of py script', 'invalid arg'])[:4]
+    (False, '.', '.', 'log')
+    """
+    prnt_debug, path_to_search, write_path, output_prefix, scan_options = ct.parse_args(list_of_args)
+    watch_options = {'debounce': '2', 'snapshot_every': '0'}
+    for arg in list_of_args:
+        if '--debounce' in arg:
+            watch_options['debounce'] = arg.replace('--debounce=', '')
+        elif '--snapshot_every' in arg:
+            watch_options['snapshot_every'] = arg.replace('--snapshot_every=', '')
+    for option_name in ['debounce', 'snapshot_every']:
+        try:
+            watch_options[option_name] = float(watch_options[option_name])
+        except ValueError:
+            raise Exception('ERROR: '+option_name+' must be a number of seconds:', watch_options[option_name])
+        if watch_options[option_name] < 0:
+            raise Exception('ERROR: '+option_name+' must be 0 or greater')
+    scan_options.update(watch_options)
+    return prnt_debug, path_to_search, write_path, output_prefix, scan_options
+
+def args_use(list_of_args):
+    """
+    >>> args_use(['name of file'])
+    Traceback (most recent call last):
+    ...
+    SystemExit: 1
+    """
+    if len(list_of_args) == 1:
+        print('ERROR: invalid number of arguments')
+        print('required arguments:')
+        print('  --search_path="/path/to/search"')
+        print('  --write_path="/path/to/write"')
+        print('optional arguments:')
+        print('  --debounce="2" (seconds a path must be quiet before it is rehashed)')
+        print('  --snapshot_every="3600" (seconds; 0 writes a snapshot only on SIGUSR1 and on exit)')
+        print('  any option of change_tracker.py, e.g. --incremental --workers="4" --format="sqlite"')
+        print('  --debug')
+        sys.exit(1)
+    elif len(list_of_args) > 1:
+        prnt_debug, path_to_search, write_path, output_prefix, scan_options = parse_args(list_of_args)
+    else:
+        raise Exception('invalid option')
+    return prnt_debug, path_to_search, write_path, output_prefix, scan_options
+
+class Inotify:
+    """
+    a minimal wrapper of the inotify system calls through ctypes
+    """
+    def __init__(self):
+        if not sys.platform.startswith('linux'):
+            raise Exception('ERROR: watcher.py needs Linux inotify; platform is', sys.platform)
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            raise Exception('ERROR: inotify_init1 failed:', os.strerror(ctypes.get_errno()))
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        """
+        returns the watch descriptor, or -1 with the reason printed
+        """
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), ctypes.c_uint32(mask))
+        if wd < 0:
+            print('WARNING: cannot watch', path, os.strerror(ctypes.get_errno()))
+        return wd
+
+    def rm_watch(self, wd):
+        self.libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self, timeout):
+        """
+        a list of (wd, mask, cookie, name) events; empty when nothing arrived within timeout seconds
+        """
+        list_of_ready, _, _ = select.select([self.fd], [], [], timeout)
+        if len(list_of_ready) == 0:
+            return []
+        data = os.read(self.fd, 1024*1024)
+        return decode_events(data)
+
+    def close(self):
+        os.close(self.fd)
+
+def decode_events(data):
+    """
+    split a buffer read from an inotify descriptor into (wd, mask, cookie, name) events
+
+    >>> decode_events(struct.pack('iIII', 1, IN_CREATE, 0, 8) + b'new\\0\\0\\0\\0\\0')
+    [(1, 256, 0, 'new')]
+    """
+    list_of_events = []
+    offset = 0
+    while offset + EVENT_HEADER.size <= len(data):
+        wd, mask, cookie, name_len = EVENT_HEADER.unpack_from(data, offset)
+        offset += EVENT_HEADER.size
+        name = os.fsdecode(data[offset:offset+name_len].rstrip(b'\0'))
+        offset += name_len
+        list_of_events.append((wd, mask, cookie, name))
+    return list_of_events
+
+class LiveIndex:
+    """
+    the snapshot records of one tree, kept current from inotify events
+
+    dict_of_records maps a full path to its snapshot record, as produced by ct.hash_list_of_files.
+    dict_of_watches maps a watch descriptor to the directory it watches.
+    Both are shared between the event loop and the hashing thread, behind lock.
+    """
+    def __init__(self, prnt_debug, path_to_search, scan_options):
+        self.prnt_debug = prnt_debug
+        self.path_to_search = path_to_search
+        self.scan_options = scan_options
+        self.inotify = Inotify()
+        self.lock = threading.Lock()
+        self.dict_of_records = {}
+        self.dict_of_watches = {}
+        self.work_queue = queue.Queue()
+
+    def watch_tree(self, dir_path):
+        """
+        add a watch on dir_path and every directory under it; excluded directories are not watched
+        """
+        list_of_excludes = self.scan_options.get('excludes', [])
+        for root, list_of_dirs, _ in os.walk(dir_path):
+            relative_dir = os.path.relpath(root, self.path_to_search)
+            list_of_dirs[:] = [name for name in sorted(list_of_dirs)
+                               if not ct.is_excluded(name, os.path.normpath(os.path.join(relative_dir, name)),
+                                                     list_of_excludes)]
+            wd = self.inotify.add_watch(root)
+            if wd >= 0:
+                with self.lock:
+                    self.dict_of_watches[wd] = root
+
+    def is_excluded(self, path):
+        relative_path = os.path.relpath(path, self.path_to_search)
+        return ct.is_excluded(os.path.basename(path), relative_path, self.scan_options.get('excludes', []))
+
+    def unwatch_tree(self, dir_path):
+        """
+        drop the watches on dir_path and under it, e.g. when it is moved away
+        """
+        with self.lock:
+            for wd, watched_path in list(self.dict_of_watches.items()):
+                if watched_path == dir_path or watched_path.startswith(dir_path+'/'):
+                    self.inotify.rm_watch(wd)
+                    del self.dict_of_watches[wd]
+
+    def start(self, previous_snapshot):
+        """
+        watch the tree first, then crawl it, so nothing that changes during the crawl is missed
+        """
+        self.watch_tree(self.path_to_search)
+        list_of_dicts = ct.hash_list_of_files(self.prnt_debug, self.path_to_search, self.scan_options, previous_snapshot)
+        with self.lock:
+            self.dict_of_records = {file_dict['full path']: file_dict for file_dict in list_of_dicts}
+        if self.prnt_debug: print('watching', len(self.dict_of_watches), 'directories,', len(list_of_dicts), 'files')
+        threading.Thread(target=self.hash_loop, daemon=True).start()
+
+    def rehash_paths(self, list_of_paths):
+        """
+        bring the records of list_of_paths up to date; vanished paths are dropped.
+        A path whose stat is unchanged (an event that did not change its content, e.g. a touch of the permissions)
+        keeps its hash.
+        """
+        block_map_threshold = self.scan_options.get('block_map_threshold', 0)
+        block_map_size = self.scan_options.get('block_map_size', ct.DEFAULT_BLOCK_MAP_SIZE)
+        list_of_to_hash = []
+        list_of_block_starts = []
+        for filename in list_of_paths:
+            try:
+                stat_result = os.stat(filename)
+            except OSError:
+                stat_result = None
+            with self.lock:
+                previous_dict = self.dict_of_records.get(filename)
+                if stat_result is None or not os.path.isfile(filename):
+                    self.dict_of_records.pop(filename, None)
+                    continue
+            file_stat = ct.stat_to_dict(stat_result)
+            if ct.reuse_previous_hash(previous_dict, file_stat, 0):
+                continue
+            list_of_to_hash.append((filename, file_stat))
+            if block_map_threshold > 0 and file_stat['size'] >= block_map_threshold:
+                list_of_block_starts.append(ct.block_start_of_file(previous_dict, file_stat, block_map_size, 0))
+            else:
+                list_of_block_starts.append(None)
+        list_of_results = ct.hash_files([filename for filename, _ in list_of_to_hash], self.scan_options,
+                                        list_of_block_starts)
+        with self.lock:
+            for (filename, file_stat), (got_hash, hash_of_file, _, list_of_blocks) in zip(list_of_to_hash, list_of_results):
+                if not got_hash:
+                    self.dict_of_records.pop(filename, None)
+                    continue
+                file_dict = {'full path': filename, 'hash of file': hash_of_file}
+                file_dict.update(file_stat)
+                file_dict['runs since hash'] = 0
+                if list_of_blocks is not None:
+                    file_dict['block hashes'] = list_of_blocks
+                self.dict_of_records[filename] = file_dict
+                if self.prnt_debug: print(filename, hash_of_file, 'rehashed')
+
+    def rescan_subtree(self, dir_path):
+        """
+        compare dir_path on disk with the index: watch its directories,
+        rehash files that are new or whose stat changed, and drop records of files that are gone
+        """
+        if os.path.isdir(dir_path):
+            self.watch_tree(dir_path)
+        set_of_on_disk = set()
+        list_of_changed = []
+        list_of_excludes = self.scan_options.get('excludes', [])
+        if os.path.isdir(dir_path):
+            for filename, stat_result in ct.walk_files(self.prnt_debug, dir_path, list_of_excludes):
+                set_of_on_disk.add(filename)
+                with self.lock:
+                    previous_dict = self.dict_of_records.get(filename)
+                if not ct.reuse_previous_hash(previous_dict, ct.stat_to_dict(stat_result), 0):
+                    list_of_changed.append(filename)
+        prefix = dir_path.rstrip('/')+'/'
+        with self.lock:
+            for filename in [filename for filename in self.dict_of_records
+                             if filename.startswith(prefix) and filename not in set_of_on_disk]:
+                del self.dict_of_records[filename]
+        if self.prnt_debug: print('rescanned', dir_path, ':', len(list_of_changed), 'changed or new files')
+        self.rehash_paths(list_of_changed)
+
+    def hash_loop(self):
+        """
+        the hashing thread: work items are ('paths', list of paths) or ('rescan', directory)
+        """
+        while True:
+            kind, work = self.work_queue.get()
+            try:
+                if kind == 'rescan':
+                    self.rescan_subtree(work)
+                else:
+                    self.rehash_paths(work)
+            except Exception as err:
+                print('WARNING: could not update', work, err)
+            finally:
+                self.work_queue.task_done()
+
+    def snapshot_records(self):
+        """
+        a copy of the records in path order, once the queued work is finished
+        """
+        self.work_queue.join()
+        with self.lock:
+            return [self.dict_of_records[filename] for filename in sorted(self.dict_of_records.keys())]
+
+def write_snapshot(prnt_debug, live_index, write_path, output_prefix):
+    """
+    write the live index as a change_tracker snapshot; returns the file name
+    """
+    scan_options = live_index.scan_options
+    list_of_dicts = live_index.snapshot_records()
+    dict_of_directories = ct.directory_hashes(list_of_dicts, live_index.path_to_search,
+                                              scan_options['hash'], scan_options['digest_size'])
+    file_name = ct.write_list_of_dicts_to_snapshot(prnt_debug, list_of_dicts, write_path, output_prefix,
+                                                   scan_options['format'],
+                                                   ct.snapshot_header(live_index.path_to_search, scan_options),
+                                                   dict_of_directories)
+    print('wrote', file_name, 'with', len(list_of_dicts), 'files')
+    return file_name
+
+def watch(prnt_debug, live_index, write_path, output_prefix):
+    """
+    the event loop: collect events, hand quiet paths to the hashing thread,
+    and write snapshots on schedule, on SIGUSR1 and on exit
+    """
+    scan_options = live_index.scan_options
+    debounce = scan_options['debounce']
+    snapshot_every = scan_options['snapshot_every']
+    dict_of_flags = {'snapshot': False, 'stop': False}
+    def request_snapshot(signum, frame):
+        dict_of_flags['snapshot'] = True
+    def request_stop(signum, frame):
+        dict_of_flags['stop'] = True
+    signal.signal(signal.SIGUSR1, request_snapshot)
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    dict_of_pending_paths = {} # path: time of the last event
+    dict_of_pending_dirs = {} # directory to rescan: time of the last event
+    next_snapshot = time.time() + snapshot_every if snapshot_every > 0 else None
+    while not dict_of_flags['stop']:
+        list_of_deadlines = [last_event + debounce for last_event in
+                             list(dict_of_pending_paths.values()) + list(dict_of_pending_dirs.values())]
+        if next_snapshot is not None:
+            list_of_deadlines.append(next_snapshot)
+        timeout = 1.0
+        if len(list_of_deadlines) > 0:
+            timeout = min(timeout, max(0.0, min(list_of_deadlines) - time.time()))
+        try:
+            list_of_events = live_index.inotify.read_events(timeout)
+        except InterruptedError:
+            list_of_events = []
+        now = time.time()
+        for wd, mask, cookie, name in list_of_events:
+            if mask & IN_Q_OVERFLOW:
+                print('WARNING: inotify queue overflowed, rescanning', live_index.path_to_search)
+                dict_of_pending_dirs[live_index.path_to_search] = now
+                continue
+            with live_index.lock:
+                dir_path = live_index.dict_of_watches.get(wd)
+                if mask & IN_IGNORED:
+                    live_index.dict_of_watches.pop(wd, None)
+            if dir_path is None or mask & IN_IGNORED or name == '':
+                continue
+            path = os.path.join(dir_path, name)
+            if live_index.is_excluded(path):
+                continue
+            if mask & IN_ISDIR:
+                if mask & IN_MOVED_FROM:
+                    live_index.unwatch_tree(path)
+                if mask & (IN_CREATE | IN_MOVED_TO | IN_MOVED_FROM | IN_DELETE):
+                    dict_of_pending_dirs[path] = now
+            else:
+                dict_of_pending_paths[path] = now
+
+        list_of_quiet_dirs = [dir_path for dir_path, last_event in dict_of_pending_dirs.items()
+                              if now - last_event >= debounce]
+        for dir_path in list_of_quiet_dirs:
+            del dict_of_pending_dirs[dir_path]
+            live_index.work_queue.put(('rescan', dir_path))
+        list_of_quiet_paths = [path for path, last_event in dict_of_pending_paths.items()
+                               if now - last_event >= debounce]
+        for path in list_of_quiet_paths:
+            del dict_of_pending_paths[path]
+        if len(list_of_quiet_paths) > 0:
+            live_index.work_queue.put(('paths', list_of_quiet_paths))
+
+        if next_snapshot is not None and now >= next_snapshot:
+            dict_of_flags['snapshot'] = True
+            next_snapshot = now + snapshot_every
+        if dict_of_flags['snapshot']:
+            dict_of_flags['snapshot'] = False
+            write_snapshot(prnt_debug, live_index, write_path, output_prefix)
+
+    # pending events are flushed without waiting for the debounce
+    for dir_path in dict_of_pending_dirs:
+        live_index.work_queue.put(('rescan', dir_path))
+    if len(dict_of_pending_paths) > 0:
+        live_index.work_queue.put(('paths', list(dict_of_pending_paths.keys())))
+    write_snapshot(prnt_debug, live_index, write_path, output_prefix)
+    live_index.inotify.close()
+
+
+if __name__ == '__main__':
+
+    prnt_debug, path_to_search, write_path, output_prefix, scan_options = args_use(sys.argv)
+    previous_snapshot = {}
+    if scan_options['incremental']:
+        previous_snapshot = ct.load_previous_snapshot(prnt_debug, write_path, output_prefix, scan_options)
+    live_index = LiveIndex(prnt_debug, path_to_search, scan_options)
+    live_index.start(previous_snapshot)
+    watch(prnt_debug, live_index, write_path, output_prefix)